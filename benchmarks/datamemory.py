@@ -0,0 +1,133 @@
+#! /usr/bin/env python
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+"""Measures, with tracemalloc, the memory retained by a loaded DataFile in
+its ordinary and compact forms:
+
+  python3 benchmarks/datamemory.py [--hosts N] [--top N] [--file PATH]
+
+The default fixture is a synthetic inventory resembling a site's defaults:
+hosts, with hostnames, enumerated roles and states, port and latency lists
+and per-role settings repeated across hosts.  A file may be specified
+instead; its top-level key must be 'data'.
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0,
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mill import data
+
+# The enumerated values of the fixture.
+ROLES = ("web", "db", "cache", "queue")
+STATES = ("active", "standby", "maintenance")
+
+#############################################################################
+def writeFixture(path, hosts):
+  """Writes an inventory of the specified number of hosts to the path.
+  """
+  # Latencies are measurements; they vary, repeatably, by host.
+  generator = random.Random(0)
+  lines = ["data:", "  sites:"]
+  sites = max(1, hosts // 250)
+  for site in range(sites):
+    lines.extend(["    site{0}:".format(site),
+                  "      datacenter: dc{0}.example.com".format(site),
+                  "      hosts:"])
+    for host in range(site, hosts, sites):
+      role = ROLES[host % len(ROLES)]
+      lines.extend([
+        "        host-{0:05d}.dc{1}.example.com:".format(host, site),
+        "          role: {0}".format(role),
+        "          state: {0}".format(STATES[host % len(STATES)]),
+        "          os: rhel-9.3",
+        "          datacenter: dc{0}.example.com".format(site),
+        "          ports: [22, 9100, {0}]".format(8000 + ROLES.index(role)),
+        "          latency: [{0}]".format(", ".join(
+                      ["{0:.2f}".format(generator.uniform(0.1, 5.0))
+                        for x in range(8)])),
+        "          tags: [production, {0}, monitored]".format(role),
+        "          settings:",
+        "            log-level: info",
+        "            max-connections: {0}".format(
+                        100 * (1 + ROLES.index(role))),
+        "            timeouts: [5, 30, 300]",
+        "            owner: team-{0}@example.com".format(role)])
+  with open(path, "w") as f:
+    f.write("\n".join(lines + [""]))
+
+#############################################################################
+def measure(path, compact):
+  """Returns a tuple of the bytes retained by, and the peak bytes
+  allocated loading, the data file and the snapshot of the allocations.
+  """
+  gc.collect()
+  tracemalloc.start()
+  try:
+    tracemalloc.reset_peak()
+    (before, _) = tracemalloc.get_traced_memory()
+    dataFile = data.DataFile(path, compact = compact)
+    gc.collect()
+    (after, peak) = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+  finally:
+    tracemalloc.stop()
+  del dataFile
+  return (after - before, peak - before, snapshot)
+
+#############################################################################
+def main(argv):
+  parser = argparse.ArgumentParser(
+            description = "measure the memory retained by a loaded DataFile")
+  parser.add_argument("--hosts", type = int, default = 2000,
+                      help = "number of hosts of the fixture (default: 2000)")
+  parser.add_argument("--file", metavar = "PATH",
+                      help = "data file to measure instead of the fixture")
+  parser.add_argument("--top", type = int, default = 0,
+                      help = "number of source lines, of the greatest"
+                             " retained allocations of each form, to report"
+                             " (default: 0)")
+  args = parser.parse_args(argv)
+
+  with tempfile.TemporaryDirectory() as directory:
+    path = args.file
+    if path is None:
+      path = os.path.join(directory, "inventory.yml")
+      writeFixture(path, args.hosts)
+    print("{0}: {1:.1f} KiB".format(path, os.path.getsize(path) / 1024))
+
+    # Load a different file beforehand so that the cost of importing yaml,
+    # and of its one-time initialization, is not attributed to either form;
+    # the same file would intern its strings beforehand.
+    warmPath = os.path.join(directory, "warm.yml")
+    writeFixture(warmPath, 0)
+    data.DataFile(warmPath, compact = True)
+
+    results = {}
+    print("{0:<10} {1:>14} {2:>14}".format("form", "retained KiB",
+                                           "peak KiB"))
+    for (name, compact) in (("ordinary", False), ("compact", True)):
+      (retained, peak, snapshot) = measure(path, compact)
+      results[name] = retained
+      print("{0:<10} {1:>14.1f} {2:>14.1f}".format(name, retained / 1024,
+                                                   peak / 1024))
+      for statistic in snapshot.statistics("lineno")[:args.top]:
+        print("  {0}".format(statistic))
+
+  saving = 100.0 * (1 - (results["compact"] / results["ordinary"]))
+  print("compact form saves {0:.1f}% of the retained memory".format(saving))
+  return 0
+
+#############################################################################
+#############################################################################
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
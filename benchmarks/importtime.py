@@ -0,0 +1,115 @@
+#! /usr/bin/env python
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+"""Measures the time to import mill packages and fails if it exceeds a
+budget.
+
+Each measurement executes a fresh interpreter so that nothing is already
+imported; the cost of interpreter startup, measured by executing 'pass',
+is subtracted.  The median of the repetitions is compared to the budget:
+
+  python3 benchmarks/importtime.py [--budget MS] [--repeat N] [statement ...]
+
+The default statement is 'import mill.command'.  The exit status is 1 if
+any statement exceeds the budget.  The modules contributing most to the
+import, per python's -X importtime, are reported for each statement.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# The directory containing the mill package.
+topDirectory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#############################################################################
+def environment():
+  """Returns the environment for the measured interpreters; one importing
+  mill from this tree.
+  """
+  env = dict(os.environ)
+  env["PYTHONPATH"] = os.pathsep.join([topDirectory]
+                                      + ([env["PYTHONPATH"]]
+                                          if "PYTHONPATH" in env else []))
+  env.pop("PYTHON_MILL_PROFILE", None)
+  env.pop("PYTHON_MILL_METRICS", None)
+  return env
+
+#############################################################################
+def measure(statement, repeat):
+  """Returns the median, in milliseconds, of the wall time of executing the
+  statement in a fresh interpreter.
+  """
+  env = environment()
+  samples = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", statement], env = env,
+                   check = True)
+    samples.append((time.perf_counter() - start) * 1000)
+  return statistics.median(samples)
+
+#############################################################################
+def topModules(statement, count):
+  """Returns a list of the (cumulative microseconds, module) tuples of the
+  'count' modules with the greatest cumulative import time.
+  """
+  process = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                            statement],
+                           env = environment(), check = True,
+                           stderr = subprocess.PIPE,
+                           universal_newlines = True)
+  modules = []
+  for line in process.stderr.splitlines():
+    # import time: self [us] | cumulative | imported package
+    fields = line.split("|")
+    if (len(fields) != 3) or (not fields[1].strip().isdigit()):
+      continue
+    modules.append((int(fields[1]), fields[2].strip()))
+  return sorted(modules, reverse = True)[:count]
+
+#############################################################################
+def main(argv):
+  parser = argparse.ArgumentParser(
+            description = "measure the import time of mill packages")
+  parser.add_argument("--budget", type = float, default = 50.0,
+                      help = "maximum import time, in milliseconds, "
+                             "beyond interpreter startup (default: 50)")
+  parser.add_argument("--repeat", type = int, default = 10,
+                      help = "number of measurements per statement "
+                             "(default: 10)")
+  parser.add_argument("--top", type = int, default = 10,
+                      help = "number of slowest modules to report "
+                             "(default: 10)")
+  parser.add_argument("statements", nargs = "*", metavar = "statement",
+                      default = ["import mill.command"],
+                      help = "python statement(s) to measure")
+  args = parser.parse_args(argv)
+
+  baseline = measure("pass", args.repeat)
+  print("interpreter startup: {0:.1f} ms".format(baseline))
+
+  status = 0
+  for statement in args.statements:
+    elapsed = measure(statement, args.repeat) - baseline
+    verdict = "ok"
+    if elapsed > args.budget:
+      verdict = "OVER BUDGET"
+      status = 1
+    print("{0}: {1:.1f} ms (budget {2:.1f} ms) {3}".format(statement,
+                                                          elapsed,
+                                                          args.budget,
+                                                          verdict))
+    for (cumulative, module) in topModules(statement, args.top):
+      print("  {0:>10.1f} ms  {1}".format(cumulative / 1000, module))
+  return status
+
+#############################################################################
+#############################################################################
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
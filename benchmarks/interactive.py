@@ -0,0 +1,114 @@
+#! /usr/bin/env python
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+"""Measures the throughput, in command lines per second, of an
+InteractiveLoop executing lines via makeCommandItemAndRun():
+
+  python3 benchmarks/interactive.py [--commands N] [--lines N] [--repeat N]
+
+The loop's hierarchy has the specified number of commands, each with an
+option, so that the cost of parsing grows with the hierarchy as it does
+in practice.  The best of the repetitions is reported.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0,
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mill import command
+
+#############################################################################
+#############################################################################
+class _Packaged(object):
+  """Mixin for classes defined outside of a package, as are those of this
+  script; they use the configuration of mill.command.
+  """
+  ####################################################################
+  @classmethod
+  def _filePackage(cls):
+    return "mill.command"
+
+#############################################################################
+class BenchmarkCommand(_Packaged, command.InteractiveCommand):
+  ####################################################################
+  @classmethod
+  def parserParents(cls):
+    parser = argparse.ArgumentParser(add_help = False)
+    parser.add_argument("--value", type = int, default = 0)
+    parents = super(BenchmarkCommand, cls).parserParents()
+    parents.append(parser)
+    return parents
+
+  ####################################################################
+  def run(self, arg = None):
+    return self.args.value
+
+#############################################################################
+class BenchmarkLoop(_Packaged, command.InteractiveLoop):
+  ####################################################################
+  @classmethod
+  def _commandRootClass(cls):
+    return BenchmarkCommand
+
+# The classes defined by defineCommands().
+_commandClasses = []
+
+#############################################################################
+def defineCommands(count):
+  """Defines the specified number of available commands, named 'command0'
+  onward, returning their names.
+  """
+  names = ["command{0}".format(index) for index in range(count)]
+  for name in names:
+    # Retained as __subclasses__() does not keep the classes alive.
+    _commandClasses.append(type(name.capitalize(), (BenchmarkCommand,),
+                                {"_available" : True, "_name" : name}))
+  return names
+
+#############################################################################
+def measure(loop, commandLines):
+  """Returns the number of the command lines executed per second.
+  """
+  start = time.perf_counter()
+  for commandLine in commandLines:
+    loop.makeCommandItemAndRun(commandLine)
+  return len(commandLines) / (time.perf_counter() - start)
+
+#############################################################################
+def main(argv):
+  parser = argparse.ArgumentParser(
+            description = "measure InteractiveLoop command line throughput")
+  parser.add_argument("--commands", type = int, default = 50,
+                      help = "number of commands in the loop's hierarchy "
+                             "(default: 50)")
+  parser.add_argument("--lines", type = int, default = 5000,
+                      help = "number of command lines per measurement "
+                             "(default: 5000)")
+  parser.add_argument("--repeat", type = int, default = 5,
+                      help = "number of measurements (default: 5)")
+  args = parser.parse_args(argv)
+
+  names = defineCommands(args.commands)
+  commandLines = ["{0} --value {1}".format(names[index % len(names)], index)
+                    for index in range(args.lines)]
+  loop = BenchmarkLoop(BenchmarkLoop._argumentParser().parse_args([]))
+
+  # The first line includes the one-time discovery of the commands.
+  start = time.perf_counter()
+  loop.makeCommandItemAndRun(commandLines[0])
+  print("first line: {0:.1f} ms".format((time.perf_counter() - start) * 1000))
+
+  best = max([measure(loop, commandLines) for _ in range(args.repeat)])
+  print("{0} commands: {1:.0f} lines/second".format(args.commands, best))
+  return 0
+
+#############################################################################
+#############################################################################
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
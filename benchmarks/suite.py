@@ -0,0 +1,387 @@
+#! /usr/bin/env python
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+"""Benchmarks of the mill hot paths using synthetic fixtures; nothing
+beyond this tree (and its yaml dependency) is required:
+
+  python3 benchmarks/suite.py run [--output FILE] [--quick] [--repeat N]
+                                  [--filter TEXT ...]
+  python3 benchmarks/suite.py compare BASELINE CURRENT [--threshold PERCENT]
+
+'run' measures each benchmark at each of its sizes, reporting the best of
+the repetitions in seconds per operation, and optionally stores the results
+as JSON.  'compare' reports the change of each benchmark between two stored
+results and exits with status 1 if any is slower by more than the
+threshold.
+
+The benchmarks:
+
+  data.load            DataFile load of a file of N entries
+  data.content         DataFile.content() of a path N keys deep
+  defaults.scalar      DefaultsFileInfo.defaults() of a value of the root
+                       of an MRO of N defaults, each with user defaults
+  defaults.section     as defaults.scalar, of a dictionary the user defaults
+                       override (i.e., the overridden copy)
+  factory.definition   definition of an item of a Factory of N items;
+                       constant for definition to scale linearly
+  factory.discovery    Factory mapping discovery of N items
+  factory.makeItem     Factory.makeItem() among N items
+  factory.parser       FactoryArgumentParser construction for N items
+  interactive.line     InteractiveLoop execution of a command line among N
+                       commands
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+import types
+
+sys.path.insert(0,
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mill import command, data, defaults, factory
+
+#############################################################################
+#############################################################################
+class _Packaged(object):
+  """Mixin for classes defined outside of a package, as are those of this
+  script; they use the configuration of mill.command.
+  """
+  ####################################################################
+  @classmethod
+  def _filePackage(cls):
+    return "mill.command"
+
+#############################################################################
+class _SyntheticDefaults(defaults.DefaultsFileInfo):
+  """Defaults of a synthetic package; the defaults file of each class is
+  named by its _syntheticName in the fixture directory and the user
+  defaults, as usual, are in $HOME.
+  """
+  _syntheticDirectory = None
+  _syntheticName = None
+
+  ####################################################################
+  @classmethod
+  def _fileName(cls):
+    return cls.__dict__.get("_syntheticName")
+
+  ####################################################################
+  @classmethod
+  def _filePath(cls):
+    name = cls._fileName()
+    return (None if name is None
+                 else os.path.join(cls._syntheticDirectory, name))
+
+#############################################################################
+#############################################################################
+class Benchmarks(object):
+  """The benchmarks; each bench_<name>(directory, size) method returns the
+  operation, a callable of no arguments, to measure for the size with its
+  fixtures created in the directory.  The sizes of each are listed in
+  'sizes' by name; the smallest two being those of a quick run.
+  """
+  sizes = {
+    "data.load"          : (10, 1000, 10000),
+    "data.content"       : (1, 4, 16),
+    "defaults.scalar"    : (1, 8, 32),
+    "defaults.section"   : (1, 8, 32),
+    "factory.definition" : (10, 100, 1000, 10000),
+    "factory.discovery"  : (10, 100, 1000, 10000),
+    "factory.makeItem"   : (10, 100, 1000, 10000),
+    "factory.parser"     : (10, 100, 1000, 10000),
+    "interactive.line"   : (10, 100, 1000)
+  }
+
+  ####################################################################
+  def bench_data_content(self, directory, size):
+    keys = ["key{0}".format(depth) for depth in range(size)]
+    lines = ["data:"]
+    for (depth, key) in enumerate(keys):
+      lines.append("{0}{1}:".format("  " * (depth + 1), key))
+    lines[-1] = "{0} value".format(lines[-1])
+    dataFile = data.DataFile(self.__write(directory, "content", lines))
+    return lambda: dataFile.content(keys)
+
+  ####################################################################
+  def bench_data_load(self, directory, size):
+    lines = ["data:"]
+    for group in range((size + 9) // 10):
+      lines.append("  group{0}:".format(group))
+      for key in range(min(10, size - (group * 10))):
+        lines.append("    key{0}: value-{1}-{0}".format(key, group))
+    path = self.__write(directory, "load", lines)
+    return lambda: data.DataFile(path)
+
+  ####################################################################
+  def bench_defaults_scalar(self, directory, size):
+    leaf = self.__defaultsHierarchy(directory, "scalar", size)
+    return lambda: leaf.defaults(["section", "value"])
+
+  ####################################################################
+  def bench_defaults_section(self, directory, size):
+    leaf = self.__defaultsHierarchy(directory, "section", size)
+    return lambda: leaf.defaults(["section"])
+
+  ####################################################################
+  def bench_factory_definition(self, directory, size):
+    # A hierarchy of its own as the classes defined remain until collected.
+    root = self.__factoryHierarchy(size, "Definition")
+    return lambda: type("Defined{0}".format(size), (root,), {})
+
+  ####################################################################
+  def bench_factory_discovery(self, directory, size):
+    root = self.__factoryHierarchy(size)
+    def discover():
+      root._setMapping(None, None)
+      root._mapping()
+    return discover
+
+  ####################################################################
+  def bench_factory_makeItem(self, directory, size):
+    root = self.__factoryHierarchy(size)
+    name = "item{0}".format(size // 2)
+    return lambda: root.makeItem(name)
+
+  ####################################################################
+  def bench_factory_parser(self, directory, size):
+    root = self.__factoryHierarchy(size)
+    items = set(root._items())
+    return lambda: root._argumentParserClass()(items, prog = "benchmark")
+
+  ####################################################################
+  def bench_interactive_line(self, directory, size):
+    root = type("LineCommand{0}".format(size),
+                (_Packaged, command.InteractiveCommand), {})
+    for index in range(size):
+      self.__classes.append(
+        type("LineCommand{0}_{1}".format(size, index), (root,),
+             {"_available" : True,
+              "_name" : "command{0}".format(index),
+              "run" : lambda self, arg = None: None}))
+    loop = type("LineLoop{0}".format(size),
+                (_Packaged, command.InteractiveLoop),
+                {"_commandRootClass" : classmethod(lambda cls: root)})(None)
+    lines = itertools.cycle(["command{0}".format(index)
+                              for index in range(0, size, max(1, size // 10))])
+    return lambda: loop.makeCommandItemAndRun(next(lines))
+
+  ####################################################################
+  def benchmarks(self, quick = False, filters = ()):
+    """Returns a list of the (name, size, method) of the benchmarks to run.
+    """
+    benchmarks = []
+    for name in sorted(self.sizes):
+      if (len(filters) > 0) and (not any([x in name for x in filters])):
+        continue
+      sizes = self.sizes[name][:2] if quick else self.sizes[name]
+      method = getattr(self, "bench_{0}".format(name.replace(".", "_")))
+      benchmarks.extend([(name, size, method) for size in sizes])
+    return benchmarks
+
+  ####################################################################
+  # Private methods
+  ####################################################################
+  def __defaultsHierarchy(self, directory, label, size):
+    # Returns the leaf of a chain of 'size' classes, each of a synthetic
+    # package of its own, with system and user defaults.  Only the root's
+    # defaults have the looked up section, overridden by its user defaults,
+    # so that the lookup traverses the entire MRO.
+    home = os.path.join(directory, "home")
+    os.makedirs(home, exist_ok = True)
+    klass = type("Defaults_{0}_{1}".format(label, size),
+                 (_SyntheticDefaults,),
+                 {"_syntheticDirectory" : directory})
+    for level in range(size):
+      fileName = "{0}-{1}-{2}.yml".format(label, size, level)
+      system = ["defaults:", "  level{0}: {0}".format(level)]
+      user = ["defaults:", "  level{0}: -{0}".format(level)]
+      if level == 0:
+        system.extend(["  section:", "    value: 1", "    other: 2"])
+        user.extend(["  section:", "    value: 3"])
+      self.__write(directory, fileName, system)
+      self.__write(home, ".{0}".format(fileName), user)
+
+      moduleName = "mill_benchmark_{0}_{1}_{2}".format(label, size, level)
+      module = types.ModuleType(moduleName)
+      module.__package__ = moduleName
+      sys.modules[moduleName] = module
+
+      # The defaults, including the user's, are read as the class is defined.
+      savedHome = os.environ.get("HOME")
+      os.environ["HOME"] = home
+      try:
+        klass = type("Level{0}".format(level), (klass,),
+                     {"__module__" : moduleName, "_syntheticName" : fileName})
+      finally:
+        if savedHome is None:
+          del os.environ["HOME"]
+        else:
+          os.environ["HOME"] = savedHome
+    return klass
+
+  ####################################################################
+  def __factoryHierarchy(self, size, label = "Factory"):
+    # Returns the root of a factory of 'size' items, shared by the factory
+    # benchmarks of the size and label.
+    root = self.__factories.get((label, size))
+    if root is None:
+      root = type("{0}{1}".format(label, size), (_Packaged, factory.Factory),
+                  {})
+      for index in range(size):
+        self.__classes.append(
+          type("{0}{1}_{2}".format(label, size, index), (root,),
+               {"_available" : True, "_name" : "item{0}".format(index)}))
+      self.__factories[(label, size)] = root
+    return root
+
+  ####################################################################
+  def __write(self, directory, name, lines):
+    path = os.path.join(directory, name)
+    with open(path, "w") as f:
+      f.write("\n".join(lines + [""]))
+    return path
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self):
+    super(Benchmarks, self).__init__()
+    self.__factories = {}
+    # The classes defined; __subclasses__() does not keep them alive.
+    self.__classes = []
+
+#############################################################################
+def measure(operation, repeat):
+  """Returns a dictionary of the best and median seconds per call of the
+  operation over the repetitions, each of as many calls as take at least
+  0.2 seconds, and the number of calls per repetition.
+  """
+  timer = timeit.Timer(operation)
+  (number, elapsed) = timer.autorange()
+  samples = [x / number for x in timer.repeat(repeat, number)]
+  return {
+    "best" : min(samples),
+    "median" : statistics.median(samples),
+    "number" : number,
+    "repeat" : repeat
+  }
+
+#############################################################################
+def formatSeconds(seconds):
+  for (unit, scale) in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+    if seconds >= scale:
+      return "{0:.3f} {1}".format(seconds / scale, unit)
+  return "{0:.1f} ns".format(seconds / 1e-9)
+
+#############################################################################
+def run(args):
+  results = {}
+  suite = Benchmarks()
+  with tempfile.TemporaryDirectory() as directory:
+    for (name, size, method) in suite.benchmarks(args.quick, args.filter):
+      key = "{0}[{1}]".format(name, size)
+      fixtures = os.path.join(directory, key)
+      os.makedirs(fixtures)
+      start = time.perf_counter()
+      operation = method(fixtures, size)
+      result = measure(operation, args.repeat)
+      result["setup"] = time.perf_counter() - start
+      results[key] = result
+      print("{0:<32} {1:>12}  (median {2}, {3} x {4})"
+              .format(key, formatSeconds(result["best"]),
+                      formatSeconds(result["median"]), result["repeat"],
+                      result["number"]))
+      sys.stdout.flush()
+
+  if args.output is not None:
+    document = {
+      "metadata" : {
+        "python" : platform.python_version(),
+        "implementation" : platform.python_implementation(),
+        "platform" : platform.platform(),
+        "time" : time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "quick" : args.quick
+      },
+      "results" : results
+    }
+    with open(args.output, "w") as f:
+      json.dump(document, f, indent = 2, sort_keys = True)
+      f.write("\n")
+  return 0
+
+#############################################################################
+def compare(args):
+  with open(args.baseline) as f:
+    baseline = json.load(f)["results"]
+  with open(args.current) as f:
+    current = json.load(f)["results"]
+
+  status = 0
+  print("{0:<32} {1:>12} {2:>12} {3:>9}".format("benchmark", "baseline",
+                                                "current", "change"))
+  for key in sorted(set(baseline) | set(current)):
+    if key not in current:
+      print("{0:<32} {1:>12} {2:>12}".format(
+              key, formatSeconds(baseline[key]["best"]), "-"))
+      continue
+    if key not in baseline:
+      print("{0:<32} {1:>12} {2:>12}".format(
+              key, "-", formatSeconds(current[key]["best"])))
+      continue
+    change = 100.0 * ((current[key]["best"] / baseline[key]["best"]) - 1)
+    verdict = ""
+    if change > args.threshold:
+      verdict = "REGRESSION"
+      status = 1
+    elif change < -args.threshold:
+      verdict = "improved"
+    print("{0:<32} {1:>12} {2:>12} {3:>+8.1f}% {4}".format(
+            key, formatSeconds(baseline[key]["best"]),
+            formatSeconds(current[key]["best"]), change, verdict).rstrip())
+  return status
+
+#############################################################################
+def main(argv):
+  parser = argparse.ArgumentParser(
+            description = "benchmark the mill hot paths")
+  subparsers = parser.add_subparsers(dest = "mode", required = True)
+
+  runParser = subparsers.add_parser("run", help = "run the benchmarks")
+  runParser.add_argument("--output", metavar = "FILE",
+                         help = "store the results as JSON in FILE")
+  runParser.add_argument("--quick", action = "store_true",
+                         help = "only the two smallest sizes of each"
+                                " benchmark")
+  runParser.add_argument("--repeat", type = int, default = 5,
+                         help = "number of measurements (default: 5)")
+  runParser.add_argument("--filter", nargs = "+", default = [],
+                         metavar = "TEXT",
+                         help = "only the benchmarks whose names contain"
+                                " any TEXT")
+
+  compareParser = subparsers.add_parser("compare",
+                                        help = "compare stored results")
+  compareParser.add_argument("baseline", help = "baseline results")
+  compareParser.add_argument("current", help = "current results")
+  compareParser.add_argument("--threshold", type = float, default = 10.0,
+                             metavar = "PERCENT",
+                             help = "slowdown reported as a regression"
+                                    " (default: 10)")
+
+  args = parser.parse_args(argv)
+  return run(args) if args.mode == "run" else compare(args)
+
+#############################################################################
+#############################################################################
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
@@ -3,4 +3,16 @@
 #
 # Copyright Red Hat
 #
-from . import command, data, defaults, factory
+from . import _lazy, instrument
+
+# The subpackages are imported upon first access, e.g., mill.command.
+(_getattr, __dir__) = _lazy.lazyAttributes(globals(), {
+  "command"   : None,
+  "data"      : None,
+  "defaults"  : None,
+  "factory"   : None
+})
+
+def __getattr__(name):
+  with instrument.PhaseTimer.phase("import"):
+    return _getattr(name)
@@ -0,0 +1,79 @@
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+"""Support for packages providing their public attributes lazily; i.e.,
+importing the submodule defining an attribute only upon first access.
+"""
+import importlib
+import sys
+import types
+
+######################################################################
+def lazyAttributes(namespace, attributes):
+  """Returns a tuple of the __getattr__ and __dir__ functions for the
+  module whose globals are 'namespace' providing the 'attributes', a
+  dictionary mapping attribute names to the relative names (e.g.,
+  '.Command') of the submodules defining them.  A submodule name of None
+  denotes that the attribute is the submodule itself.
+  """
+  packageName = namespace["__name__"]
+
+  # Importing a submodule binds it to its name in the package, e.g., by
+  # 'import mill.data.DataFile' and regardless of whether __getattr__ ever
+  # runs; the package's module class binds the attribute instead.
+  package = sys.modules[packageName]
+  package.__class__ = type("_LazyModule", (_LazyModule,),
+                           {"_lazyAttributes" : attributes})
+
+  def __getattr__(name):
+    if name not in attributes:
+      raise AttributeError("module '{0}' has no attribute '{1}'"
+                            .format(packageName, name))
+    module = attributes[name]
+    if module is None:
+      return importlib.import_module(".{0}".format(name), packageName)
+
+    importlib.import_module(module, packageName)
+    _bindAttributes(namespace, attributes)
+    return namespace[name]
+
+  def __dir__():
+    return sorted(set(namespace) | set(attributes))
+
+  return (__getattr__, __dir__)
+
+######################################################################
+class _LazyModule(types.ModuleType):
+  """Class of lazy packages; a submodule bound to the name of an attribute
+  it defines (e.g., class Command of submodule Command) is replaced by the
+  attribute.  The submodule remains available via sys.modules.
+  """
+  _lazyAttributes = {}
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __setattr__(self, name, value):
+    module = self._lazyAttributes.get(name)
+    if ((module is not None) and isinstance(value, types.ModuleType)
+        and (value.__name__ == "{0}{1}".format(self.__name__, module))
+        and hasattr(value, name)):
+      value = getattr(value, name)
+    super(_LazyModule, self).__setattr__(name, value)
+
+######################################################################
+def _bindAttributes(namespace, attributes):
+  # Binds each attribute whose submodule has been imported, including those
+  # imported other than via __getattr__.
+  packageName = namespace["__name__"]
+  for (name, module) in attributes.items():
+    if module is None:
+      continue
+    value = namespace.get(name)
+    if (value is not None) and (not isinstance(value, types.ModuleType)):
+      continue
+    loaded = sys.modules.get("{0}{1}".format(packageName, module))
+    if (loaded is not None) and hasattr(loaded, name):
+      namespace[name] = getattr(loaded, name)
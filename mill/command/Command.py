@@ -6,35 +6,239 @@
 from __future__ import print_function
 
 import argparse
+import collections.abc
+import logging
+import os
 import sys
+import threading
 
-from mill import factory
+from mill import defaults, factory, instrument
 from .CommandArgumentParser import (CommandArgumentParser,
                                     CommandNullArgumentParser)
+from .CommandCache import CommandCache
+from .CommandCancellation import (CommandCancellation,
+                                  CommandTimeoutException)
+from .CommandMetrics import CommandMetrics
+from .CommandProfiler import CommandProfiler
+
+log = logging.getLogger(__name__)
 
 ########################################################################
 class Command(factory.Factory):
+  ####################################################################
+  # Instance-behavior attributes.
+  ####################################################################
+  # If _cacheable is overridden as True the results of executing the command
+  # are cached, keyed on the command's name, its arguments and the
+  # fingerprint of its defaults (see CommandCache and _resultCache()).  Only
+  # commands whose result is a pure function of those should be cacheable.
+  _cacheable = False
+
+  # The standard options a command accepts beyond --verbose, of 'ndjson',
+  # 'phase-times', 'profile', 'timeout' and 'trace-malloc'.  They are opted
+  # into so as not to conflict with a command's own options of those names.
+  _commandOptions = frozenset()
+
+  # The CommandCache of each cacheable class, by class.
+  __caches = {}
+  __cachesLock = threading.Lock()
+
   ####################################################################
   # Public factory-behavior methods
   ####################################################################
+  @classmethod
+  def cacheable(cls):
+    return cls._cacheable
+
+  ####################################################################
+  @classmethod
+  def commandOptions(cls):
+    return cls._commandOptions
 
   ####################################################################
   # Public instance-behavior methods
+  ####################################################################
+  @property
+  def cancellation(self):
+    """The CommandCancellation of the current execution; run() may check it
+    to cooperate with timeouts.
+    """
+    return self.__cancellation
+
+  ####################################################################
+  @property
+  def input(self):
+    """Iterator of the records produced by the preceding command when
+    executed in a CommandPipeline, otherwise None.
+    """
+    return self.__input
+
+  ####################################################################
+  @input.setter
+  def input(self, value):
+    self.__input = value
+
   ####################################################################
   @property
   def isVerbose(self):
     # Is verbose enabled?
     return self.verbosity > 0
 
+  ####################################################################
+  @property
+  def partialResult(self):
+    """The result so far of the current execution.  A long running run()
+    may set it as it progresses so that it is available should the execution
+    time out.
+    """
+    return self.__partialResult
+
+  ####################################################################
+  @partialResult.setter
+  def partialResult(self, value):
+    self.__partialResult = value
+
+  ####################################################################
+  @property
+  def recordWriter(self):
+    """The CommandRecordWriter to which emit() writes records; None, the
+    default, for them to be printed.
+    """
+    return self.__recordWriter
+
+  ####################################################################
+  @recordWriter.setter
+  def recordWriter(self, value):
+    self.__recordWriter = value
+
+  ####################################################################
+  @property
+  def resultConsumer(self):
+    """Callable to which the result of run() is passed within the
+    execution, and thus within its measurement and timeout; e.g., to consume
+    an iterator result as it is produced.  Its return value is the result of
+    the execution.  None, the default, for the result to be returned as is.
+    """
+    return self.__resultConsumer
+
+  ####################################################################
+  @resultConsumer.setter
+  def resultConsumer(self, value):
+    self.__resultConsumer = value
+
+  ####################################################################
+  @property
+  def timeout(self):
+    """The number of seconds within which an execution must complete; None
+    for no limit.  Specified by --timeout, if opted into, or, absent that,
+    the defaults.
+    """
+    timeout = getattr(self.args, "commandTimeout", None)
+    if timeout is None:
+      timeout = self._defaultTimeout()
+    return timeout if (timeout is not None) and (timeout > 0) else None
+
   ####################################################################
   @property
   def verbosity(self):
     # Is verbose enabled?
     return self.args.commandVerbosity
 
+  ####################################################################
+  def emit(self, record):
+    """Outputs a record of the command's results; written as JSON by the
+    recordWriter, if any, otherwise printed.  Records may be emitted as
+    they are produced rather than being accumulated in run()'s result.
+    """
+    if self.__recordWriter is None:
+      print(record)
+    else:
+      self.__recordWriter.write(record)
+
+  ####################################################################
+  def execute(self, *args, **kwargs):
+    """Runs the command to completion returning the result of run() or,
+    if there is a resultConsumer, that of passing it the result.
+
+    If run() is a coroutine function (or otherwise returns an awaitable) the
+    awaitable is driven to completion on a new event loop.  Within a running
+    event loop use executeAsync().
+
+    If a timeout applies a coroutine run() is cancelled when it expires; any
+    other run() is executed in a worker thread and its cancellation token is
+    cancelled, giving it _cancellationGrace() seconds to return.  In either
+    case CommandTimeoutException is raised carrying the partial result.
+
+    If the command is cacheable a cached result is returned, unless
+    --no-cache or --refresh-cache was specified, and the result of execution
+    is cached, unless --no-cache was specified.  Iterator results, and those
+    of cancelled executions, are not cached.  The resultConsumer, if any, is
+    passed the result whether cached or not.
+
+    If --profile or --trace-malloc was specified run() is profiled by a
+    CommandProfiler.
+
+    The execution is measured by CommandMetrics if it is enabled.
+    """
+    self.__startExecution()
+    with CommandMetrics.measure(self) as self.__measurement:
+      (key, found, result) = self.__cachedResult(args, kwargs)
+      if found:
+        return self.__consumeResult(result)
+
+      timeout = self.timeout
+      if timeout is None:
+        return self.__run(key, args, kwargs)
+      if self.__runIsCoroutineFunction():
+        with self.__measurement.running(), CommandProfiler.forCommand(self):
+          result = self.__runAwaitable(self.run(*args, **kwargs), timeout)
+          return self.__consumeResult(self.__cacheResult(key, result))
+      return self.__runInThread(key, args, kwargs, timeout)
+
+  ####################################################################
+  async def executeAsync(self, *args, **kwargs):
+    """Awaitable form of execute() for use within a running event loop.
+    A run() which is not a coroutine function is executed in a worker thread
+    so as not to block the event loop; that of the loop's default executor
+    or, if a timeout applies, one of its own as by execute().
+    """
+    self.__startExecution()
+    with CommandMetrics.measure(self) as self.__measurement:
+      (key, found, result) = self.__cachedResult(args, kwargs)
+      if found:
+        return self.__consumeResult(result)
+
+      timeout = self.timeout
+      if self.__runIsCoroutineFunction():
+        with self.__measurement.running(), CommandProfiler.forCommand(self):
+          result = await self.__awaitResult(self.run(*args, **kwargs),
+                                            timeout)
+          return self.__consumeResult(self.__cacheResult(key, result))
+
+      import asyncio
+      if timeout is None:
+        import contextvars
+        import functools
+        return await asyncio.get_running_loop().run_in_executor(
+                None, functools.partial(contextvars.copy_context().run,
+                                        self.__run, key, args, kwargs))
+
+      future = asyncio.wrap_future(self.__startThread(key, args, kwargs))
+      (done, pending) = await asyncio.wait([future], timeout = timeout)
+      if len(done) == 0:
+        self.cancellation.cancel()
+        grace = self._cancellationGrace()
+        (done, pending) = await asyncio.wait([future], timeout = grace)
+        partialResult = self.partialResult
+        if (len(done) > 0) and (future.exception() is None):
+          partialResult = future.result()
+        raise CommandTimeoutException(self.name(), timeout, partialResult)
+      return future.result()
+
   ####################################################################
   def run(self):
     # Execute the command.
+    # Subclasses may define run() as a coroutine function (async def).
     raise NotImplementedError("COMMAND NOT IMPLEMENTED")
 
   ####################################################################
@@ -62,17 +266,157 @@ class Command(factory.Factory):
                         action = "count",
                         default = 0)
 
+    options = cls.commandOptions()
+
+    if "ndjson" in options:
+      parser.add_argument("--ndjson",
+                          help = "output results as newline-delimited JSON",
+                          dest = "commandNdjson",
+                          action = "store_true")
+
+    if "profile" in options:
+      parser.add_argument("--profile",
+                          help = "write a cProfile (pstats) profile of the"
+                                 " command to FILE",
+                          dest = "commandProfile",
+                          metavar = "FILE",
+                          default = None)
+
+    if "trace-malloc" in options:
+      parser.add_argument("--trace-malloc",
+                          help = "write a tracemalloc report of the command's"
+                                 " allocations to FILE",
+                          dest = "commandTraceMalloc",
+                          metavar = "FILE",
+                          default = None)
+
+    if "phase-times" in options:
+      parser.add_argument("--phase-times",
+                          help = "write the times of the phases following the"
+                                 " parsing of the command line, e.g., loading"
+                                 " data, to stderr at exit as FORMAT",
+                          dest = "commandPhaseTimes",
+                          choices = ["json", "table"],
+                          metavar = "FORMAT",
+                          default = None)
+
+    if "timeout" in options:
+      parser.add_argument("--timeout",
+                          help = "seconds within which the command must"
+                                 " complete",
+                          dest = "commandTimeout",
+                          type = float,
+                          metavar = "SECONDS",
+                          default = None)
+
+    if cls.cacheable():
+      parser.add_argument("--no-cache",
+                          help = "neither use nor cache the result",
+                          dest = "commandNoCache",
+                          action = "store_true")
+
+      parser.add_argument("--refresh-cache",
+                          help = "execute and cache the result",
+                          dest = "commandRefreshCache",
+                          action = "store_true")
+
     parents = super(Command, cls).parserParents()
     parents.append(parser)
     return parents
 
+  ####################################################################
+  def __init__(self, args):
+    super(Command, self).__init__(args)
+    phaseTimes = getattr(args, "commandPhaseTimes", None)
+    if phaseTimes is not None:
+      instrument.PhaseTimer.enable(phaseTimes)
+    self.__cancellation = CommandCancellation()
+    self.__input = None
+    self.__measurement = None
+    self.__partialResult = None
+    self.__recordWriter = None
+    self.__resultConsumer = None
+
   ####################################################################
   # Protected factory-behavior methods
+  ####################################################################
+  @classmethod
+  def _cacheDirectory(cls):
+    """Returns the directory in which results are cached on disk; None for
+    them to be cached only in memory.
+    """
+    directory = os.getenv("XDG_CACHE_HOME",
+                          os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(directory, "python-mill", "results",
+                        "{0}.{1}".format(cls.__module__, cls.__qualname__))
+
+  ####################################################################
+  @classmethod
+  def _cacheIgnoredArguments(cls):
+    """Returns the destinations of the arguments which do not affect the
+    result and are thus not part of a result's cache key.
+    """
+    return set(["commandNdjson", "commandNoCache", "commandPhaseTimes",
+                "commandProfile", "commandRefreshCache", "commandTimeout",
+                "commandTraceMalloc", "commandVerbosity", "factoryDebug"])
+
+  ####################################################################
+  @classmethod
+  def _cacheTtl(cls):
+    """Returns the number of seconds for which a result is cached.
+    """
+    return 300
+
+  ####################################################################
+  @classmethod
+  def _cancellationGrace(cls):
+    """Returns the number of seconds a timed out run() is given to return
+    once cancelled.
+    """
+    return 1.0
+
+  ####################################################################
+  @classmethod
+  def _defaultTimeout(cls):
+    """Returns the timeout applied absent --timeout; the defaults' 'command'
+    'timeout' entry if present, otherwise None.
+    """
+    try:
+      return cls.defaults(["command", "timeout"])
+    except defaults.DefaultsException:
+      return None
+
   ####################################################################
   @classmethod
   def _nullArgumentParserClass(cls):
     return CommandNullArgumentParser
 
+  ####################################################################
+  @classmethod
+  def _resultCache(cls):
+    """Returns the class's CommandCache.
+    """
+    cache = Command.__caches.get(cls)
+    if cache is None:
+      with Command.__cachesLock:
+        cache = Command.__caches.get(cls)
+        if cache is None:
+          cache = CommandCache(cls._cacheDirectory(), cls._cacheTtl())
+          Command.__caches[cls] = cache
+    return cache
+
+  ####################################################################
+  @classmethod
+  def _translateAsyncException(cls, exception):
+    """Returns the StopIteration from which a RuntimeError was produced
+    by it being raised within a coroutine (PEP 479); StopIteration being how
+    interactive loops signal quit.  Any other exception is returned as is.
+    """
+    if (isinstance(exception, RuntimeError)
+        and isinstance(exception.__cause__, StopIteration)):
+      exception = exception.__cause__
+    return exception
+
   ####################################################################
   # Protected instance-behavior methods
   ####################################################################
@@ -84,3 +428,140 @@ class Command(factory.Factory):
   ####################################################################
   # Private instance-behavior methods
   ####################################################################
+  async def __awaitResult(self, awaitable, timeout = None):
+    if timeout is None:
+      return await awaitable
+
+    import asyncio
+    task = asyncio.ensure_future(awaitable)
+    (done, pending) = await asyncio.wait([task], timeout = timeout)
+    if len(done) == 0:
+      self.cancellation.cancel()
+      task.cancel()
+      # The coroutine may handle the cancellation and return its result; it
+      # is given _cancellationGrace() seconds to do so.
+      (done, pending) = await asyncio.wait([task],
+                                           timeout = self._cancellationGrace())
+      partialResult = self.partialResult
+      if ((len(done) > 0) and (not task.cancelled())
+          and (task.exception() is None)):
+        partialResult = task.result()
+      raise CommandTimeoutException(self.name(), timeout, partialResult)
+    return task.result()
+
+  ####################################################################
+  def __cacheResult(self, key, result):
+    # Caches the result, if caching and it is complete, returning it.
+    if ((key is not None) and (not self.cancellation.cancelled)
+        and (not isinstance(result, collections.abc.Iterator))):
+      self._resultCache().put(key, result)
+    return result
+
+  ####################################################################
+  def __cachedResult(self, args, kwargs):
+    # Returns a tuple of the cache key, None if not caching, whether the
+    # result was cached and the cached result.
+    if ((not self.cacheable())
+        or getattr(self.args, "commandNoCache", False)):
+      return (None, False, None)
+
+    ignored = self._cacheIgnoredArguments()
+    arguments = {}
+    if self.args is not None:
+      arguments = dict([(name, value)
+                          for (name, value) in vars(self.args).items()
+                            if name not in ignored])
+    try:
+      key = CommandCache.key(type(self).__module__, type(self).__qualname__,
+                             arguments, args, kwargs,
+                             self.defaultsFingerprint())
+    except (TypeError, ValueError) as ex:
+      # An argument not affecting the result belongs among those ignored.
+      log.warning("not caching result of {0}: {1}".format(self.name(), ex))
+      return (None, False, None)
+
+    if getattr(self.args, "commandRefreshCache", False):
+      return (key, False, None)
+    with instrument.Tracer.span("command.cache",
+                                {"command.name" : self.name()}) as span:
+      (found, result) = self._resultCache().get(key)
+      span.setAttribute("command.cache-hit", found)
+    return (key, found, result)
+
+  ####################################################################
+  def __consumeResult(self, result):
+    # Returns the result of passing the result to the resultConsumer, if
+    # any.
+    if self.__resultConsumer is None:
+      return result
+    return self.__resultConsumer(result)
+
+  ####################################################################
+  def __run(self, key, args, kwargs):
+    with self.__measurement.running(), CommandProfiler.forCommand(self):
+      result = self.__runAwaitable(self.run(*args, **kwargs))
+      return self.__consumeResult(self.__cacheResult(key, result))
+
+  ####################################################################
+  def __runAwaitable(self, result, timeout = None):
+    # Drives the result to completion if it is awaitable.  asyncio is only
+    # imported when it is; most commands' run() is synchronous.
+    if isinstance(result, collections.abc.Awaitable):
+      import asyncio
+      try:
+        result = asyncio.run(self.__awaitResult(result, timeout))
+      except RuntimeError as ex:
+        ex = self._translateAsyncException(ex)
+        if isinstance(ex, StopIteration):
+          raise ex
+        raise
+    return result
+
+  ####################################################################
+  def __runInThread(self, key, args, kwargs, timeout):
+    import concurrent.futures
+    future = self.__startThread(key, args, kwargs)
+    (done, pending) = concurrent.futures.wait([future], timeout)
+    if len(done) == 0:
+      self.cancellation.cancel()
+      (done, pending) = concurrent.futures.wait([future],
+                                                self._cancellationGrace())
+      partialResult = self.partialResult
+      if (len(done) > 0) and (future.exception() is None):
+        partialResult = future.result()
+      raise CommandTimeoutException(self.name(), timeout, partialResult)
+    return future.result()
+
+  ####################################################################
+  def __runIsCoroutineFunction(self):
+    import inspect
+    return inspect.iscoroutinefunction(self.run)
+
+  ####################################################################
+  def __startExecution(self):
+    self.__cancellation = CommandCancellation()
+    self.__partialResult = None
+
+  ####################################################################
+  def __startThread(self, key, args, kwargs):
+    # Starts executing run() in a worker thread, in a copy of the current
+    # context, returning the concurrent.futures.Future of its result.  The
+    # worker is a daemon thread so that a run() which ignores cancellation
+    # prevents neither the process from exiting nor, when awaited, the event
+    # loop from being shut down.
+    import concurrent.futures
+    import contextvars
+    future = concurrent.futures.Future()
+
+    def _target():
+      if future.set_running_or_notify_cancel():
+        try:
+          future.set_result(self.__run(key, args, kwargs))
+        except BaseException as ex:
+          future.set_exception(ex)
+
+    threading.Thread(target = contextvars.copy_context().run,
+                     args = (_target,),
+                     name = "command-{0}".format(self.name()),
+                     daemon = True).start()
+    return future
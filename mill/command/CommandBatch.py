@@ -0,0 +1,257 @@
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+from __future__ import print_function
+
+import collections
+import logging
+import shlex
+import sys
+
+from .CommandCancellation import CommandCancelledException
+
+log = logging.getLogger(__name__)
+
+########################################################################
+class CommandBatchResult(object):
+  """The outcome of executing one line of a command batch.
+
+  The status is 0 on success, the exit code if execution or argument
+  parsing raised SystemExit and 1 if execution raised any other exception.
+  If execution was cancelled, e.g., timed out, the result is the partial
+  result.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @property
+  def exception(self):
+    return self.__exception
+
+  ####################################################################
+  @property
+  def line(self):
+    return self.__line
+
+  ####################################################################
+  @property
+  def lineNumber(self):
+    return self.__lineNumber
+
+  ####################################################################
+  @property
+  def result(self):
+    return self.__result
+
+  ####################################################################
+  @property
+  def status(self):
+    return self.__status
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, lineNumber, line, result = None, exception = None,
+               status = None):
+    super(CommandBatchResult, self).__init__()
+    if isinstance(exception, CommandCancelledException):
+      result = exception.partialResult
+    self.__lineNumber = lineNumber
+    self.__line = line
+    self.__result = result
+    self.__exception = exception
+    if status is None:
+      status = 0 if exception is None else 1
+      if isinstance(exception, SystemExit):
+        status = CommandBatch.exitStatus(exception)
+    self.__status = status
+
+########################################################################
+class CommandBatch(object):
+  """Executes a sequence of command lines against a command hierarchy.
+
+  Each line is parsed by the hierarchy's argument parser, built once for the
+  batch, in the calling thread.  The commands are then instantiated and
+  executed inline or, if 'workers' is greater than one, on a pool of that
+  many threads or, if 'processes' is True, processes.  When using processes
+  the command arguments and results must be picklable; the workers inherit
+  the already established factory mapping and defaults where the platform
+  forks.
+
+  Results are produced in line order if 'ordered' is True, otherwise in
+  the order of completion.  Blank lines and lines beginning with '#' are
+  skipped.  Lines for which _isSequential() is True are executed inline once
+  the preceding lines have completed.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @classmethod
+  def exitStatus(cls, systemExit):
+    """Returns the integer exit status corresponding to a SystemExit.
+    """
+    code = systemExit.code
+    if code is None:
+      return 0
+    return code if isinstance(code, int) else 1
+
+  ####################################################################
+  @classmethod
+  def lines(cls, source):
+    """Returns an iterable of the lines of the source which is either an
+    iterable of lines, a file path or '-' for stdin.
+    """
+    if source == "-":
+      return sys.stdin
+    if isinstance(source, str):
+      return cls.__fileLines(source)
+    return source
+
+  ####################################################################
+  def run(self, lines):
+    """Generator executing the lines and yielding a CommandBatchResult for
+    each.
+    """
+    if self.__workers <= 1:
+      for (lineNumber, line) in self._commandLines(lines):
+        yield self._execute(lineNumber, line)
+      return
+
+    # concurrent.futures is imported only when executing concurrently.
+    import concurrent.futures
+    executorClass = (concurrent.futures.ProcessPoolExecutor
+                      if self.__processes
+                      else concurrent.futures.ThreadPoolExecutor)
+    with executorClass(max_workers = self.__workers) as executor:
+      # Bound the number of outstanding lines so that arbitrarily large
+      # batches are streamed rather than materialized.
+      pending = collections.deque()
+      window = self.__workers * 2
+      for (lineNumber, line) in self._commandLines(lines):
+        if self._isSequential(line):
+          while len(pending) > 0:
+            yield self._next(pending)
+          yield self._execute(lineNumber, line)
+          continue
+        pending.append(self._submit(executor, lineNumber, line))
+        while len(pending) >= window:
+          yield self._next(pending)
+      while len(pending) > 0:
+        yield self._next(pending)
+
+  ####################################################################
+  def runAndReport(self, lines, stream = None):
+    """Executes the lines, reporting each failure to the stream (stderr if
+    None), and returns the aggregate exit status; that is, the greatest of
+    the exit statuses of the lines.
+    """
+    stream = sys.stderr if stream is None else stream
+    status = 0
+    for result in self.run(lines):
+      if ((result.exception is not None)
+          and (not isinstance(result.exception, SystemExit))):
+        print("line {0}: {1}".format(result.lineNumber, result.exception),
+              file = stream)
+      status = max(status, result.status)
+    return status
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, factoryClass, workers = 1, processes = False,
+               ordered = True):
+    super(CommandBatch, self).__init__()
+    self.__factoryClass = factoryClass
+    self.__workers = 1 if workers is None else workers
+    self.__processes = processes
+    self.__ordered = ordered
+
+    # Establish the shared state once for the batch.
+    self.__haveChoices = len(factoryClass.choices()) > 0
+    self.__parser = factoryClass._argumentParser()
+
+  ####################################################################
+  # Protected methods
+  ####################################################################
+  def _commandLines(self, lines):
+    for (index, line) in enumerate(lines):
+      line = line.strip()
+      if (len(line) > 0) and (not line.startswith("#")):
+        yield (index + 1, line)
+
+  ####################################################################
+  def _execute(self, lineNumber, line):
+    try:
+      (itemName, args) = self._parse(line)
+      result = _executeCommand(self.__factoryClass, itemName, args)
+    except (Exception, SystemExit) as ex:
+      log.debug("exception executing line {0}: {1}".format(lineNumber, ex))
+      return CommandBatchResult(lineNumber, line, exception = ex)
+    return CommandBatchResult(lineNumber, line, result)
+
+  ####################################################################
+  def _isSequential(self, line):
+    """Returns whether the line must be executed inline, once the preceding
+    lines have completed and before those following it start; none are.
+    """
+    return False
+
+  ####################################################################
+  def _next(self, pending):
+    if self.__ordered:
+      (lineNumber, line, future) = pending.popleft()
+    else:
+      import concurrent.futures
+      concurrent.futures.wait([x[2] for x in pending],
+                              return_when = concurrent.futures.FIRST_COMPLETED)
+      entry = [x for x in pending if x[2].done()][0]
+      pending.remove(entry)
+      (lineNumber, line, future) = entry
+
+    try:
+      return CommandBatchResult(lineNumber, line, future.result())
+    except (Exception, SystemExit) as ex:
+      log.debug("exception executing line {0}: {1}".format(lineNumber, ex))
+      return CommandBatchResult(lineNumber, line, exception = ex)
+
+  ####################################################################
+  def _parse(self, line):
+    """Returns a tuple of the item name and the parsed arguments for the
+    line.  Raises SystemExit on a parsing error.
+    """
+    args = self.__parser.parse_args(shlex.split(line))
+    itemName = None
+    if self.__haveChoices:
+      itemName = vars(args)[self.__parser.parserDestination()]
+    return (itemName, args)
+
+  ####################################################################
+  def _submit(self, executor, lineNumber, line):
+    try:
+      (itemName, args) = self._parse(line)
+    except (Exception, SystemExit) as ex:
+      # Parsing failed; represent the line by a completed future.
+      import concurrent.futures
+      future = concurrent.futures.Future()
+      future.set_exception(ex)
+    else:
+      future = executor.submit(_executeCommand, self.__factoryClass,
+                               itemName, args)
+    return (lineNumber, line, future)
+
+  ####################################################################
+  # Private methods
+  ####################################################################
+  @classmethod
+  def __fileLines(cls, path):
+    with open(path) as f:
+      for line in f:
+        yield line
+
+########################################################################
+########################################################################
+def _executeCommand(factoryClass, itemName, args):
+  # Module-level so that it may be used with a process pool.
+  return factoryClass.makeItem(itemName, args).execute()
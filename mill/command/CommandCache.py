@@ -0,0 +1,263 @@
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+import collections
+import logging
+import os
+import stat
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+########################################################################
+class CommandCache(object):
+  """Cache of command results.
+
+  Results are held in memory, least recently used being evicted beyond
+  'maximumEntries', and, if 'directory' is specified, on disk as one pickle
+  per result, least recently written being evicted beyond 'maximumBytes' in
+  total.  Each result expires 'ttl' seconds after being stored.  Results
+  which cannot be pickled are held only in memory.  Results held in memory
+  are shared with those retrieving them and must not be modified.
+
+  The on-disk results are loaded with pickle; the directory must be owned
+  by, and only writable by, the user.  It is created accordingly, with mode
+  0700, and verified before first use; if it fails verification results are
+  held only in memory.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @property
+  def directory(self):
+    return self.__directory
+
+  ####################################################################
+  def clear(self):
+    """Discards all cached results.
+    """
+    with self.__lock:
+      self.__memory.clear()
+    for path in self.__diskFiles():
+      self.__unlink(path)
+    with self.__lock:
+      self.__diskBytes = None
+
+  ####################################################################
+  def get(self, key):
+    """Returns a tuple of whether a current result for the key is cached and
+    the result.
+    """
+    now = time.time()
+    with self.__lock:
+      entry = self.__memory.get(key)
+      if entry is not None:
+        (expires, result) = entry
+        if expires > now:
+          self.__memory.move_to_end(key)
+          return (True, result)
+        del self.__memory[key]
+
+    if self.__usableDirectory() is None:
+      return (False, None)
+
+    import pickle
+    path = self.__path(key)
+    try:
+      with open(path, "rb") as f:
+        (expires, result) = pickle.load(f)
+    except FileNotFoundError:
+      return (False, None)
+    except Exception as ex:
+      log.debug("discarding unreadable cached result {0}: {1}".format(path,
+                                                                     ex))
+      self.__unlink(path)
+      return (False, None)
+    if expires <= now:
+      self.__unlink(path)
+      return (False, None)
+
+    with self.__lock:
+      self.__remember(key, expires, result)
+    return (True, result)
+
+  ####################################################################
+  @classmethod
+  def key(cls, *components):
+    """Returns a cache key for the JSON-representable components, sets
+    being represented by their sorted members.  Raises TypeError if any
+    component is not so representable; a key must be the same in every
+    process.
+    """
+    import hashlib
+    import json
+    return hashlib.sha256(json.dumps(components, sort_keys = True,
+                                     default = cls.__canonical)
+                            .encode("utf-8")).hexdigest()
+
+  ####################################################################
+  def put(self, key, result):
+    expires = time.time() + self.__ttl
+    with self.__lock:
+      self.__remember(key, expires, result)
+
+    if self.__usableDirectory() is not None:
+      import pickle
+      try:
+        data = pickle.dumps((expires, result))
+      except Exception as ex:
+        log.debug("not caching unpicklable result on disk: {0}".format(ex))
+        return
+      self._write(self.__path(key), data)
+
+      # The directory is only scanned when the bytes written since it last
+      # was may have exceeded the limit.
+      with self.__lock:
+        evict = ((self.__diskBytes is None)
+                 or (self.__diskBytes + len(data) > self.__maximumBytes))
+        if not evict:
+          self.__diskBytes += len(data)
+      if evict:
+        self._evict()
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, directory = None, ttl = 300, maximumEntries = 128,
+               maximumBytes = 64 * 1024 * 1024):
+    super(CommandCache, self).__init__()
+    self.__directory = directory
+    self.__ttl = ttl
+    self.__maximumEntries = maximumEntries
+    self.__maximumBytes = maximumBytes
+    self.__memory = collections.OrderedDict()
+    self.__lock = threading.Lock()
+    self.__diskBytes = None
+    self.__directoryVerified = None
+
+  ####################################################################
+  # Protected methods
+  ####################################################################
+  def _evict(self):
+    """Removes expired on-disk results and then the least recently written
+    until the total size is within three quarters of maximumBytes; the
+    slack amortizing the cost of scanning the directory over the writes
+    which follow.
+    """
+    now = time.time()
+    files = []
+    for path in self.__diskFiles():
+      try:
+        stat = os.stat(path)
+      except OSError:
+        continue
+      if stat.st_mtime + self.__ttl <= now:
+        self.__unlink(path)
+      else:
+        files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum([size for (mtime, size, path) in files])
+    if total > self.__maximumBytes:
+      for (mtime, size, path) in sorted(files):
+        if total <= (self.__maximumBytes * 3) // 4:
+          break
+        self.__unlink(path)
+        total -= size
+    with self.__lock:
+      self.__diskBytes = total
+
+  ####################################################################
+  def _write(self, path, data):
+    # Write atomically so that a concurrent reader never sees a partial
+    # result.
+    import tempfile
+    # The directory, verified upon first use, may since have been removed.
+    os.makedirs(self.__directory, mode = 0o700, exist_ok = True)
+    (fd, temporary) = tempfile.mkstemp(dir = self.__directory,
+                                       suffix = ".tmp")
+    try:
+      with os.fdopen(fd, "wb") as f:
+        f.write(data)
+      os.replace(temporary, path)
+    except Exception:
+      os.unlink(temporary)
+      raise
+
+  ####################################################################
+  # Private methods
+  ####################################################################
+  @classmethod
+  def __canonical(cls, value):
+    # Returns the JSON-representable form of a value JSON does not
+    # represent.  The iteration order of a set depends on the hash seed so
+    # its members are ordered by their own representation.
+    import json
+    if isinstance(value, (set, frozenset)):
+      return sorted(value,
+                    key = lambda x: json.dumps(x, sort_keys = True,
+                                               default = cls.__canonical))
+    raise TypeError("{0} is not representable in a cache key".format(
+                      type(value).__name__))
+
+  ####################################################################
+  def __diskFiles(self):
+    if self.__usableDirectory() is None:
+      return []
+    return [os.path.join(self.__directory, x)
+              for x in os.listdir(self.__directory) if x.endswith(".pickle")]
+
+  ####################################################################
+  def __path(self, key):
+    return os.path.join(self.__directory, "{0}.pickle".format(key))
+
+  ####################################################################
+  def __remember(self, key, expires, result):
+    # Must be called with the lock held.
+    self.__memory[key] = (expires, result)
+    self.__memory.move_to_end(key)
+    while len(self.__memory) > self.__maximumEntries:
+      self.__memory.popitem(last = False)
+
+  ####################################################################
+  def __usableDirectory(self):
+    # Returns the directory, creating and verifying it upon first use, or
+    # None if there is none or it failed verification.
+    if self.__directory is None:
+      return None
+    with self.__lock:
+      if self.__directoryVerified is None:
+        self.__directoryVerified = self.__verifyDirectory()
+      return self.__directory if self.__directoryVerified else None
+
+  ####################################################################
+  def __unlink(self, path):
+    try:
+      os.unlink(path)
+    except FileNotFoundError:
+      pass
+
+  ####################################################################
+  def __verifyDirectory(self):
+    # Returns whether the directory, created if necessary, is one in which
+    # results may be stored and loaded.
+    try:
+      os.makedirs(self.__directory, mode = 0o700, exist_ok = True)
+      status = os.lstat(self.__directory)
+      if not stat.S_ISDIR(status.st_mode):
+        raise OSError("not a directory")
+      if hasattr(os, "geteuid") and (status.st_uid != os.geteuid()):
+        raise OSError("not owned by the user")
+      if (status.st_mode & 0o022) != 0:
+        raise OSError("writable by other users")
+      # The mode of a directory created by makedirs() is subject to the
+      # umask; results are private to the user.
+      if stat.S_IMODE(status.st_mode) != 0o700:
+        os.chmod(self.__directory, 0o700)
+    except OSError as ex:
+      log.warning("not caching results in {0}: {1}".format(self.__directory,
+                                                           ex))
+      return False
+    return True
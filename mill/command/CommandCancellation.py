@@ -0,0 +1,96 @@
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+import threading
+
+######################################################################
+######################################################################
+class CommandCancelledException(Exception):
+  """Raised when a command's execution is cancelled.
+
+  'partialResult' is whatever result the command had reported, via its
+  partialResult property, when it was cancelled.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @property
+  def partialResult(self):
+    return self.__partialResult
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, msg = "command cancelled", partialResult = None,
+               *args, **kwargs):
+    super(CommandCancelledException, self).__init__(*args, **kwargs)
+    self._msg = str(msg)
+    self.__partialResult = partialResult
+
+  ######################################################################
+  def __str__(self):
+    return self._msg
+
+######################################################################
+######################################################################
+class CommandTimeoutException(CommandCancelledException):
+  """Raised when a command's execution exceeds its timeout.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @property
+  def timeout(self):
+    return self.__timeout
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, name, timeout, partialResult = None, *args, **kwargs):
+    super(CommandTimeoutException, self).__init__(
+      "command '{0}' timed out after {1} seconds".format(name, timeout),
+      partialResult, *args, **kwargs)
+    self.__timeout = timeout
+
+######################################################################
+######################################################################
+class CommandCancellation(object):
+  """Cancellation token of a command execution.
+
+  Cancellation is cooperative: a long running run() should periodically
+  check the token, either testing 'cancelled' or calling check(), and
+  return, or raise, promptly once it has been cancelled.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @property
+  def cancelled(self):
+    return self.__event.is_set()
+
+  ####################################################################
+  def cancel(self):
+    self.__event.set()
+
+  ####################################################################
+  def check(self):
+    """Raises CommandCancelledException if cancelled.
+    """
+    if self.cancelled:
+      raise CommandCancelledException()
+
+  ####################################################################
+  def wait(self, timeout = None):
+    """Waits, up to timeout seconds, for cancellation returning True if
+    cancelled.  Useful in place of time.sleep() within run().
+    """
+    return self.__event.wait(timeout)
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self):
+    super(CommandCancellation, self).__init__()
+    self.__event = threading.Event()
@@ -0,0 +1,173 @@
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+import logging
+import threading
+
+from mill import factory
+from .CommandPipeline import CommandPipeline
+
+log = logging.getLogger(__name__)
+
+######################################################################
+######################################################################
+class _CompletionTrie(object):
+  """Prefix trie of words.
+
+  Each node is a dictionary mapping characters to child nodes; a node
+  ending a word maps the key None to the word.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  def complete(self, prefix):
+    """Returns the sorted list of the words beginning with the prefix.
+    """
+    node = self.__root
+    for character in prefix:
+      node = node.get(character)
+      if node is None:
+        return []
+
+    words = []
+    nodes = [node]
+    while len(nodes) > 0:
+      node = nodes.pop()
+      for (key, value) in node.items():
+        if key is None:
+          words.append(value)
+        else:
+          nodes.append(value)
+    return sorted(words)
+
+  ####################################################################
+  def insert(self, word):
+    node = self.__root
+    for character in word:
+      node = node.setdefault(character, {})
+    node[None] = word
+
+  ####################################################################
+  def remove(self, word):
+    # Remove the word and then any nodes left without words.
+    path = [self.__root]
+    for character in word:
+      node = path[-1].get(character)
+      if node is None:
+        return
+      path.append(node)
+    path[-1].pop(None, None)
+    for (index, character) in reversed(list(enumerate(word))):
+      if len(path[index + 1]) > 0:
+        break
+      del path[index][character]
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, words = ()):
+    super(_CompletionTrie, self).__init__()
+    self.__root = {}
+    for word in words:
+      self.insert(word)
+
+######################################################################
+######################################################################
+class CommandCompletion(object):
+  """Completion of the command lines of a command hierarchy; the command
+  names, followed by the options of the named command.
+
+  The names, and any 'builtins' (e.g., the commands of an interactive
+  interface), are held in a prefix trie built once.  The trie is updated
+  incrementally, adding and removing names, when the hierarchy changes.
+  The trie of each command's options is built upon first completing them.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  def complete(self, line, text, begidx):
+    """Returns the sorted completions of 'text', the word of 'line'
+    beginning at 'begidx'.
+
+    As readline's delimiters include '-' the text of an option may lack its
+    leading dashes; they are taken from the line and omitted from the
+    completions.
+    """
+    # Only the command of the pipeline being entered is relevant.
+    segment = line[:begidx].rsplit(CommandPipeline.separator, 1)[-1]
+    words = segment.split()
+    dashes = ""
+    if (len(words) > 0) and (not segment[-1:].isspace()):
+      dashes = words.pop()
+    if len(words) == 0:
+      return self.completeNames(text)
+    if not (dashes + text).startswith("-"):
+      return []
+    return [x[len(dashes):]
+              for x in self.completeOptions(words[0], dashes + text)]
+
+  ####################################################################
+  def completeNames(self, text):
+    """Returns the sorted command names and builtins beginning with text.
+    """
+    with self.__lock:
+      self.__update()
+      return self.__names.complete(text)
+
+  ####################################################################
+  def completeOptions(self, name, text):
+    """Returns the sorted options of the named command beginning with text.
+    """
+    with self.__lock:
+      self.__update()
+      options = self.__options.get(name)
+      if options is None:
+        parser = self.__itemParsers.get(name)
+        if parser is None:
+          return []
+        options = _CompletionTrie(
+          factory.FactoryCompletionIndex.parserOptions(parser))
+        self.__options[name] = options
+      return options.complete(text)
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, factoryClass, builtins = ()):
+    super(CommandCompletion, self).__init__()
+    self.__factoryClass = factoryClass
+    self.__builtins = set(builtins)
+    self.__names = _CompletionTrie(self.__builtins)
+    self.__commandNames = set()
+    self.__itemParsers = {}
+    self.__options = {}
+    self.__parser = None
+    self.__lock = threading.Lock()
+
+  ####################################################################
+  # Private methods
+  ####################################################################
+  def __update(self):
+    # Must be called with the lock held.  The factory's argument parser is
+    # only replaced when its hierarchy changes.
+    parser = self.__factoryClass._argumentParser()
+    if parser is self.__parser:
+      return
+
+    itemParsers = (parser.itemParsers() if hasattr(parser, "itemParsers")
+                                        else {})
+    names = set(itemParsers)
+    for name in (self.__commandNames - names) - self.__builtins:
+      self.__names.remove(name)
+    for name in names - self.__commandNames:
+      self.__names.insert(name)
+    log.debug("completion names: {0} added, {1} removed"
+                .format(len(names - self.__commandNames),
+                        len(self.__commandNames - names)))
+
+    self.__commandNames = names
+    self.__itemParsers = itemParsers
+    self.__options = {}
+    self.__parser = parser
@@ -0,0 +1,285 @@
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+import contextvars
+import logging
+import sys
+import threading
+
+from .CommandCancellation import CommandCancelledException
+
+log = logging.getLogger(__name__)
+
+######################################################################
+######################################################################
+class _JobOutput(object):
+  """Proxy for sys.stdout which routes the output of job threads to their
+  jobs; the output of any other thread is written to the proxied stream.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @property
+  def stream(self):
+    return self.__stream
+
+  ####################################################################
+  def flush(self):
+    self.__stream.flush()
+
+  ####################################################################
+  def register(self, job):
+    """Routes the output of the calling thread to the job.
+    """
+    self.__jobs[threading.get_ident()] = job
+
+  ####################################################################
+  def unregister(self):
+    self.__jobs.pop(threading.get_ident(), None)
+
+  ####################################################################
+  def write(self, text):
+    job = self.__jobs.get(threading.get_ident())
+    if job is None:
+      return self.__stream.write(text)
+    job._write(text)
+    return len(text)
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, stream):
+    super(_JobOutput, self).__init__()
+    self.__stream = stream
+    self.__jobs = {}
+
+  ####################################################################
+  def __getattr__(self, name):
+    return getattr(self.__stream, name)
+
+######################################################################
+######################################################################
+class CommandJob(object):
+  """A command line executing in the background; see CommandJobs.
+
+  The output the job's thread writes to sys.stdout is buffered until taken
+  by takeOutput().  Output written by any other threads the job's commands
+  start (e.g., the producing stages of a pipeline) is not buffered.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @property
+  def commandLine(self):
+    return self.__commandLine
+
+  ####################################################################
+  @property
+  def exception(self):
+    return self.__exception
+
+  ####################################################################
+  @property
+  def identifier(self):
+    return self.__identifier
+
+  ####################################################################
+  @property
+  def result(self):
+    return self.__result
+
+  ####################################################################
+  @property
+  def state(self):
+    """One of 'running', 'killing' (killed but still running), 'done',
+    'failed' or 'killed'.
+    """
+    if not self.__finished.is_set():
+      return "killing" if self.__killed else "running"
+    if self.__exception is None:
+      return "done"
+    return "killed" if self.__killed else "failed"
+
+  ####################################################################
+  def finished(self):
+    return self.__finished.is_set()
+
+  ####################################################################
+  def kill(self):
+    """Requests cancellation of the job's commands; cancellation is
+    cooperative (see CommandCancellation) and the job finishes when its
+    commands honor it.
+    """
+    self.__killed = True
+    for command in self.__commands:
+      command.cancellation.cancel()
+
+  ####################################################################
+  def takeOutput(self):
+    """Returns, and discards, the output buffered since the last call.
+    """
+    with self.__lock:
+      (output, self.__output) = ("".join(self.__output), [])
+    return output
+
+  ####################################################################
+  def wait(self, timeout = None):
+    """Waits, up to timeout seconds, for the job to finish returning True
+    if it has.
+    """
+    return self.__finished.wait(timeout)
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, identifier, commandLine, commands, function):
+    super(CommandJob, self).__init__()
+    self.__identifier = identifier
+    self.__commandLine = commandLine
+    self.__commands = list(commands)
+    self.__function = function
+    self.__result = None
+    self.__exception = None
+    self.__killed = False
+    self.__finished = threading.Event()
+    self.__output = []
+    self.__lock = threading.Lock()
+
+  ####################################################################
+  def __str__(self):
+    description = "[{0}] {1:<8} {2}".format(self.__identifier,
+                                            self.state.capitalize(),
+                                            self.__commandLine)
+    if self.__exception is not None:
+      description = "{0}: {1}".format(description, self.__exception)
+    return description
+
+  ####################################################################
+  # Protected methods
+  ####################################################################
+  def _run(self, output):
+    # Executes the job in the calling thread, its output routed to the job.
+    output.register(self)
+    try:
+      if self.__killed:
+        raise CommandCancelledException()
+      self.__result = self.__function()
+    except BaseException as ex:
+      log.debug("job {0} failed: {1}".format(self.__identifier, ex))
+      self.__exception = ex
+    finally:
+      output.unregister()
+      self.__finished.set()
+
+  ####################################################################
+  def _write(self, text):
+    with self.__lock:
+      self.__output.append(text)
+
+######################################################################
+######################################################################
+class CommandJobs(object):
+  """The background jobs of an interactive session.
+
+  Each job executes in a thread of its own.  While jobs are running
+  sys.stdout is replaced by a proxy which buffers each job's output; see
+  CommandJob.  Jobs are numbered from 1, numbers being reused once no jobs
+  remain.
+  """
+  # The number of running jobs, of all sessions, and its lock; sys.stdout is
+  # replaced while any are running.
+  __running = 0
+  __runningLock = threading.Lock()
+
+  ####################################################################
+  # Public methods
+  ####################################################################
+  def finished(self):
+    """Returns, and removes, the finished jobs.
+    """
+    with self.__lock:
+      jobs = [x for x in self.__jobs.values() if x.finished()]
+      for job in jobs:
+        del self.__jobs[job.identifier]
+    return jobs
+
+  ####################################################################
+  def get(self, identifier = None):
+    """Returns the job with the identifier, or the most recently started if
+    None.  Raises ValueError if there is no such job.
+    """
+    with self.__lock:
+      if identifier is None:
+        if len(self.__jobs) == 0:
+          raise ValueError("no current job")
+        return self.__jobs[max(self.__jobs)]
+      try:
+        return self.__jobs[int(identifier)]
+      except (KeyError, ValueError):
+        raise ValueError("no such job: {0}".format(identifier))
+
+  ####################################################################
+  def jobs(self):
+    """Returns the list of the jobs in the order they were started.
+    """
+    with self.__lock:
+      return [self.__jobs[x] for x in sorted(self.__jobs)]
+
+  ####################################################################
+  def remove(self, job):
+    with self.__lock:
+      self.__jobs.pop(job.identifier, None)
+
+  ####################################################################
+  def start(self, commandLine, commands, function):
+    """Starts, and returns, a job executing 'function' for the command line
+    whose (already instantiated) commands are those specified; the job's
+    result is that of the function.
+    """
+    with self.__lock:
+      identifier = max(self.__jobs, default = 0) + 1
+      job = CommandJob(identifier, commandLine, commands, function)
+      self.__jobs[identifier] = job
+
+    with CommandJobs.__runningLock:
+      CommandJobs.__running += 1
+      if not isinstance(sys.stdout, _JobOutput):
+        sys.stdout = _JobOutput(sys.stdout)
+      output = sys.stdout
+
+    # The job executes in the context of its start so that, e.g., an
+    # InteractiveServer session's streams remain those of its client.
+    threading.Thread(target = contextvars.copy_context().run,
+                     args = (self.__run, job, output),
+                     name = "job-{0}".format(identifier),
+                     daemon = True).start()
+    return job
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self):
+    super(CommandJobs, self).__init__()
+    self.__jobs = {}
+    self.__lock = threading.Lock()
+
+  ####################################################################
+  def __len__(self):
+    with self.__lock:
+      return len(self.__jobs)
+
+  ####################################################################
+  # Private methods
+  ####################################################################
+  def __run(self, job, output):
+    try:
+      job._run(output)
+    finally:
+      with CommandJobs.__runningLock:
+        CommandJobs.__running -= 1
+        # Restore stdout once no jobs are running unless it has since been
+        # replaced.
+        if (CommandJobs.__running == 0) and (sys.stdout is output):
+          sys.stdout = output.stream
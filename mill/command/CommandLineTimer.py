@@ -0,0 +1,181 @@
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+import contextvars
+import os
+import time
+
+# The _LineTiming of the command line being timed in the current context;
+# None if none is.
+_currentLine = contextvars.ContextVar("commandLineTiming", default = None)
+
+######################################################################
+######################################################################
+class _NullPhase(object):
+  """Phase used when no command line is being timed; does nothing.
+  """
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __enter__(self):
+    return self
+
+  ####################################################################
+  def __exit__(self, exceptionType, exception, traceback):
+    return False
+
+######################################################################
+######################################################################
+class _Phase(object):
+  """Phase of a command line being timed; accumulates its elapsed time to
+  the line unless within another phase of it.
+  """
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, line, name):
+    super(_Phase, self).__init__()
+    self.__line = line
+    self.__name = name
+    self.__start = None
+
+  ####################################################################
+  def __enter__(self):
+    if self.__line.active:
+      # Within another phase, e.g., the lines of a nested loop within run;
+      # the time is that phase's.
+      self.__line = None
+    else:
+      self.__line.active = True
+      self.__start = time.perf_counter()
+    return self
+
+  ####################################################################
+  def __exit__(self, exceptionType, exception, traceback):
+    if self.__line is not None:
+      self.__line.record(self.__name, time.perf_counter() - self.__start)
+      self.__line.active = False
+    return False
+
+######################################################################
+######################################################################
+class _LineTiming(object):
+  """The phase times of a command line.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  def record(self, name, seconds):
+    self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self):
+    super(_LineTiming, self).__init__()
+    self.active = False
+    self.phases = {}
+    self.start = time.perf_counter()
+
+######################################################################
+######################################################################
+class CommandLineTimer(object):
+  """Times the phases of executing command lines: splitting the line into
+  words ('split'), parsing the words ('parse'), instantiating the command
+  ('instantiate') and running it ('run').  The time of the line not within
+  any of these is its 'other' phase.
+
+  The line being timed is that between start() and stop(), within the same
+  context (thread or asyncio task).  Its phases are delimited by phase(),
+  which does nothing unless a line is being timed.  The times of the lines
+  accumulate into a summary.
+  """
+  phaseNames = ("split", "parse", "instantiate", "run", "other")
+
+  __nullPhase = _NullPhase()
+
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @classmethod
+  def phase(cls, name):
+    """Returns a context manager timing the named phase of the command line
+    being timed in the current context.
+    """
+    line = _currentLine.get()
+    if line is None:
+      return cls.__nullPhase
+    return _Phase(line, name)
+
+  ####################################################################
+  @property
+  def lines(self):
+    """The number of lines timed.
+    """
+    return self.__lines
+
+  ####################################################################
+  def formatLine(self, times):
+    """Returns a one line description of the times, in seconds, of a line's
+    phases as returned by stop().
+    """
+    return "time: {0}".format(
+            ", ".join(["{0} {1:.3f} ms".format(name, times[name] * 1000)
+                        for name in self.phaseNames + ("total",)]))
+
+  ####################################################################
+  def start(self):
+    """Starts timing a command line in the current context.
+    """
+    self.__token = _currentLine.set(_LineTiming())
+
+  ####################################################################
+  def stop(self):
+    """Stops timing the command line, accumulating its times to the
+    summary, and returns a dictionary mapping its phase names, and 'total',
+    to their seconds.
+    """
+    line = _currentLine.get()
+    _currentLine.reset(self.__token)
+    self.__token = None
+
+    total = time.perf_counter() - line.start
+    times = dict([(name, line.phases.get(name, 0.0))
+                    for name in self.phaseNames[:-1]])
+    times["other"] = max(0.0, total - sum(times.values()))
+    times["total"] = total
+
+    self.__lines += 1
+    for (name, seconds) in times.items():
+      self.__totals[name] = self.__totals.get(name, 0.0) + seconds
+    return times
+
+  ####################################################################
+  def summary(self):
+    """Returns a table of the total and mean times of each phase over the
+    lines timed and each phase's percentage of the total.
+    """
+    total = self.__totals.get("total", 0.0)
+    lines = ["{0:<12} {1:>12} {2:>12} {3:>8}".format("phase", "total ms",
+                                                      "mean ms", "%")]
+    for name in self.phaseNames + ("total",):
+      seconds = self.__totals.get(name, 0.0)
+      lines.append("{0:<12} {1:>12.3f} {2:>12.3f} {3:>8.1f}"
+                      .format(name,
+                              seconds * 1000,
+                              seconds * 1000 / max(1, self.__lines),
+                              (100.0 * seconds / total) if total > 0
+                                                        else 0.0))
+    lines.append("{0:<12} {1:>12}".format("lines", self.__lines))
+    return os.linesep.join(lines)
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self):
+    super(CommandLineTimer, self).__init__()
+    self.__lines = 0
+    self.__totals = {}
+    self.__token = None
@@ -0,0 +1,493 @@
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+import atexit
+import logging
+import math
+import os
+import signal
+import sys
+import threading
+import time
+
+try:
+  import resource
+except ImportError:
+  # Not available on all platforms; peak RSS is then not recorded.
+  resource = None
+
+from .CommandCancellation import (CommandCancelledException,
+                                  CommandTimeoutException)
+
+log = logging.getLogger(__name__)
+
+######################################################################
+######################################################################
+class _Histogram(object):
+  """Cumulative histogram of observations over fixed bucket bounds.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @property
+  def bounds(self):
+    return self.__bounds
+
+  ####################################################################
+  @property
+  def buckets(self):
+    """Returns the cumulative count of observations for each bound.
+    """
+    return list(self.__buckets)
+
+  ####################################################################
+  @property
+  def count(self):
+    return self.__count
+
+  ####################################################################
+  @property
+  def sum(self):
+    return self.__sum
+
+  ####################################################################
+  def observe(self, value):
+    self.__count += 1
+    self.__sum += value
+    for (index, bound) in enumerate(self.__bounds):
+      if value <= bound:
+        self.__buckets[index] += 1
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, bounds):
+    super(_Histogram, self).__init__()
+    self.__bounds = tuple(bounds) + (math.inf,)
+    self.__buckets = [0] * len(self.__bounds)
+    self.__count = 0
+    self.__sum = 0
+
+######################################################################
+######################################################################
+class _NullMeasurement(object):
+  """Measurement used when metrics are disabled; does nothing.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  def running(self):
+    return self
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __enter__(self):
+    return self
+
+  ####################################################################
+  def __exit__(self, exceptionType, exception, traceback):
+    return False
+
+######################################################################
+######################################################################
+class _ThreadMeasurement(object):
+  """Measurement of the CPU time of the thread running a command's run().
+  """
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, measurement):
+    super(_ThreadMeasurement, self).__init__()
+    self.__measurement = measurement
+    self.__cpu = None
+
+  ####################################################################
+  def __enter__(self):
+    self.__cpu = time.thread_time()
+    return self
+
+  ####################################################################
+  def __exit__(self, exceptionType, exception, traceback):
+    self.__measurement._addCpu(time.thread_time() - self.__cpu)
+    return False
+
+######################################################################
+######################################################################
+class _Measurement(object):
+  """Measurement of a single command execution.
+
+  The CPU time is that accumulated by running(), which the command enters
+  in the thread in which run() executes.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  def running(self):
+    """Returns a context manager measuring the CPU time of the current
+    thread.
+    """
+    return _ThreadMeasurement(self)
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, name):
+    super(_Measurement, self).__init__()
+    self.__name = name
+    self.__wall = None
+    self.__cpu = 0.0
+    self.__cpuLock = threading.Lock()
+    self.__rss = None
+
+  ####################################################################
+  def __enter__(self):
+    self.__rss = CommandMetrics._peakRss()
+    self.__wall = time.perf_counter()
+    return self
+
+  ####################################################################
+  def __exit__(self, exceptionType, exception, traceback):
+    wall = time.perf_counter() - self.__wall
+    with self.__cpuLock:
+      cpu = self.__cpu
+    rss = CommandMetrics._peakRss()
+    if (rss is not None) and (self.__rss is not None):
+      rss -= self.__rss
+
+    # StopIteration is how interactive loops signal quit.
+    if (exceptionType is None) or issubclass(exceptionType, StopIteration):
+      outcome = "success"
+    elif issubclass(exceptionType, SystemExit):
+      outcome = "exit"
+    elif issubclass(exceptionType, CommandTimeoutException):
+      outcome = "timeout"
+    elif issubclass(exceptionType, CommandCancelledException):
+      outcome = "cancelled"
+    else:
+      outcome = "error"
+
+    CommandMetrics._record(self.__name, outcome, wall, cpu, rss)
+    return False
+
+  ####################################################################
+  # Protected methods
+  ####################################################################
+  def _addCpu(self, cpu):
+    with self.__cpuLock:
+      self.__cpu += cpu
+
+######################################################################
+######################################################################
+class CommandMetrics(object):
+  """Process-wide metrics of command execution.
+
+  For each command name the wall time, the CPU time of the thread in which
+  run() executes, the growth in the process' peak resident set size and the
+  outcome ('success', 'exit', 'timeout', 'cancelled' or 'error') of every
+  execution are aggregated into histograms and counters.
+
+  Metrics are enabled by setting the environment variable
+  PYTHON_MILL_METRICS to either 'json' or 'prometheus', selecting the format
+  of the report written at exit and on receipt of SIGUSR1; as file I/O is
+  not safe within a signal handler, the latter is written by a reporter
+  thread which the handler wakes via a pipe, whether or not commands are
+  executing.  The report is written to stderr unless
+  PYTHON_MILL_METRICS_FILE specifies a file, which is replaced atomically.
+  It may also be enabled programmatically via enable().
+
+  When disabled, measure() returns a shared do-nothing context manager.
+  """
+  __enabled = False
+  __format = None
+  __path = None
+  __commands = {}
+  __lock = threading.RLock()
+  __nullMeasurement = _NullMeasurement()
+  __registered = False
+  __handlerInstalled = False
+  __previousHandler = None
+  __wakeup = None
+  __reporter = None
+  __forkRegistered = False
+
+  # Histogram bucket bounds; seconds for times and bytes for memory.
+  _secondsBounds = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60, 300)
+  _bytesBounds = (0, 2 ** 16, 2 ** 20, 2 ** 22, 2 ** 24, 2 ** 26, 2 ** 28,
+                  2 ** 30)
+
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @classmethod
+  def disable(cls):
+    with cls.__lock:
+      cls.__enabled = False
+      cls.__restoreSignalHandler()
+
+  ####################################################################
+  @classmethod
+  def enable(cls, format = "json", path = None):
+    """Enables metrics with the report written at exit, and on SIGUSR1, in
+    the specified format ('json' or 'prometheus') to the specified path
+    (None being stderr).
+    """
+    if format not in ("json", "prometheus"):
+      raise ValueError("unknown metrics format: {0}".format(format))
+    with cls.__lock:
+      cls.__format = format
+      cls.__path = path
+      if not cls.__registered:
+        atexit.register(cls._writeReport)
+        cls.__registered = True
+      cls.__installSignalHandler()
+      cls.__enabled = True
+
+  ####################################################################
+  @classmethod
+  def enabled(cls):
+    return cls.__enabled
+
+  ####################################################################
+  @classmethod
+  def measure(cls, command):
+    """Returns a context manager measuring an execution of the command.
+    """
+    if not cls.__enabled:
+      return cls.__nullMeasurement
+    return _Measurement(command.name())
+
+  ####################################################################
+  @classmethod
+  def report(cls):
+    """Returns a dictionary, keyed by command name, of the metrics.
+    """
+    with cls.__lock:
+      return dict([(name, {
+                      "outcomes" : dict(metrics["outcomes"]),
+                      "wall-seconds" : cls.__histogramReport(
+                                                      metrics["wall"]),
+                      "cpu-seconds" : cls.__histogramReport(metrics["cpu"]),
+                      "peak-rss-delta-bytes" : cls.__histogramReport(
+                                                      metrics["rss"])
+                    })
+                    for (name, metrics) in cls.__commands.items()])
+
+  ####################################################################
+  @classmethod
+  def reset(cls):
+    with cls.__lock:
+      cls.__commands.clear()
+
+  ####################################################################
+  # Protected methods
+  ####################################################################
+  @classmethod
+  def _format(cls, report, format):
+    if format == "json":
+      import json
+      return json.dumps(report, indent = 2, sort_keys = True)
+
+    lines = []
+    for (metric, key, description) in (
+        ("mill_command_wall_seconds", "wall-seconds",
+         "Wall time of command execution."),
+        ("mill_command_cpu_seconds", "cpu-seconds",
+         "CPU time of the thread running the command."),
+        ("mill_command_peak_rss_delta_bytes", "peak-rss-delta-bytes",
+         "Growth in process peak resident set size during execution.")):
+      lines.append("# HELP {0} {1}".format(metric, description))
+      lines.append("# TYPE {0} histogram".format(metric))
+      for name in sorted(report):
+        histogram = report[name][key]
+        label = 'command="{0}"'.format(cls.__escapeLabel(name))
+        for (bound, count) in zip(histogram["bounds"], histogram["buckets"]):
+          lines.append('{0}_bucket{{{1},le="{2}"}} {3}'.format(
+                        metric, label,
+                        bound if bound == "+Inf" else repr(bound), count))
+        lines.append("{0}_sum{{{1}}} {2}".format(metric, label,
+                                                 repr(histogram["sum"])))
+        lines.append("{0}_count{{{1}}} {2}".format(metric, label,
+                                                   histogram["count"]))
+
+    metric = "mill_command_executions_total"
+    lines.append("# HELP {0} Command executions by outcome.".format(metric))
+    lines.append("# TYPE {0} counter".format(metric))
+    for name in sorted(report):
+      for outcome in sorted(report[name]["outcomes"]):
+        lines.append('{0}{{command="{1}",outcome="{2}"}} {3}'.format(
+                      metric, cls.__escapeLabel(name), outcome,
+                      report[name]["outcomes"][outcome]))
+    return "\n".join(lines) + "\n"
+
+  ####################################################################
+  @classmethod
+  def _isReporter(cls, thread):
+    """Returns True if the thread is the reporter.  The reporter may safely
+    be running at a fork as the child replaces it and the lock it may hold.
+    """
+    return (cls.__reporter is not None) and (thread is cls.__reporter)
+
+  ####################################################################
+  @classmethod
+  def _peakRss(cls):
+    """Returns the peak resident set size of the process in bytes or None
+    if unavailable.
+    """
+    if resource is None:
+      return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes other than on macOS.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+  ####################################################################
+  @classmethod
+  def _record(cls, name, outcome, wall, cpu, rss):
+    with cls.__lock:
+      metrics = cls.__commands.get(name)
+      if metrics is None:
+        metrics = { "outcomes" : {},
+                    "wall" : _Histogram(cls._secondsBounds),
+                    "cpu" : _Histogram(cls._secondsBounds),
+                    "rss" : _Histogram(cls._bytesBounds) }
+        cls.__commands[name] = metrics
+      metrics["outcomes"][outcome] = metrics["outcomes"].get(outcome, 0) + 1
+      metrics["wall"].observe(wall)
+      metrics["cpu"].observe(cpu)
+      if rss is not None:
+        metrics["rss"].observe(rss)
+
+  ####################################################################
+  @classmethod
+  def _writeReport(cls):
+    if not cls.__enabled:
+      return
+    text = cls._format(cls.report(), cls.__format)
+    if cls.__path is None:
+      print(text, file = sys.stderr)
+      return
+
+    # Replace the file atomically so that readers never see a partial report.
+    import tempfile
+    directory = os.path.dirname(os.path.abspath(cls.__path))
+    (fd, temporary) = tempfile.mkstemp(dir = directory, prefix = ".metrics.")
+    try:
+      with os.fdopen(fd, "w") as f:
+        f.write(text)
+      os.replace(temporary, cls.__path)
+    except BaseException:
+      os.unlink(temporary)
+      raise
+
+  ####################################################################
+  # Private methods
+  ####################################################################
+  @classmethod
+  def __afterFork(cls):
+    # The reporter thread does not survive a fork; the child, retaining the
+    # signal handler, needs its own lest the parent report on its behalf.
+    # The reporter may have held the lock at the fork.
+    cls.__lock = threading.RLock()
+    if cls.__wakeup is not None:
+      for fd in cls.__wakeup:
+        os.close(fd)
+      cls.__wakeup = None
+      cls.__startReporter()
+
+  ####################################################################
+  @classmethod
+  def __escapeLabel(cls, value):
+    return (value.replace("\\", "\\\\").replace("\"", "\\\"")
+                 .replace("\n", "\\n"))
+
+  ####################################################################
+  @classmethod
+  def __histogramReport(cls, histogram):
+    # The final, unbounded, bucket is reported as "+Inf" which, unlike
+    # infinity, is representable in JSON.
+    return { "bounds" : ([x for x in histogram.bounds if x != math.inf]
+                          + ["+Inf"]),
+             "buckets" : histogram.buckets,
+             "count" : histogram.count,
+             "sum" : histogram.sum }
+
+  ####################################################################
+  @classmethod
+  def __installSignalHandler(cls):
+    # Handlers may only be set from the main thread; if not, reports are
+    # written only at exit.
+    if (cls.__handlerInstalled or (not hasattr(signal, "SIGUSR1"))
+        or (threading.current_thread() is not threading.main_thread())):
+      return
+    if cls.__wakeup is None:
+      cls.__startReporter()
+    previous = signal.signal(signal.SIGUSR1, cls.__signalled)
+    cls.__handlerInstalled = True
+    # A handler not installed from Python, e.g., by an extension module, is
+    # reported as None; it cannot be restored.
+    cls.__previousHandler = previous
+
+  ####################################################################
+  @classmethod
+  def __report(cls, fd):
+    # The body of the reporter thread: writes a report for each wakeup.
+    while True:
+      try:
+        if len(os.read(fd, 512)) == 0:
+          return
+      except OSError:
+        return
+      try:
+        cls._writeReport()
+      except Exception:
+        log.exception("exception writing requested metrics report")
+
+  ####################################################################
+  @classmethod
+  def __restoreSignalHandler(cls):
+    if ((not cls.__handlerInstalled)
+        or (threading.current_thread() is not threading.main_thread())):
+      return
+    previous = cls.__previousHandler
+    if previous is None:
+      log.warning("SIGUSR1 handler installed other than from Python;"
+                  " restoring the default disposition in its place")
+      previous = signal.SIG_DFL
+    signal.signal(signal.SIGUSR1, previous)
+    cls.__handlerInstalled = False
+    cls.__previousHandler = None
+
+  ####################################################################
+  @classmethod
+  def __signalled(cls, signalNumber, frame):
+    # Only wakes the reporter; writing to a non-blocking pipe is safe here,
+    # and a full pipe already holds a pending wakeup.
+    try:
+      os.write(cls.__wakeup[1], b"\0")
+    except OSError:
+      pass
+
+  ####################################################################
+  @classmethod
+  def __startReporter(cls):
+    (readFd, writeFd) = os.pipe()
+    os.set_blocking(writeFd, False)
+    cls.__wakeup = (readFd, writeFd)
+    if not cls.__forkRegistered:
+      os.register_at_fork(after_in_child = cls.__afterFork)
+      cls.__forkRegistered = True
+    cls.__reporter = threading.Thread(target = cls.__report,
+                                      args = (readFd,),
+                                      name = "CommandMetrics-reporter",
+                                      daemon = True)
+    cls.__reporter.start()
+
+######################################################################
+######################################################################
+if os.getenv("PYTHON_MILL_METRICS", "") not in ("", "0"):
+  CommandMetrics.enable("prometheus"
+                          if os.getenv("PYTHON_MILL_METRICS") == "prometheus"
+                          else "json",
+                        os.getenv("PYTHON_MILL_METRICS_FILE"))
@@ -0,0 +1,293 @@
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+import collections
+import collections.abc
+import functools
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+######################################################################
+######################################################################
+class _PipelineClosed(Exception):
+  """Raised to a producing stage when its consumer has finished.
+  """
+  pass
+
+######################################################################
+######################################################################
+class _PipelineChannel(collections.abc.Iterator):
+  """Bounded buffer of records between two pipeline stages.
+
+  The producing stage blocks when the buffer is full; the consuming stage,
+  to which the channel is an iterator, blocks when it is empty.  An
+  exception with which the producer finished is raised to the consumer
+  once the buffered records are exhausted.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  def close(self):
+    """Closes the channel from the consuming side; any subsequent, or
+    blocked, put() raises _PipelineClosed.
+    """
+    with self.__condition:
+      self.__closed = True
+      self.__records.clear()
+      self.__condition.notify_all()
+
+  ####################################################################
+  def finish(self, exception = None):
+    """Finishes the channel from the producing side.
+    """
+    with self.__condition:
+      self.__finished = True
+      self.__exception = exception
+      self.__condition.notify_all()
+
+  ####################################################################
+  def put(self, record):
+    with self.__condition:
+      while (len(self.__records) >= self.__maximum) and (not self.__closed):
+        self.__condition.wait()
+      if self.__closed:
+        raise _PipelineClosed()
+      self.__records.append(record)
+      self.__condition.notify_all()
+
+  ####################################################################
+  def undeliveredException(self):
+    """Returns the exception with which the producer finished if it has not
+    been raised to the consumer, otherwise None.
+    """
+    with self.__condition:
+      return self.__exception
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, maximum):
+    super(_PipelineChannel, self).__init__()
+    self.__maximum = maximum
+    self.__records = collections.deque()
+    self.__condition = threading.Condition()
+    self.__closed = False
+    self.__finished = False
+    self.__exception = None
+
+  ####################################################################
+  def __next__(self):
+    with self.__condition:
+      while (len(self.__records) == 0) and (not self.__finished):
+        self.__condition.wait()
+      if len(self.__records) > 0:
+        record = self.__records.popleft()
+        self.__condition.notify_all()
+        return record
+      if self.__exception is not None:
+        (exception, self.__exception) = (self.__exception, None)
+        raise exception
+      raise StopIteration
+
+######################################################################
+######################################################################
+class CommandPipeline(object):
+  """Executes a sequence of commands each of which consumes, via its input
+  property, the records produced by its predecessor.
+
+  A command produces records by returning an iterator (e.g., run() being a
+  generator function), an asynchronous iterator, a list or a tuple from
+  run(); any other result other than None is a single record.  Each command
+  but the last executes in its own thread and its records are passed to the
+  next command through a buffer holding at most 'bufferSize' records,
+  blocking the producer until the consumer catches up.  The last command
+  executes in the calling thread and its result, materialized as a list if
+  it is an iterator, is the result of the pipeline; see run().  The records
+  are produced and consumed within each command's execution, as its
+  resultConsumer, so that its measurement and timeout cover them.
+
+  When the last command completes any still-producing commands are stopped
+  at their next record, and cancelled, and are awaited for at most
+  _stopTimeout() seconds; those which do not stop, neither producing nor
+  checking their cancellation, are abandoned to finish in the background.
+  An exception raised by a producer is raised to its
+  consumer when it reaches that point in the records or, if the consumer
+  never does, from run() once the last command completes.
+  """
+  # The argument separating the commands of a pipeline.
+  separator = "|"
+
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @property
+  def commands(self):
+    return list(self.__commands)
+
+  ####################################################################
+  @classmethod
+  def splitArguments(cls, arguments):
+    """Returns the list of argument lists of the pipeline's commands
+    separated, in the arguments, by separator; an argument of the separator
+    escaped by a backslash is the literal separator.  Raises ValueError if
+    any command would be empty.
+    """
+    commands = [[]]
+    for argument in arguments:
+      if argument == cls.separator:
+        commands.append([])
+      elif argument == "\\" + cls.separator:
+        commands[-1].append(cls.separator)
+      else:
+        commands[-1].append(argument)
+    if any([len(x) == 0 for x in commands]):
+      raise ValueError("empty command in pipeline")
+    return commands
+
+  ####################################################################
+  @classmethod
+  def splitCommandLine(cls, commandLine):
+    """Returns the list of the pipeline's command lines separated, in the
+    command line, by an unquoted, unescaped separator.  Raises ValueError if
+    any command line would be empty.
+    """
+    commandLines = []
+    start = 0
+    quote = None
+    escaped = False
+    for (index, character) in enumerate(commandLine):
+      if escaped:
+        escaped = False
+      elif (character == "\\") and (quote != "'"):
+        escaped = True
+      elif quote is not None:
+        if character == quote:
+          quote = None
+      elif character in ("'", '"'):
+        quote = character
+      elif character == cls.separator:
+        commandLines.append(commandLine[start:index].strip())
+        start = index + 1
+    commandLines.append(commandLine[start:].strip())
+
+    if (len(commandLines) > 1) and any([len(x) == 0 for x in commandLines]):
+      raise ValueError("empty command in pipeline")
+    return commandLines
+
+  ####################################################################
+  def run(self, consumer = None):
+    """Executes the pipeline returning the result of the last command or,
+    if specified, that of calling 'consumer' with it; the consumer is called
+    before the pipeline is shut down and may thus consume an iterator result
+    without it being materialized.
+    """
+    stages = []
+    upstream = None
+    try:
+      for command in self.__commands[:-1]:
+        command.input = upstream
+        channel = _PipelineChannel(self.__bufferSize)
+        thread = threading.Thread(target = self._produce,
+                                  args = (command, channel),
+                                  name = "pipeline-{0}".format(command.name()),
+                                  daemon = True)
+        thread.start()
+        stages.append((command, thread, channel))
+        upstream = channel
+
+      command = self.__commands[-1]
+      command.input = upstream
+      command.resultConsumer = (self.__materialize if consumer is None
+                                                   else consumer)
+      result = command.execute()
+    finally:
+      for (command, thread, channel) in stages:
+        channel.close()
+        command.cancellation.cancel()
+      deadline = time.monotonic() + self._stopTimeout()
+      for (command, thread, channel) in stages:
+        thread.join(max(0, deadline - time.monotonic()))
+        if thread.is_alive():
+          log.warning("pipeline command {0} did not stop"
+                        .format(command.name()))
+
+    for (command, thread, channel) in stages:
+      exception = channel.undeliveredException()
+      if exception is not None:
+        raise exception
+    return result
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, commands, bufferSize = 64):
+    super(CommandPipeline, self).__init__()
+    if len(commands) == 0:
+      raise ValueError("pipeline has no commands")
+    if bufferSize < 1:
+      raise ValueError("invalid pipeline buffer size: {0}".format(bufferSize))
+    self.__commands = list(commands)
+    self.__bufferSize = bufferSize
+
+  ####################################################################
+  # Protected methods
+  ####################################################################
+  def _produce(self, command, channel):
+    exception = None
+    try:
+      command.resultConsumer = functools.partial(self.__put, command, channel)
+      command.execute()
+    except BaseException as ex:
+      exception = ex
+    finally:
+      channel.finish(exception)
+
+  ####################################################################
+  def _stopTimeout(self):
+    """Returns the number of seconds run() waits, once the last command
+    completes, for the producing commands to stop.
+    """
+    return 5
+
+  ####################################################################
+  # Private methods
+  ####################################################################
+  def __materialize(self, result):
+    # Returns the result, as a list if it is an iterator.
+    if isinstance(result, collections.abc.Iterator):
+      result = list(result)
+    return result
+
+  ####################################################################
+  def __put(self, command, channel, result):
+    # Puts the records of the command's result into the channel; the
+    # consumer having finished ends the production successfully.
+    try:
+      if isinstance(result, collections.abc.AsyncIterator):
+        import asyncio
+        asyncio.run(self.__putAsync(result, channel))
+      elif isinstance(result, (collections.abc.Iterator, list, tuple)):
+        try:
+          for record in result:
+            channel.put(record)
+        finally:
+          if hasattr(result, "close"):
+            result.close()
+      elif result is not None:
+        channel.put(result)
+    except _PipelineClosed:
+      log.debug("pipeline consumer of {0} finished".format(command.name()))
+
+  ####################################################################
+  async def __putAsync(self, result, channel):
+    try:
+      async for record in result:
+        channel.put(record)
+    finally:
+      if hasattr(result, "aclose"):
+        await result.aclose()
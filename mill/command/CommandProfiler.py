@@ -0,0 +1,144 @@
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+######################################################################
+######################################################################
+class _NullProfiler(object):
+  """Profiler used when profiling is not requested; does nothing.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  def start(self):
+    pass
+
+  ####################################################################
+  def stop(self):
+    pass
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __enter__(self):
+    return self
+
+  ####################################################################
+  def __exit__(self, exceptionType, exception, traceback):
+    return False
+
+######################################################################
+######################################################################
+class CommandProfiler(object):
+  """Profiles the code executed between start() and stop(), or within a
+  with statement.
+
+  If 'profilePath' is specified the code is profiled with cProfile, in the
+  thread calling start(), and the statistics written to that path in
+  pstats format.  If 'traceMallocPath' is specified memory allocations are
+  traced with tracemalloc and a report of the 'top' allocating source lines
+  written to that path.
+  """
+  __nullProfiler = _NullProfiler()
+
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @classmethod
+  def forCommand(cls, command):
+    """Returns the profiler specified by the command's --profile and
+    --trace-malloc arguments; one which does nothing if neither was.
+    """
+    profilePath = getattr(command.args, "commandProfile", None)
+    traceMallocPath = getattr(command.args, "commandTraceMalloc", None)
+    if (profilePath is None) and (traceMallocPath is None):
+      return cls.__nullProfiler
+    return cls(profilePath, traceMallocPath)
+
+  ####################################################################
+  def start(self):
+    # The profiling modules are imported only when profiling.
+    import cProfile
+    import tracemalloc
+    if self.__traceMallocPath is not None:
+      self.__tracing = not tracemalloc.is_tracing()
+      if self.__tracing:
+        tracemalloc.start(self._traceMallocFrames())
+      tracemalloc.reset_peak()
+    if self.__profilePath is not None:
+      self.__profile = cProfile.Profile()
+      self.__profile.enable()
+
+  ####################################################################
+  def stop(self):
+    import tracemalloc
+    if self.__profile is not None:
+      self.__profile.disable()
+      self.__profile.dump_stats(self.__profilePath)
+      log.debug("wrote profile {0}".format(self.__profilePath))
+      self.__profile = None
+    if self.__traceMallocPath is not None:
+      snapshot = tracemalloc.take_snapshot()
+      (current, peak) = tracemalloc.get_traced_memory()
+      if self.__tracing:
+        tracemalloc.stop()
+      self._writeTraceMalloc(snapshot, current, peak)
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, profilePath = None, traceMallocPath = None, top = 25):
+    super(CommandProfiler, self).__init__()
+    self.__profilePath = profilePath
+    self.__traceMallocPath = traceMallocPath
+    self.__top = top
+    self.__profile = None
+    self.__tracing = False
+
+  ####################################################################
+  def __enter__(self):
+    self.start()
+    return self
+
+  ####################################################################
+  def __exit__(self, exceptionType, exception, traceback):
+    self.stop()
+    return False
+
+  ####################################################################
+  # Protected methods
+  ####################################################################
+  def _traceMallocFrames(self):
+    """Returns the number of frames of traceback to trace per allocation.
+    """
+    return 1
+
+  ####################################################################
+  def _writeTraceMalloc(self, snapshot, current, peak):
+    import tracemalloc
+    # Exclude tracemalloc's own allocations and those of the import system.
+    snapshot = snapshot.filter_traces((
+      tracemalloc.Filter(False, tracemalloc.__file__),
+      tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+      tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>")))
+    statistics = snapshot.statistics("lineno")
+
+    lines = ["current: {0} bytes".format(current),
+             "peak: {0} bytes".format(peak),
+             "",
+             "top {0} of {1} allocating lines:".format(
+                min(self.__top, len(statistics)), len(statistics))]
+    lines.extend([str(x) for x in statistics[:self.__top]])
+    with open(self.__traceMallocPath, "w") as f:
+      f.write(os.linesep.join(lines) + os.linesep)
+    log.debug("wrote allocation report {0}".format(self.__traceMallocPath))
+
+  ####################################################################
+  # Private methods
+  ####################################################################
@@ -0,0 +1,97 @@
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+import array
+import collections.abc
+import threading
+
+######################################################################
+######################################################################
+class CommandRecordWriter(object):
+  """Writes records to a stream as newline-delimited JSON (NDJSON); one
+  compact JSON document per line.
+
+  Encoded records are buffered and written to the stream in chunks of at
+  least 'bufferSize' characters, and upon flush().  Writing is thread-safe.
+  Values JSON cannot represent are converted by _default().
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @classmethod
+  def records(cls, result):
+    """Returns an iterable of the records of a command's result; the
+    elements if it is an iterator, list or tuple, nothing if it is None,
+    otherwise the result itself.
+    """
+    if result is None:
+      return ()
+    if isinstance(result, (collections.abc.Iterator, list, tuple)):
+      return result
+    return (result,)
+
+  ####################################################################
+  def flush(self):
+    with self.__lock:
+      self.__flush()
+      self.__stream.flush()
+
+  ####################################################################
+  def write(self, record):
+    line = self.__encoder.encode(record)
+    with self.__lock:
+      self.__buffer.append(line)
+      self.__buffered += len(line) + 1
+      if self.__buffered >= self.__bufferSize:
+        self.__flush()
+
+  ####################################################################
+  def writeAll(self, records):
+    """Writes each of the records, which may be an arbitrarily long
+    iterator, returning the number written.
+    """
+    count = 0
+    for record in records:
+      self.write(record)
+      count += 1
+    return count
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, stream, bufferSize = 65536):
+    super(CommandRecordWriter, self).__init__()
+    import json
+    self.__stream = stream
+    self.__bufferSize = bufferSize
+    self.__buffer = []
+    self.__buffered = 0
+    self.__lock = threading.Lock()
+    self.__encoder = json.JSONEncoder(ensure_ascii = False,
+                                      separators = (",", ":"),
+                                      default = self._default)
+
+  ####################################################################
+  # Protected methods
+  ####################################################################
+  def _default(self, value):
+    """Returns a JSON-representable form of a value the encoder does not
+    support; sets, arrays (e.g., the number lists of compact data) and other
+    iterables are lists, anything else its string.
+    """
+    if isinstance(value, (array.array, collections.abc.Set,
+                          collections.abc.Iterator)):
+      return list(value)
+    return str(value)
+
+  ####################################################################
+  # Private methods
+  ####################################################################
+  def __flush(self):
+    if len(self.__buffer) > 0:
+      self.__buffer.append("")
+      self.__stream.write("\n".join(self.__buffer))
+      self.__buffer = []
+      self.__buffered = 0
@@ -0,0 +1,240 @@
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+from __future__ import print_function
+
+import logging
+import os
+import socket
+import sys
+import threading
+import traceback
+
+from mill import instrument
+from . import client
+from .CommandBatch import CommandBatch
+from .CommandMetrics import CommandMetrics
+from .CommandShell import CommandShell
+
+log = logging.getLogger(__name__)
+
+########################################################################
+class CommandServer(object):
+  """Serves CommandShell invocations of a command hierarchy over a Unix
+  domain socket from a resident, pre-initialized process.
+
+  The hierarchy's factory mapping and argument parser are established once,
+  when the server is instantiated.  Each request is executed in a child
+  forked from the server, isolating requests from each other and from the
+  server, with the client's stdin, stdout and stderr, arguments, environment
+  and working directory.  The exit status is returned to the client.
+
+  As requests are executed in forked children the server must serve from a
+  single-threaded process; a child would otherwise inherit any locks held
+  by the other threads at the time of the fork.  The CommandMetrics
+  reporter is the only thread tolerated.  shutdown() may thus be invoked
+  from a signal handler.  The request is received by the child so that a
+  client which does not send it delays no other.
+
+  A child exits without running exit handlers, which belong to the server;
+  the CommandMetrics and PhaseTimer reports they would write are written
+  by the child once the request has executed.
+
+  The socket is accessible only by the server's user, and connections of
+  any other user (per their credentials, where available) are rejected.
+
+  See the client module for the client side.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @property
+  def path(self):
+    return self.__path
+
+  ####################################################################
+  def serve(self):
+    """Accepts and executes requests until shutdown() is invoked.  Raises
+    RuntimeError if the process has threads other than the calling one.
+    """
+    others = [x for x in threading.enumerate()
+                if (x is not threading.current_thread())
+                   and (not CommandMetrics._isReporter(x))]
+    if len(others) > 0:
+      raise RuntimeError("CommandServer must serve from a single-threaded"
+                         " process")
+    self.__listener = client.listen(self.path)
+    try:
+      self.__listener.settimeout(self._pollInterval())
+      self.__listening.set()
+      log.debug("serving {0}".format(self.path))
+
+      while not self.__shutdown.is_set():
+        self._reapChildren()
+        try:
+          (connection, address) = self.__listener.accept()
+        except socket.timeout:
+          continue
+        with connection:
+          self._accept(connection)
+    finally:
+      self.__listener.close()
+      self.__listening.clear()
+      try:
+        os.unlink(self.path)
+      except FileNotFoundError:
+        pass
+      self._reapChildren()
+
+  ####################################################################
+  def shutdown(self):
+    """Requests that serve() return.
+    """
+    self.__shutdown.set()
+
+  ####################################################################
+  def waitUntilServing(self, timeout = None):
+    """Waits until the server is accepting requests returning True if it
+    is.
+    """
+    return self.__listening.wait(timeout)
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, factoryClass, path, shellClass = CommandShell):
+    super(CommandServer, self).__init__()
+    self.__factoryClass = factoryClass
+    self.__path = path
+    self.__shellClass = shellClass
+    self.__listener = None
+    self.__listening = threading.Event()
+    self.__shutdown = threading.Event()
+    self.__children = set()
+
+    # Warm the state shared by all requests.
+    factoryClass.choices()
+    factoryClass._argumentParser()
+
+  ####################################################################
+  # Protected methods
+  ####################################################################
+  def _accept(self, connection):
+    if not client.peerAuthorized(connection):
+      log.warning("rejected connection of another user")
+      return
+
+    # Flush anything buffered so that the child does not repeat it.
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    try:
+      pid = os.fork()
+    except OSError as ex:
+      log.error("unable to fork for request: {0}".format(ex))
+      connection.sendall("{0}\n".format(client.STATUS_UNKNOWN).encode())
+      return
+
+    if pid == 0:
+      status = client.STATUS_UNKNOWN
+      try:
+        self.__listener.close()
+        request = self.__receive(connection)
+        if request is not None:
+          status = self._execute(*request)
+      finally:
+        try:
+          connection.sendall("{0}\n".format(status).encode())
+        finally:
+          os._exit(status)
+
+    self.__children.add(pid)
+
+  ####################################################################
+  def _execute(self, request, fds):
+    """Executes the request in the forked child returning the exit status.
+    """
+    status = 0
+    try:
+      for (target, fd) in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+      # The server's streams may have been replaced; bind new ones to the
+      # client's descriptors.
+      sys.stdin = open(0, "r", closefd = False)
+      sys.stdout = open(1, "w", closefd = False)
+      sys.stderr = open(2, "w", closefd = False)
+      os.chdir(request["cwd"])
+      os.environ.clear()
+      os.environ.update(request["environment"])
+      sys.argv = [sys.argv[0]] + request["argv"]
+
+      self.__shellClass(self.__factoryClass).run()
+    except SystemExit as ex:
+      if isinstance(ex.code, str):
+        print(ex.code, file = sys.stderr)
+      status = CommandBatch.exitStatus(ex)
+    except BaseException:
+      traceback.print_exc()
+      status = 1
+    finally:
+      self._writeReports()
+      sys.stdout.flush()
+      sys.stderr.flush()
+    return status
+
+  ####################################################################
+  def _pollInterval(self):
+    """Returns the number of seconds between checks for shutdown.
+    """
+    return 0.1
+
+  ####################################################################
+  def _reapChildren(self):
+    for pid in list(self.__children):
+      try:
+        (reaped, status) = os.waitpid(pid, os.WNOHANG)
+      except ChildProcessError:
+        reaped = pid
+      if reaped != 0:
+        self.__children.discard(pid)
+
+  ####################################################################
+  def _requestTimeout(self):
+    """Returns the number of seconds a client has to send its request.
+    """
+    return 10
+
+  ####################################################################
+  def _writeReports(self):
+    """Writes the reports otherwise written at exit as the forked child
+    exits without running exit handlers.
+    """
+    for report in (CommandMetrics._writeReport,
+                   instrument.PhaseTimer._writeReport):
+      try:
+        report()
+      except Exception:
+        traceback.print_exc()
+
+  ####################################################################
+  # Private methods
+  ####################################################################
+  def __receive(self, connection):
+    # Returns the tuple of the request and its file descriptors; None if the
+    # request is invalid.
+    connection.settimeout(self._requestTimeout())
+    try:
+      (request, fds) = client.receiveRequest(connection)
+    except (EOFError, OSError, ValueError) as ex:
+      log.warning("invalid request: {0}".format(ex))
+      return None
+    connection.settimeout(None)
+    if len(fds) != 3:
+      log.warning("invalid request: {0} descriptors".format(len(fds)))
+      for fd in fds:
+        os.close(fd)
+      return None
+    return (request, fds)
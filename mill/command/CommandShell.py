@@ -5,7 +5,16 @@
 #
 from __future__ import print_function
 
-from mill import factory
+import collections.abc
+import functools
+import os
+import sys
+
+from mill import factory, instrument
+from .CommandBatch import CommandBatch
+from .CommandCancellation import CommandCancelledException
+from .CommandPipeline import CommandPipeline
+from .CommandRecordWriter import CommandRecordWriter
 
 ########################################################################
 class CommandShell(factory.FactoryShell):
@@ -15,19 +24,69 @@ class CommandShell(factory.FactoryShell):
   # Public methods
   ####################################################################
   def run(self):
-    command = super(CommandShell, self).run()
-    result = None
-    try:
-      result = command.run()
-    except Exception as ex:
-      if command.isDebug:
-        raise ex
-      print(ex)
-    return result
+    """Executes the command specified by the program arguments returning
+    its result.
+
+    If the shell was instantiated with pipelines enabled and the arguments
+    include CommandPipeline.separator ('|', which must be quoted to the
+    invoking shell) they specify a pipeline of commands which is executed
+    returning the result of the last command; an argument of '\\|' is then
+    a literal '|'.
+
+    If the (last) command was given --ndjson its records, those of its
+    result and any it emit()s, are written to stdout as newline-delimited
+    JSON, within its execution, and exceptions are reported to stderr.  An
+    iterator result is consumed in doing so and None returned in its place.
+    """
+    with instrument.Tracer.span("command.run",
+                                {"command.program" :
+                                    os.path.basename(sys.argv[0])}) as span:
+      return self.__run(span)
+
+  ####################################################################
+  def iterateBatch(self, source, workers = 1, processes = False,
+                   ordered = True):
+    """Returns a generator executing the command lines from the source
+    and yielding a CommandBatchResult for each.
+
+    The source is a file path, '-' for stdin or an iterable of lines.  See
+    CommandBatch for the meaning of the remaining arguments.
+    """
+    batch = CommandBatch(self._factoryClass, workers = workers,
+                         processes = processes, ordered = ordered)
+    return batch.run(CommandBatch.lines(source))
+
+  ####################################################################
+  def runBatch(self, source, workers = 1, processes = False,
+               ordered = True):
+    """Executes the command lines from the source, reporting failures to
+    stderr, and returns the aggregate exit status; that is, the greatest of
+    the exit statuses of the lines.
+
+    See iterateBatch() for the meaning of the arguments.
+    """
+    batch = CommandBatch(self._factoryClass, workers = workers,
+                         processes = processes, ordered = ordered)
+    return batch.runAndReport(CommandBatch.lines(source))
+
+  ####################################################################
+  async def runAsync(self):
+    """Awaitable form of run() for use within a running event loop.
+    """
+    with instrument.Tracer.span("command.run",
+                                {"command.program" :
+                                    os.path.basename(sys.argv[0])}) as span:
+      return await self.__runAsync(span)
 
   ####################################################################
   # Overridden methods
   ####################################################################
+  def __init__(self, factoryClass, pipelines = False):
+    """If 'pipelines' is True the program arguments may specify a pipeline
+    of commands; see run().
+    """
+    super(CommandShell, self).__init__(factoryClass)
+    self.__pipelines = pipelines
 
   ####################################################################
   # Protected methods
@@ -36,3 +95,90 @@ class CommandShell(factory.FactoryShell):
   ####################################################################
   # Private methods
   ####################################################################
+  def __run(self, span):
+    if self.__pipelines and (CommandPipeline.separator in sys.argv[1:]):
+      self._updateCompletionIndex()
+      return self.__runPipeline(span, sys.argv[1:])
+
+    command = super(CommandShell, self).run()
+    span.setAttribute("command.name", command.name())
+    writer = self.__recordWriter(command)
+    try:
+      result = command.execute()
+    except Exception as ex:
+      result = self.__reportException(command, writer, ex)
+    finally:
+      if writer is not None:
+        writer.flush()
+    return result
+
+  ####################################################################
+  async def __runAsync(self, span):
+    command = super(CommandShell, self).run()
+    span.setAttribute("command.name", command.name())
+    writer = self.__recordWriter(command)
+    try:
+      result = await command.executeAsync()
+    except Exception as ex:
+      result = self.__reportException(command, writer, ex)
+    finally:
+      if writer is not None:
+        writer.flush()
+    return result
+
+  ####################################################################
+  def __runPipeline(self, span, arguments):
+    parser = self._factoryClass._argumentParser()
+    try:
+      commands = [self._factoryClass.makeItem(args = parser.parse_args(x))
+                    for x in CommandPipeline.splitArguments(arguments)]
+    except ValueError as ex:
+      parser.error(str(ex))
+    span.setAttribute("command.name",
+                      CommandPipeline.separator.join([x.name()
+                                                        for x in commands]))
+
+    writer = self.__recordWriter(commands[-1])
+    try:
+      result = CommandPipeline(commands).run(
+                None if writer is None
+                     else lambda result: self.__writeRecords(writer, result))
+    except Exception as ex:
+      result = self.__reportException(commands[-1], writer, ex)
+    finally:
+      if writer is not None:
+        writer.flush()
+    return result
+
+  ####################################################################
+  def __recordWriter(self, command):
+    # Returns the command's record writer if --ndjson was specified, making
+    # it consume the command's result.
+    if not getattr(command.args, "commandNdjson", False):
+      return None
+    writer = CommandRecordWriter(sys.stdout)
+    command.recordWriter = writer
+    command.resultConsumer = functools.partial(self.__writeRecords, writer)
+    return writer
+
+  ####################################################################
+  def __reportException(self, command, writer, exception):
+    # Reports the exception returning the result, if any, to return.
+    if command.isDebug:
+      raise exception
+    print(exception, file = sys.stdout if writer is None else sys.stderr)
+
+    # Report whatever a cancelled command accomplished.
+    result = None
+    if isinstance(exception, CommandCancelledException):
+      result = self.__writeRecords(writer, exception.partialResult)
+    return result
+
+  ####################################################################
+  def __writeRecords(self, writer, result):
+    # Writes the result's records, if writing records, returning the result
+    # to return.
+    if writer is None:
+      return result
+    writer.writeAll(CommandRecordWriter.records(result))
+    return None if isinstance(result, collections.abc.Iterator) else result
@@ -5,11 +5,23 @@
 #
 import argparse
 import cmd
+import collections.abc
+import contextvars
+import functools
+import os
 import shlex
+import sys
 
+from mill import instrument
 from .Command import Command
 from .CommandArgumentParser import (CommandArgumentParser,
                                     CommandNullArgumentParser)
+from .CommandBatch import CommandBatch, CommandBatchResult
+from .CommandCompletion import CommandCompletion
+from .CommandJobs import CommandJobs
+from .CommandLineTimer import CommandLineTimer
+from .CommandPipeline import CommandPipeline
+from .CommandProfiler import CommandProfiler
 
 ########################################################################
 ########################################################################
@@ -34,9 +46,16 @@ class InteractiveCommand(Command):
   ####################################################################
   @classmethod
   def makeCommandItem(cls, commandLine = None):
-    args = (None if commandLine is None
-                 else cls._argumentParser().parse_args(shlex.split(commandLine)))
-    return super(InteractiveCommand, cls).makeItem(args = args)
+    args = cls._parseCommandLine(commandLine)
+    with CommandLineTimer.phase("instantiate"):
+      return super(InteractiveCommand, cls).makeItem(args = args)
+
+  ####################################################################
+  @classmethod
+  async def makeCommandItemAsync(cls, commandLine = None):
+    args = cls._parseCommandLine(commandLine)
+    with CommandLineTimer.phase("instantiate"):
+      return await super(InteractiveCommand, cls).makeItemAsync(args = args)
 
   ####################################################################
   @classmethod
@@ -57,6 +76,14 @@ class InteractiveCommand(Command):
   ####################################################################
   # Protected factory-behavior methods
   ####################################################################
+  @classmethod
+  def _parseCommandLine(cls, commandLine):
+    if commandLine is None:
+      return None
+    with CommandLineTimer.phase("split"):
+      words = shlex.split(commandLine)
+    with CommandLineTimer.phase("parse"):
+      return cls._argumentParser().parse_args(words)
 
   ####################################################################
   # Protected instance-behavior methods
@@ -70,44 +97,408 @@ class InteractiveCommand(Command):
   # Private instance-behavior methods
   ####################################################################
 
+########################################################################
+########################################################################
+class _ReadlineSession(object):
+  """Establishes, for the duration of a with statement, readline history
+  loaded from, and saved to, 'path' and completion by the user interface.
+  The history and completer in effect before, e.g., those of an enclosing
+  loop, are restored afterward.
+
+  Does nothing if readline is unavailable, 'path' is None, the interface
+  does not use raw input or stdin is not the process's terminal.
+  """
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, path, userInterface, historyLength = 1000):
+    super(_ReadlineSession, self).__init__()
+    self.__path = path
+    self.__userInterface = userInterface
+    self.__historyLength = historyLength
+    self.__readline = None
+    self.__previousHistory = None
+    self.__previousCompleter = None
+
+  ####################################################################
+  def __enter__(self):
+    if ((self.__path is None) or (not self.__userInterface.use_rawinput)
+        or (not self.__terminal())):
+      return self
+    try:
+      import readline
+    except ImportError:
+      return self
+    self.__readline = readline
+
+    self.__previousHistory = [readline.get_history_item(index)
+                                for index
+                                  in range(1,
+                                           readline.get_current_history_length()
+                                            + 1)]
+    readline.clear_history()
+    try:
+      readline.read_history_file(self.__path)
+    except OSError:
+      pass
+    readline.set_history_length(self.__historyLength)
+
+    self.__previousCompleter = readline.get_completer()
+    readline.set_completer(self.__userInterface.complete)
+    readline.parse_and_bind("{0}: complete"
+                              .format(self.__userInterface.completekey))
+    return self
+
+  ####################################################################
+  def __exit__(self, exceptionType, exception, traceback):
+    readline = self.__readline
+    if readline is None:
+      return False
+    try:
+      self._writeHistory(readline)
+    except OSError as ex:
+      print("unable to save history {0}: {1}".format(self.__path, ex),
+            file = sys.stderr)
+    readline.clear_history()
+    for item in self.__previousHistory:
+      readline.add_history(item)
+    readline.set_completer(self.__previousCompleter)
+    return False
+
+  ####################################################################
+  # Protected methods
+  ####################################################################
+  def _writeHistory(self, readline):
+    # The history may hold whatever was typed at the prompt, e.g., secrets;
+    # it is readable by the user alone regardless of the umask, the file
+    # being created with mode 0600 and an existing one restricted to it.
+    os.makedirs(os.path.dirname(self.__path), mode = 0o700, exist_ok = True)
+    os.close(os.open(self.__path, os.O_WRONLY | os.O_CREAT, 0o600))
+    os.chmod(self.__path, 0o600)
+    readline.write_history_file(self.__path)
+
+  ####################################################################
+  # Private methods
+  ####################################################################
+  def __terminal(self):
+    # readline serves input() only when stdin is the process's terminal; not,
+    # e.g., that of an InteractiveServer session.
+    try:
+      return sys.stdin.isatty() and (sys.stdin.fileno() == 0)
+    except (AttributeError, OSError, ValueError):
+      return False
+
+########################################################################
+########################################################################
+class _InteractiveBatch(CommandBatch):
+  """CommandBatch of an InteractiveLoop's command lines; those which the
+  batch cannot execute, invoking the interface's commands, pipelines and
+  background jobs, are executed sequentially by the loop's interface.
+  """
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, loop, **kwargs):
+    super(_InteractiveBatch, self).__init__(loop._commandRootClass(),
+                                            **kwargs)
+    self.__loop = loop
+    self.__userInterface = loop._interfaceClass(loop, "")
+    self.__quit = False
+
+  ####################################################################
+  # Protected methods
+  ####################################################################
+  def _commandLines(self, lines):
+    for entry in super(_InteractiveBatch, self)._commandLines(lines):
+      if self.__quit:
+        break
+      yield entry
+
+  ####################################################################
+  def _execute(self, lineNumber, line):
+    if not self._isSequential(line):
+      return super(_InteractiveBatch, self)._execute(lineNumber, line)
+    try:
+      result = self.__userInterface.onecmd(line)
+      if isinstance(result, collections.abc.Awaitable):
+        # An asynchronous loop's batch executes off its event loop.
+        import asyncio
+        result = asyncio.run(self.__await(result))
+    except (Exception, StopIteration, SystemExit) as ex:
+      ex = self.__loop._translateAsyncException(ex)
+      if not isinstance(ex, StopIteration):
+        return CommandBatchResult(lineNumber, line, exception = ex)
+      self.__quit = True
+      result = None
+    return CommandBatchResult(lineNumber, line, result)
+
+  ####################################################################
+  def _isSequential(self, line):
+    if self.__userInterface.isBuiltinLine(line) or line.endswith("&"):
+      return True
+    if not self.__loop._pipelines:
+      return False
+    try:
+      return len(CommandPipeline.splitCommandLine(line)) > 1
+    except ValueError:
+      return True
+
+  ####################################################################
+  # Private methods
+  ####################################################################
+  async def __await(self, awaitable):
+    return await awaitable
+
 ########################################################################
 ########################################################################
 class InteractiveInterface(cmd.Cmd):
+  ####################################################################
+  # Public instance-behavior methods
+  ####################################################################
+  def isBuiltinLine(self, line):
+    """Returns whether the line invokes one of the interface's commands.
+    The loop's commands take precedence over them, other than help and
+    quit.
+    """
+    name = self.parseline(line)[0]
+    if (name is None) or (not hasattr(self, "do_{0}".format(name))):
+      return False
+    return (name in ("help", "quit")) or (not self.__loop.isCommandName(name))
+
   ####################################################################
   # Overridden instance-behavior methods
+  ####################################################################
+  def completedefault(self, text, line, begidx, endidx):
+    return self.__loop.completion.complete(line, text, begidx)
+
+  ####################################################################
+  def completenames(self, text, *ignored):
+    return self.__loop.completion.completeNames(text)
+
   ####################################################################
   def default(self, line):
     if line == "EOF":
       raise EOFError
 
+    commandLine = self.__backgroundCommandLine(line)
+    if commandLine is not None:
+      job = self.__loop.startJob(commandLine)
+      print("[{0}] {1}".format(job.identifier, job.commandLine))
+      return None
+
+    if self.__loop.timing:
+      return self.__runTimed(line)
     return self.__loop.makeCommandItemAndRun(line)
 
+  ####################################################################
+  def do_fg(self, arg):
+    return self.__loop.foregroundJob(self.__jobIdentifier(arg))
+
   ####################################################################
   def do_help(self, arg):
+    # The interface's commands are described by their help_ methods, the
+    # loop's by their argument parsers.
+    if self.isBuiltinLine(arg):
+      return super(InteractiveInterface, self).do_help(self.parseline(arg)[0])
     return self.__loop.makeCommandItemAndRun("{0} --help".format(arg))
 
+  ####################################################################
+  def do_jobs(self, arg):
+    for job in self.__loop.jobs.jobs():
+      print(job)
+
+  ####################################################################
+  def do_kill(self, arg):
+    self.__loop.jobs.get(self.__jobIdentifier(arg)).kill()
+
+  ####################################################################
+  def do_profile(self, arg):
+    (path, line) = self.__prefixArguments("profile", arg)
+    return self.__runProfiled(CommandProfiler(profilePath = path), line)
+
+  ####################################################################
+  def do_time(self, arg):
+    if arg.strip() == "":
+      print("usage: time COMMAND...")
+      raise SystemExit
+    return self.__runTimed(arg)
+
+  ####################################################################
+  def do_timing(self, arg):
+    arg = arg.strip()
+    if arg not in ("", "on", "off"):
+      print("usage: timing [on|off]")
+      raise SystemExit
+    self.__loop.timing = ((not self.__loop.timing) if arg == ""
+                                                   else (arg == "on"))
+    print("timing {0}".format("on" if self.__loop.timing else "off"))
+
+  ####################################################################
+  def do_tracemalloc(self, arg):
+    (path, line) = self.__prefixArguments("tracemalloc", arg)
+    return self.__runProfiled(CommandProfiler(traceMallocPath = path), line)
+
+  ####################################################################
+  def do_wait(self, arg):
+    return self.__loop.waitJobs(self.__jobIdentifier(arg))
+
   ####################################################################
   def emptyline(self):
     pass
 
+  ####################################################################
+  def help_fg(self):
+    print("fg [JOB]: waits for the job, the most recent if not specified,"
+          " displaying its output and result as if run in the foreground")
+
+  ####################################################################
+  def help_jobs(self):
+    print("jobs: lists the background jobs; a command line ending in '&'"
+          " is executed as a background job")
+
+  ####################################################################
+  def help_kill(self):
+    print("kill [JOB]: cancels the job, the most recent if not specified")
+
+  ####################################################################
+  def help_profile(self):
+    print("profile FILE COMMAND...: executes the command line writing a"
+          " cProfile (pstats) profile to FILE")
+
+  ####################################################################
+  def help_time(self):
+    print("time COMMAND...: executes the command line reporting the time"
+          " spent splitting, parsing, instantiating and running it")
+
+  ####################################################################
+  def help_timing(self):
+    print("timing [on|off]: toggles, or sets, reporting the time of each"
+          " command line as does time; a summary is reported on exit")
+
+  ####################################################################
+  def help_tracemalloc(self):
+    print("tracemalloc FILE COMMAND...: executes the command line writing a"
+          " report of its memory allocations to FILE")
+
+  ####################################################################
+  def help_wait(self):
+    print("wait [JOB]: waits for the job, or all jobs if not specified,"
+          " displaying their output and status")
+
+  ####################################################################
+  def onecmd(self, line):
+    # Report the jobs which finished while the previous line executed, or
+    # the next was awaited.
+    self.__loop.reportFinishedJobs()
+
+    # A loop's command shadowing one of the interface's is executed as
+    # any other.
+    name = self.parseline(line)[0]
+    if ((name not in (None, "")) and hasattr(self, "do_{0}".format(name))
+        and (not self.isBuiltinLine(line))):
+      return self.default(line)
+    return super(InteractiveInterface, self).onecmd(line)
+
   ####################################################################
   def __init__(self, loop, prompt, **kwargs):
     super(InteractiveInterface, self).__init__(**kwargs)
     self.__loop = loop
     self.prompt = prompt
 
+  ####################################################################
+  # Private instance-behavior methods
+  ####################################################################
+  async def __awaitTimed(self, awaitable):
+    try:
+      return await awaitable
+    finally:
+      self.__reportTime()
+
+  ####################################################################
+  async def __awaitProfiled(self, profiler, awaitable):
+    try:
+      return await awaitable
+    finally:
+      profiler.stop()
+
+  ####################################################################
+  def __backgroundCommandLine(self, line):
+    # Returns the command line preceding a trailing, unquoted and unescaped,
+    # '&' or None if there is none.
+    line = line.rstrip()
+    if not line.endswith("&"):
+      return None
+    try:
+      words = shlex.split(line)
+    except ValueError:
+      return None
+    if (len(words) == 0) or (words[-1] != "&"):
+      return None
+    commandLine = line[:-1].rstrip()
+    return commandLine if len(commandLine) > 0 else None
+
+  ####################################################################
+  def __jobIdentifier(self, arg):
+    # Returns the job identifier argument; None if omitted.  Accepts the
+    # '%N' form of shells.
+    arg = arg.strip().lstrip("%")
+    return None if arg == "" else arg
+
+  ####################################################################
+  def __prefixArguments(self, prefix, arg):
+    # Returns a tuple of the file and the command line following a prefix.
+    # The command line is that remaining of the argument, as is, so that
+    # its quoting and any pipeline are preserved.
+    lexer = shlex.shlex(arg, posix = True)
+    lexer.whitespace_split = True
+    lexer.commenters = ""
+    path = lexer.get_token()
+    commandLine = lexer.instream.read().strip()
+    if (path is None) or (commandLine == ""):
+      print("usage: {0} FILE COMMAND...".format(prefix))
+      raise SystemExit
+    return (path, commandLine)
+
+  ####################################################################
+  def __reportTime(self):
+    timer = self.__loop.timer
+    print(timer.formatLine(timer.stop()), file = sys.stderr)
+
+  ####################################################################
+  def __runTimed(self, line):
+    # As with profiling, the command line of an asynchronous loop is timed
+    # through the awaiting of the returned awaitable.
+    self.__loop.timer.start()
+    try:
+      result = self.__loop.makeCommandItemAndRun(line)
+    except BaseException:
+      self.__reportTime()
+      raise
+    if isinstance(result, collections.abc.Awaitable):
+      return self.__awaitTimed(result)
+    self.__reportTime()
+    return result
+
+  ####################################################################
+  def __runProfiled(self, profiler, line):
+    # The command line of an asynchronous loop is executed when the returned
+    # awaitable is awaited; profile that rather than its creation.
+    profiler.start()
+    try:
+      result = self.__loop.makeCommandItemAndRun(line)
+    except BaseException:
+      profiler.stop()
+      raise
+    if isinstance(result, collections.abc.Awaitable):
+      return self.__awaitProfiled(profiler, result)
+    profiler.stop()
+    return result
+
 ########################################################################
 ########################################################################
 class InteractiveInterfaceQuit(InteractiveInterface):
   ####################################################################
   # Overridden instance-behavior methods
-  ####################################################################
-  def do_help(self, arg):
-    if (arg != "") and (shlex.split(arg)[0] == "quit"):
-      self.help_quit()
-    else:
-      super(InteractiveInterfaceQuit, self).do_help(arg)
-
   ####################################################################
   def do_quit(self, arg):
     raise StopIteration
@@ -122,12 +513,151 @@ class InteractiveInterfaceQuit(InteractiveInterface):
 class InteractiveLoop(InteractiveCommand):
   """A Command class which operates as a loop possing its own Command
   hierarchy.
+
+  If _pipelines is overridden as True a command line containing an
+  unquoted '|' is executed as a CommandPipeline of the commands it
+  separates; as does CommandShell, pipelines are opted into so that a '|'
+  is otherwise an ordinary character of the command line.
+
+  A command line ending in '&' is executed as a background job; see
+  startJob().
+
+  The builtin 'time' reports the time spent in the phases of a command
+  line; 'timing', or --timing, reports it for every line.  See
+  CommandLineTimer.  A command of the loop takes precedence over a builtin
+  of the same name, other than help and quit.
+
+  Given --batch the loop instead executes the command lines of a file, or
+  stdin, as a CommandBatch; see runBatch().
   """
+  # Whether command lines may specify pipelines; see above.
+  _pipelines = False
+
   ####################################################################
   # Public instance-behavior methods
+  ####################################################################
+  @property
+  def completion(self):
+    """The CommandCompletion of the loop's commands and of the commands of
+    its interface; built upon first use and retained for the loop's life.
+    """
+    if self.__completion is None:
+      builtins = [x[len("do_"):] for x in dir(self._interfaceClass)
+                                   if x.startswith("do_")]
+      self.__completion = CommandCompletion(self._commandRootClass(),
+                                            builtins)
+    return self.__completion
+
+  ####################################################################
+  @property
+  def jobs(self):
+    """The CommandJobs of the loop's background jobs.
+    """
+    return self.__jobs
+
+  ####################################################################
+  @property
+  def timer(self):
+    """The CommandLineTimer of the loop's timed command lines.
+    """
+    return self.__timer
+
+  ####################################################################
+  @property
+  def timing(self):
+    """Whether the time of each command line is reported; initially per
+    --timing.
+    """
+    return self.__timing
+
+  ####################################################################
+  @timing.setter
+  def timing(self, value):
+    self.__timing = bool(value)
+
+  ####################################################################
+  def foregroundJob(self, identifier = None):
+    """Waits for the job, the most recent if None, displaying its output
+    as it is produced, and returns its result or raises its exception.
+    """
+    job = self.__jobs.get(identifier)
+    print(job.commandLine)
+    while not job.wait(self._jobOutputInterval()):
+      sys.stdout.write(job.takeOutput())
+    self.__jobs.remove(job)
+    sys.stdout.write(job.takeOutput())
+    if job.exception is not None:
+      raise job.exception
+    return job.result
+
+  ####################################################################
+  def isCommandName(self, name):
+    """Returns whether the name is that of one of the loop's commands.
+    """
+    return self._commandRootClass()._isItemAvailable(name)
+
   ####################################################################
   def makeCommandItemAndRun(self, commandLine = None):
-    return self.makeCommandItem(commandLine).run()
+    pipeline = self._makePipeline(commandLine)
+    if pipeline is not None:
+      with CommandLineTimer.phase("run"):
+        return pipeline.run()
+    command = self.makeCommandItem(commandLine)
+    with CommandLineTimer.phase("run"):
+      return command.execute()
+
+  ####################################################################
+  def reportFinishedJobs(self):
+    """Displays the output and status of the jobs which have finished since
+    last reported, removing them.
+    """
+    for job in self.__jobs.finished():
+      sys.stdout.write(job.takeOutput())
+      print(job)
+
+  ####################################################################
+  def runBatch(self, source, workers = 1, processes = False,
+               ordered = True):
+    """Executes the command lines from the source without prompting.
+    Failures are reported to stderr and the aggregate exit status, the
+    greatest of the exit statuses of the lines, is returned.
+
+    Lines invoking the interface's commands (help, quit, etc.), pipelines
+    and background jobs are executed by the interface, in order, once the
+    preceding lines have completed; quit ends the batch.
+
+    The source is a file path, '-' for stdin or an iterable of lines.  See
+    CommandBatch for the meaning of the remaining arguments.
+    """
+    batch = _InteractiveBatch(self, workers = workers,
+                              processes = processes, ordered = ordered)
+    return batch.runAndReport(CommandBatch.lines(source))
+
+  ####################################################################
+  def startJob(self, commandLine):
+    """Starts, and returns, a CommandJob executing the command line in the
+    background.  The command line is parsed, and its commands instantiated,
+    in the calling thread so that errors in it are raised immediately.
+    """
+    pipeline = self._makePipeline(commandLine)
+    commands = ([self.makeCommandItem(commandLine)] if pipeline is None
+                                                    else pipeline.commands)
+    return self.__jobs.start(commandLine, commands,
+                             functools.partial(self._runJob, pipeline,
+                                               commands))
+
+  ####################################################################
+  def waitJobs(self, identifier = None):
+    """Waits for the job, or all jobs if None, displaying the output and
+    status of each.
+    """
+    jobs = (self.__jobs.jobs() if identifier is None
+                               else [self.__jobs.get(identifier)])
+    for job in jobs:
+      job.wait()
+      self.__jobs.remove(job)
+      sys.stdout.write(job.takeOutput())
+      print(job)
 
   ####################################################################
   # Overridden class-behavior methods
@@ -141,36 +671,58 @@ class InteractiveLoop(InteractiveCommand):
   def makeCommandItem(cls, commandLine = None):
     return cls._commandRootClass().makeCommandItem(commandLine)
 
+  ####################################################################
+  @classmethod
+  def parserParents(cls):
+    parser = argparse.ArgumentParser(add_help = False)
+
+    parser.add_argument("--batch",
+                        help = "execute the command lines of FILE, or of"
+                               " stdin if FILE is omitted or '-', without"
+                               " prompting and exit with the greatest of"
+                               " their statuses",
+                        dest = "loopBatch",
+                        metavar = "FILE",
+                        nargs = "?",
+                        const = "-",
+                        default = None)
+
+    parser.add_argument("--jobs",
+                        help = "with --batch, the number of command lines"
+                               " to execute concurrently",
+                        dest = "loopJobs",
+                        type = int,
+                        metavar = "N",
+                        default = 1)
+
+    parser.add_argument("--timing",
+                        help = "report the time of each command line and"
+                               " a summary on exit",
+                        dest = "loopTiming",
+                        action = "store_true",
+                        default = False)
+
+    parents = super(InteractiveLoop, cls).parserParents()
+    parents.append(parser)
+    return parents
+
   ####################################################################
   # Overridden instance-behavior methods
   ####################################################################
-  def run(self, arg = None):
-    self._preLoop(arg)
+  def __init__(self, args):
+    super(InteractiveLoop, self).__init__(args)
+    self.__completion = None
+    self.__jobs = CommandJobs()
+    self.__timer = CommandLineTimer()
+    self.__timing = getattr(args, "loopTiming", False)
 
-    # Establish the user interface.
-    userInterface = self._interfaceClass(self,
-                                         "{0} > "
-                                          .format(self._loopName))
-
-    # Execute the loop.
-    try:
-      while True:
-        try:
-          userInterface.cmdloop()
-        except StopIteration:
-          # User requested quit.
-          raise
-        except EOFError:
-          # User requested end of this loop.
-          print("\n")
-          break
-        except SystemExit:
-          # Raised by argument parser.
-          pass
-        except Exception as ex:
-          print(ex)
-    finally:
-      self._postLoop()
+  ####################################################################
+  def run(self, arg = None):
+    with instrument.Tracer.span("interactive.run",
+                                {"interactive.loop" : self._loopName,
+                                 "interactive.batch" :
+                                    self._batchSource is not None}):
+      return self.__run(arg)
 
   ####################################################################
   # Protected class-behavior methods
@@ -181,11 +733,51 @@ class InteractiveLoop(InteractiveCommand):
 
   ####################################################################
   # Protected instance-behavior methods
+  ####################################################################
+  @property
+  def _batchSource(self):
+    """The source of the command lines specified by --batch or None if the
+    loop is interactive.
+    """
+    return getattr(self.args, "loopBatch", None)
+
   ####################################################################
   @property
   def _interfaceClass(self):
     return InteractiveInterfaceQuit
 
+  ####################################################################
+  def _historyPath(self):
+    """Returns the path of the file in which the loop's command line
+    history persists across sessions or None if it does not.  The default
+    is per loop name under $XDG_STATE_HOME (default ~/.local/state).
+    """
+    stateHome = os.environ.get("XDG_STATE_HOME",
+                               os.path.join(os.path.expanduser("~"),
+                                            ".local", "state"))
+    return os.path.join(stateHome, "python-mill", "history", self._loopName)
+
+  ####################################################################
+  def _jobOutputInterval(self):
+    """Returns the interval, in seconds, at which the output of a job in
+    the foreground is displayed.
+    """
+    return 0.1
+
+  ####################################################################
+  def _makePipeline(self, commandLine):
+    """Returns a CommandPipeline of the commands of the command line or None
+    if it does not specify a pipeline or pipelines are not enabled.
+    """
+    if ((not self._pipelines) or (commandLine is None)
+        or (CommandPipeline.separator not in commandLine)):
+      return None
+    with CommandLineTimer.phase("split"):
+      commandLines = CommandPipeline.splitCommandLine(commandLine)
+    if len(commandLines) == 1:
+      return None
+    return CommandPipeline([self.makeCommandItem(x) for x in commandLines])
+
   ####################################################################
   @property
   def _loopName(self):
@@ -193,12 +785,224 @@ class InteractiveLoop(InteractiveCommand):
 
   ####################################################################
   def _postLoop(self):
-    return
+    """Invoked as the loop ends; reports the summary of the lines timed,
+    if any.
+    """
+    if self.__timer.lines > 0:
+      print(self.__timer.summary(), file = sys.stderr)
 
   ####################################################################
   def _preLoop(self, arg):
     pass
 
+  ####################################################################
+  def _runBatch(self):
+    """Executes the batch specified by --batch and --jobs, raising
+    SystemExit with the aggregate status if any line failed.
+    """
+    status = self.runBatch(self._batchSource,
+                           workers = getattr(self.args, "loopJobs", 1))
+    if status != 0:
+      raise SystemExit(status)
+
+  ####################################################################
+  def _runJob(self, pipeline, commands):
+    """Executes, in the job's thread, a background job's pipeline or, if
+    None, its sole command.
+    """
+    if pipeline is not None:
+      return pipeline.run()
+    return commands[0].execute()
+
+  ####################################################################
+  # Private instance-behavior methods
+  ####################################################################
+  def __run(self, arg):
+    if self._batchSource is not None:
+      return self._runBatch()
+
+    self._preLoop(arg)
+
+    # Establish the user interface.
+    userInterface = self._interfaceClass(self,
+                                         "{0} > "
+                                          .format(self._loopName))
+
+    # Execute the loop.
+    with _ReadlineSession(self._historyPath(), userInterface):
+      try:
+        while True:
+          try:
+            userInterface.cmdloop()
+          except StopIteration:
+            # User requested quit.
+            raise
+          except EOFError:
+            # User requested end of this loop.
+            print("\n")
+            break
+          except SystemExit:
+            # Raised by argument parser.
+            pass
+          except Exception as ex:
+            print(ex)
+      finally:
+        self._postLoop()
+
+########################################################################
+########################################################################
+class AsyncInteractiveLoop(InteractiveLoop):
+  """An InteractiveLoop whose run() is a coroutine; commands are
+  instantiated via makeItemAsync() and those whose run() is a coroutine
+  function are awaited on the event loop rather than each being given an
+  event loop of their own.
+
+  When run from a CommandShell, or from a synchronous loop, the loop is
+  driven on a new event loop; when run from another AsyncInteractiveLoop it
+  shares its event loop.  Only the blocking read of the next input line is
+  performed off the event loop, on its default executor, so that other tasks
+  progress while awaiting input.
+  """
+  ####################################################################
+  # Public instance-behavior methods
+  ####################################################################
+  def makeCommandItemAndRun(self, commandLine = None):
+    return self.makeCommandItemAndRunAsync(commandLine)
+
+  ####################################################################
+  def foregroundJob(self, identifier = None):
+    return self.__offLoop(super(AsyncInteractiveLoop, self).foregroundJob,
+                          identifier)
+
+  ####################################################################
+  async def makeCommandItemAndRunAsync(self, commandLine = None):
+    pipeline = self._makePipeline(commandLine)
+    if pipeline is not None:
+      # The pipeline's stages block; run it off the event loop.
+      import asyncio
+      with CommandLineTimer.phase("run"):
+        return await asyncio.get_running_loop().run_in_executor(None,
+                                                                pipeline.run)
+    command = await self.makeCommandItemAsync(commandLine)
+    with CommandLineTimer.phase("run"):
+      return await command.executeAsync()
+
+  ####################################################################
+  def waitJobs(self, identifier = None):
+    return self.__offLoop(super(AsyncInteractiveLoop, self).waitJobs,
+                          identifier)
+
+  ####################################################################
+  # Overridden class-behavior methods
+  ####################################################################
+  @classmethod
+  async def makeCommandItemAsync(cls, commandLine = None):
+    return await cls._commandRootClass().makeCommandItemAsync(commandLine)
+
+  ####################################################################
+  # Overridden instance-behavior methods
+  ####################################################################
+  async def run(self, arg = None):
+    with instrument.Tracer.span("interactive.run",
+                                {"interactive.loop" : self._loopName,
+                                 "interactive.batch" :
+                                    self._batchSource is not None}):
+      return await self.__run(arg)
+
+  ####################################################################
+  # Protected instance-behavior methods
+  ####################################################################
+  def _runJob(self, pipeline, commands):
+    # A sole command is initialized as by makeItemAsync() and executed on an
+    # event loop of the job's own.
+    if pipeline is not None:
+      return pipeline.run()
+    import asyncio
+    return asyncio.run(self.__runJobAsync(commands[0]))
+
+  ####################################################################
+  # Private instance-behavior methods
+  ####################################################################
+  async def __offLoop(self, function, *args):
+    # Executes the blocking function on the event loop's default executor.
+    import asyncio
+    return await asyncio.get_running_loop().run_in_executor(
+                                            None,
+                                            functools.partial(function, *args))
+
+  ####################################################################
+  def __readLine(self, userInterface):
+    # Read the next line of input in the manner of cmd.Cmd.cmdloop().
+    if userInterface.use_rawinput:
+      try:
+        line = input(userInterface.prompt)
+      except EOFError:
+        line = "EOF"
+    else:
+      userInterface.stdout.write(userInterface.prompt)
+      userInterface.stdout.flush()
+      line = userInterface.stdin.readline()
+      line = "EOF" if not len(line) else line.rstrip("\r\n")
+    return line
+
+  ####################################################################
+  async def __run(self, arg):
+    if self._batchSource is not None:
+      # The batch's commands block, driving any coroutines on event loops of
+      # their own; execute it off the event loop.
+      import asyncio
+      return await asyncio.get_running_loop().run_in_executor(None,
+                                                              self._runBatch)
+
+    self._preLoop(arg)
+
+    # Establish the user interface.
+    userInterface = self._interfaceClass(self,
+                                         "{0} > "
+                                          .format(self._loopName))
+
+    # Execute the loop.  asyncio is imported here, within a running event
+    # loop, so that synchronous loops do not import it.
+    import asyncio
+    eventLoop = asyncio.get_running_loop()
+    with _ReadlineSession(self._historyPath(), userInterface):
+      try:
+        while True:
+          # The line is read in the context of the loop so that, e.g., an
+          # InteractiveServer session's stdin is that of its client.
+          line = await eventLoop.run_in_executor(
+                        None,
+                        functools.partial(contextvars.copy_context().run,
+                                          self.__readLine,
+                                          userInterface))
+          try:
+            result = userInterface.onecmd(line)
+            if isinstance(result, collections.abc.Awaitable):
+              await result
+          except StopIteration:
+            # User requested quit.
+            raise
+          except EOFError:
+            # User requested end of this loop.
+            print("\n")
+            break
+          except SystemExit:
+            # Raised by argument parser.
+            pass
+          except Exception as ex:
+            ex = self._translateAsyncException(ex)
+            if isinstance(ex, StopIteration):
+              # User requested quit from within a nested loop.
+              raise ex
+            print(ex)
+      finally:
+        self._postLoop()
+
+  ####################################################################
+  async def __runJobAsync(self, command):
+    await command._initializeAsync()
+    return await command.executeAsync()
+
 ########################################################################
 ########################################################################
 class _NonExitingArgumentParser(argparse.ArgumentParser):
@@ -208,10 +1012,12 @@ class _NonExitingArgumentParser(argparse.ArgumentParser):
   def exit(self, status = 0, message = None):
     # Intercept exit.
     # Print the message, if any.
-    # Raise SystemExit to trap on.
+    # Raise SystemExit to trap on.  It carries argparse's status, rather
+    # than None, so that a batch reports a rejected line as failed; loops
+    # trap SystemExit regardless of its status.
     if message is not None:
       print(message)
-    raise SystemExit
+    raise SystemExit(status)
 
 ########################################################################
 ########################################################################
@@ -0,0 +1,346 @@
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+from __future__ import print_function
+
+import contextvars
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+
+from . import client
+from .CommandBatch import CommandBatch
+
+log = logging.getLogger(__name__)
+
+# The (stdin, stdout, stderr) of the session of the current context; None
+# outside of sessions.
+_sessionStreams = contextvars.ContextVar("sessionStreams", default = None)
+
+########################################################################
+########################################################################
+class _SessionStream(object):
+  """Proxy for one of sys.stdin, sys.stdout or sys.stderr which routes to
+  the corresponding stream of the current context's session; outside of
+  sessions to the proxied stream.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @property
+  def proxied(self):
+    return self.__proxied
+
+  ####################################################################
+  def fileno(self):
+    return self.__stream().fileno()
+
+  ####################################################################
+  def flush(self):
+    self.__stream().flush()
+
+  ####################################################################
+  def isatty(self):
+    return self.__stream().isatty()
+
+  ####################################################################
+  def read(self, *args):
+    return self.__stream().read(*args)
+
+  ####################################################################
+  def readline(self, *args):
+    return self.__stream().readline(*args)
+
+  ####################################################################
+  def write(self, text):
+    return self.__stream().write(text)
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, index, proxied):
+    super(_SessionStream, self).__init__()
+    self.__index = index
+    self.__proxied = proxied
+
+  ####################################################################
+  def __getattr__(self, name):
+    return getattr(self.__stream(), name)
+
+  ####################################################################
+  def __iter__(self):
+    return iter(self.__stream())
+
+  ####################################################################
+  # Private methods
+  ####################################################################
+  def __stream(self):
+    streams = _sessionStreams.get()
+    return self.__proxied if streams is None else streams[self.__index]
+
+########################################################################
+########################################################################
+class InteractiveServer(object):
+  """Serves sessions of an InteractiveLoop class to concurrent clients over
+  a Unix domain socket from a resident process whose expensive state
+  (defaults, factory mappings and argument parsers, caches held by the
+  commands' classes) is established once and shared by all sessions.
+
+  Each session executes in a thread of its own with a loop instance of its
+  own; per-session state, e.g., jobs and completion, is thus isolated.  The
+  client's arguments are parsed as those of the loop and its stdin, stdout
+  and stderr become those of the session: while serving, sys.stdin,
+  sys.stdout and sys.stderr are replaced by proxies routing each session's
+  use to its client.  The routing follows the session's context, including
+  into the tasks of an asynchronous loop, but not into threads the commands
+  start themselves.  The environment and working directory are those of the
+  server.  The exit status of the loop is returned to the client.
+
+  The socket is accessible only by the server's user, and connections of
+  any other user (per their credentials, where available) are rejected.
+
+  The client side is that of CommandServer; see the client module.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @property
+  def path(self):
+    return self.__path
+
+  ####################################################################
+  def serve(self):
+    """Accepts and executes sessions until shutdown() is invoked; then
+    ends the connections of the sessions remaining, ending their clients,
+    and waits up to _shutdownTimeout() seconds for them to end.  Sessions
+    which do not, e.g., those blocked reading a terminal, are abandoned.
+    """
+    self.__listener = client.listen(self.path)
+    proxies = self.__installProxies()
+    try:
+      self.__listener.settimeout(self._pollInterval())
+      self.__listening.set()
+      log.debug("serving {0}".format(self.path))
+
+      while not self.__shutdown.is_set():
+        try:
+          (connection, address) = self.__listener.accept()
+        except socket.timeout:
+          continue
+        self._accept(connection)
+    finally:
+      self.__listener.close()
+      self.__listening.clear()
+      try:
+        os.unlink(self.path)
+      except FileNotFoundError:
+        pass
+      self.__waitSessions()
+      self.__removeProxies(proxies)
+
+  ####################################################################
+  def sessions(self):
+    """Returns the number of sessions executing.
+    """
+    with self.__lock:
+      return len(self.__sessions)
+
+  ####################################################################
+  def shutdown(self):
+    """Requests that serve() return.
+    """
+    self.__shutdown.set()
+
+  ####################################################################
+  def waitUntilServing(self, timeout = None):
+    """Waits until the server is accepting sessions returning True if it
+    is.
+    """
+    return self.__listening.wait(timeout)
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, loopClass, path):
+    super(InteractiveServer, self).__init__()
+    self.__loopClass = loopClass
+    self.__path = path
+    self.__listener = None
+    self.__listening = threading.Event()
+    self.__shutdown = threading.Event()
+    # The connection of each session, by the session's thread.
+    self.__sessions = {}
+    self.__sessionCount = 0
+    self.__lock = threading.Lock()
+
+    # Warm the state shared by all sessions.
+    loopClass._argumentParser()
+    rootClass = loopClass._commandRootClass()
+    rootClass.choices()
+    rootClass._argumentParser()
+
+  ####################################################################
+  # Protected methods
+  ####################################################################
+  def _accept(self, connection):
+    # The request is received by the session's thread so that a client
+    # which does not send it delays no other.
+    if not client.peerAuthorized(connection):
+      log.warning("rejected connection of another user")
+      connection.close()
+      return
+
+    with self.__lock:
+      self.__sessionCount += 1
+      thread = threading.Thread(target = self.__session,
+                                args = (connection,),
+                                name = "session-{0}"
+                                        .format(self.__sessionCount),
+                                daemon = True)
+      self.__sessions[thread] = connection
+    thread.start()
+
+  ####################################################################
+  def _execute(self, request):
+    """Executes the session's loop returning the exit status.
+    """
+    status = 0
+    loop = None
+    try:
+      args = self.__loopClass._argumentParser().parse_args(request["argv"])
+      loop = self.__loopClass(args)
+      loop.execute()
+    except StopIteration:
+      # User requested quit.
+      pass
+    except SystemExit as ex:
+      if isinstance(ex.code, str):
+        print(ex.code, file = sys.stderr)
+      status = CommandBatch.exitStatus(ex)
+    except BaseException:
+      traceback.print_exc()
+      status = 1
+    finally:
+      if loop is not None:
+        for job in loop.jobs.jobs():
+          job.kill()
+    return status
+
+  ####################################################################
+  def _pollInterval(self):
+    """Returns the number of seconds between checks for shutdown.
+    """
+    return 0.1
+
+  ####################################################################
+  def _requestTimeout(self):
+    """Returns the number of seconds a client has to send its request.
+    """
+    return 10
+
+  ####################################################################
+  def _shutdownTimeout(self):
+    """Returns the number of seconds serve() waits, upon shutdown, for the
+    sessions to end.
+    """
+    return 5
+
+  ####################################################################
+  # Private methods
+  ####################################################################
+  def __installProxies(self):
+    proxies = (_SessionStream(0, sys.stdin), _SessionStream(1, sys.stdout),
+               _SessionStream(2, sys.stderr))
+    (sys.stdin, sys.stdout, sys.stderr) = proxies
+    return proxies
+
+  ####################################################################
+  def __removeProxies(self, proxies):
+    # Restore each stream unless it has since been replaced.
+    if sys.stdin is proxies[0]:
+      sys.stdin = proxies[0].proxied
+    if sys.stdout is proxies[1]:
+      sys.stdout = proxies[1].proxied
+    if sys.stderr is proxies[2]:
+      sys.stderr = proxies[2].proxied
+
+  ####################################################################
+  def __receive(self, connection):
+    # Returns the tuple of the request and the session's streams; None if
+    # the request is invalid.
+    connection.settimeout(self._requestTimeout())
+    try:
+      (request, fds) = client.receiveRequest(connection)
+    except (EOFError, OSError, ValueError) as ex:
+      log.warning("invalid request: {0}".format(ex))
+      return None
+    connection.settimeout(None)
+    if len(fds) != 3:
+      log.warning("invalid request: {0} descriptors".format(len(fds)))
+      for fd in fds:
+        os.close(fd)
+      return None
+    return (request, [open(fd, mode, closefd = True)
+                        for (fd, mode) in zip(fds, ("r", "w", "w"))])
+
+  ####################################################################
+  def __session(self, connection):
+    status = client.STATUS_UNKNOWN
+    received = self.__receive(connection)
+    if received is None:
+      with self.__lock:
+        self.__sessions.pop(threading.current_thread(), None)
+      connection.close()
+      return
+
+    (request, streams) = received
+    try:
+      _sessionStreams.set(streams)
+      log.debug("session {0} started".format(threading.current_thread().name))
+      status = self._execute(request)
+    finally:
+      for stream in streams:
+        try:
+          stream.close()
+        except OSError:
+          pass
+      with self.__lock:
+        self.__sessions.pop(threading.current_thread(), None)
+      try:
+        connection.sendall("{0}\n".format(status).encode())
+      except OSError:
+        pass
+      connection.close()
+      log.debug("session {0} ended: {1}"
+                  .format(threading.current_thread().name, status))
+
+  ####################################################################
+  def __waitSessions(self):
+    # Shutting down the connections ends the clients; their streams then
+    # report end of file, or a broken pipe, to sessions using them.
+    with self.__lock:
+      connections = list(self.__sessions.values())
+    for connection in connections:
+      try:
+        connection.shutdown(socket.SHUT_RDWR)
+      except OSError:
+        pass
+
+    deadline = time.monotonic() + self._shutdownTimeout()
+    while True:
+      with self.__lock:
+        sessions = list(self.__sessions)
+      if len(sessions) == 0:
+        break
+      remaining = deadline - time.monotonic()
+      if remaining <= 0:
+        log.warning("abandoning {0} session(s) at shutdown"
+                      .format(len(sessions)))
+        break
+      sessions[0].join(remaining)
@@ -3,12 +3,35 @@
 #
 # Copyright Red Hat
 #
-from .Command import Command
-from .CommandArgumentParser import (CommandArgumentParser,
-                                    CommandNullArgumentParser)
-from .CommandShell import CommandShell
-from .Interactive import (InteractiveCommand,
-                          InteractiveCommandArgumentParser,
-                          InteractiveCommandNullArgumentParser,
-                          InteractiveLoop,
-                          InteractiveInterface)
+# The package's attributes are provided lazily, importing the submodule
+# defining an attribute upon first access; see mill._lazy.
+from mill import _lazy
+
+(__getattr__, __dir__) = _lazy.lazyAttributes(globals(), {
+  "Command"                              : ".Command",
+  "CommandArgumentParser"                : ".CommandArgumentParser",
+  "CommandNullArgumentParser"            : ".CommandArgumentParser",
+  "CommandBatch"                         : ".CommandBatch",
+  "CommandBatchResult"                   : ".CommandBatch",
+  "CommandCache"                         : ".CommandCache",
+  "CommandCancellation"                  : ".CommandCancellation",
+  "CommandCancelledException"            : ".CommandCancellation",
+  "CommandCompletion"                    : ".CommandCompletion",
+  "CommandTimeoutException"              : ".CommandCancellation",
+  "CommandJob"                           : ".CommandJobs",
+  "CommandJobs"                          : ".CommandJobs",
+  "CommandLineTimer"                     : ".CommandLineTimer",
+  "CommandMetrics"                       : ".CommandMetrics",
+  "CommandPipeline"                      : ".CommandPipeline",
+  "CommandProfiler"                      : ".CommandProfiler",
+  "CommandRecordWriter"                  : ".CommandRecordWriter",
+  "CommandServer"                        : ".CommandServer",
+  "CommandShell"                         : ".CommandShell",
+  "AsyncInteractiveLoop"                 : ".Interactive",
+  "InteractiveCommand"                   : ".Interactive",
+  "InteractiveCommandArgumentParser"     : ".Interactive",
+  "InteractiveCommandNullArgumentParser" : ".Interactive",
+  "InteractiveLoop"                      : ".Interactive",
+  "InteractiveInterface"                 : ".Interactive",
+  "InteractiveServer"                    : ".InteractiveServer"
+})
@@ -0,0 +1,130 @@
+#! /usr/bin/env python
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+"""Thin client forwarding an invocation to a CommandServer or a session to
+an InteractiveServer.
+
+This module deliberately imports nothing from mill so that it can be
+executed directly, by path, paying only the cost of the interpreter's
+startup:
+
+  python3 -S client.py <socket-path> [argument ...]
+
+The arguments, environment and current working directory are forwarded to
+the server together with the client's stdin, stdout and stderr file
+descriptors; the command's output thus goes directly to the client's
+streams.  The client exits with the exit status of the command.
+"""
+import json
+import os
+import socket
+import struct
+import sys
+
+# Request header: the length of the JSON-encoded request that follows.
+HEADER = struct.Struct("!I")
+
+# Exit status reported if the server fails to report one.
+STATUS_UNKNOWN = 255
+
+#############################################################################
+def listen(path):
+  """Returns a socket listening at the path which is accessible only by the
+  user; any existing file at the path is replaced.
+  """
+  listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    try:
+      os.unlink(path)
+    except FileNotFoundError:
+      pass
+    listener.bind(path)
+    # Connections are refused until listening; there is thus no window in
+    # which the socket is accessible per the umask.
+    os.chmod(path, 0o600)
+    listener.listen()
+  except BaseException:
+    listener.close()
+    raise
+  return listener
+
+#############################################################################
+def peerAuthorized(connection):
+  """Returns whether the peer of the connection is the user, or root, per
+  its credentials.  Where the credentials are unavailable the access
+  permitted by listen() is relied upon.
+  """
+  if not hasattr(socket, "SO_PEERCRED"):
+    return True
+  credentials = struct.Struct("3i")
+  (pid, uid, gid) = credentials.unpack(
+                      connection.getsockopt(socket.SOL_SOCKET,
+                                            socket.SO_PEERCRED,
+                                            credentials.size))
+  return uid in (0, os.getuid())
+
+#############################################################################
+def receiveRequest(connection):
+  """Returns a tuple of the request dictionary and the list of file
+  descriptors received from the client.
+  """
+  (data, fds, flags, address) = socket.recv_fds(connection, HEADER.size, 3)
+  while len(data) < HEADER.size:
+    chunk = connection.recv(HEADER.size - len(data))
+    if len(chunk) == 0:
+      raise EOFError("connection closed receiving request")
+    data += chunk
+
+  (length,) = HEADER.unpack(data)
+  data = b""
+  while len(data) < length:
+    chunk = connection.recv(length - len(data))
+    if len(chunk) == 0:
+      raise EOFError("connection closed receiving request")
+    data += chunk
+  return (json.loads(data.decode("utf-8")), list(fds))
+
+#############################################################################
+def run(path, argv, fds = (0, 1, 2), environment = None, cwd = None):
+  """Forwards the invocation to the server listening at the path and
+  returns the exit status of the command.
+  """
+  request = json.dumps({
+    "argv" : list(argv),
+    "environment" : dict(os.environ if environment is None else environment),
+    "cwd" : os.getcwd() if cwd is None else cwd
+  }).encode("utf-8")
+
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+    connection.connect(path)
+    socket.send_fds(connection, [HEADER.pack(len(request))], list(fds))
+    connection.sendall(request)
+
+    response = b""
+    while True:
+      chunk = connection.recv(64)
+      if len(chunk) == 0:
+        break
+      response += chunk
+
+  try:
+    return int(response.decode("utf-8").strip())
+  except ValueError:
+    return STATUS_UNKNOWN
+
+#############################################################################
+def main(argv):
+  if len(argv) < 1:
+    print("usage: client.py <socket-path> [argument ...]", file = sys.stderr)
+    return 2
+  sys.stdout.flush()
+  sys.stderr.flush()
+  return run(argv[0], argv[1:])
+
+#############################################################################
+#############################################################################
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
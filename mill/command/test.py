@@ -0,0 +1,1886 @@
+#! /usr/bin/env python
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+
+import argparse
+import array
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import os
+import pstats
+import shutil
+import signal
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from mill import command, instrument
+from mill.command import client
+
+#############################################################################
+#############################################################################
+class ShellCommand(command.Command):
+  _commandOptions = frozenset(["ndjson", "phase-times", "profile", "timeout",
+                               "trace-malloc"])
+
+  @classmethod
+  def parserName(cls):
+    return "test"
+
+#############################################################################
+class Echo(ShellCommand):
+  _available = True
+
+  ####################################################################
+  def run(self):
+    print("echo")
+    return "echo"
+
+#############################################################################
+class Sleep(ShellCommand):
+  _available = True
+
+  ####################################################################
+  async def run(self):
+    await asyncio.sleep(0)
+    print("sleep")
+    return "sleep"
+
+#############################################################################
+class Fail(ShellCommand):
+  _available = True
+
+  ####################################################################
+  def run(self):
+    raise RuntimeError("failed")
+
+#############################################################################
+class Slow(ShellCommand):
+  _available = True
+
+  ####################################################################
+  def run(self):
+    for count in range(100):
+      self.partialResult = count
+      if self.cancellation.wait(0.05):
+        break
+    return self.partialResult
+
+#############################################################################
+class SlowAsync(ShellCommand):
+  _available = True
+  _name = "slow-async"
+
+  ####################################################################
+  async def run(self):
+    for count in range(100):
+      self.partialResult = count
+      await asyncio.sleep(0.05)
+    return self.partialResult
+
+#############################################################################
+class Hung(ShellCommand):
+  _available = True
+
+  ####################################################################
+  def run(self):
+    # Ignores cancellation.
+    time.sleep(3)
+    return "hung"
+
+#############################################################################
+class HungAsync(ShellCommand):
+  _available = True
+  _name = "hung-async"
+
+  ####################################################################
+  async def run(self):
+    # Handles cancellation but takes too long to return.
+    try:
+      await asyncio.sleep(3)
+    except asyncio.CancelledError:
+      await asyncio.sleep(3)
+    return "hung"
+
+#############################################################################
+class Spin(ShellCommand):
+  _available = True
+
+  ####################################################################
+  def run(self):
+    end = time.thread_time() + 0.2
+    while time.thread_time() < end:
+      pass
+    return "spin"
+
+#############################################################################
+class Records(ShellCommand):
+  _available = True
+
+  ####################################################################
+  def run(self):
+    self.emit({"emitted" : True})
+    return ({"index" : x, "name" : "r\u00e9cord"} for x in range(3))
+
+#############################################################################
+class Cached(ShellCommand):
+  _available = True
+  _cacheable = True
+  directory = None
+  executions = 0
+
+  ####################################################################
+  @classmethod
+  def parserParents(cls):
+    parser = argparse.ArgumentParser(add_help = False)
+    parser.add_argument("--value", type = int, default = 0)
+    parents = super(Cached, cls).parserParents()
+    parents.append(parser)
+    return parents
+
+  ####################################################################
+  @classmethod
+  def _cacheDirectory(cls):
+    return cls.directory
+
+  ####################################################################
+  def run(self):
+    type(self).executions += 1
+    return {"value" : self.args.value, "execution" : self.executions}
+
+#############################################################################
+class Memo(ShellCommand):
+  # Cached only in memory.
+  _available = True
+  _cacheable = True
+
+  ####################################################################
+  @classmethod
+  def _cacheDirectory(cls):
+    return None
+
+  ####################################################################
+  def run(self):
+    return "memo"
+
+#############################################################################
+class Count(ShellCommand):
+  _available = True
+
+  ####################################################################
+  def run(self):
+    for count in range(1000):
+      self.partialResult = count
+      yield count
+
+#############################################################################
+class Double(ShellCommand):
+  _available = True
+
+  ####################################################################
+  def run(self):
+    for record in self.input:
+      yield record * 2
+
+#############################################################################
+class First(ShellCommand):
+  _available = True
+
+  ####################################################################
+  def run(self):
+    return list(itertools.islice(self.input, 3))
+
+#############################################################################
+class Total(ShellCommand):
+  _available = True
+
+  ####################################################################
+  def run(self):
+    return sum(self.input)
+
+#############################################################################
+class Drip(ShellCommand):
+  _available = True
+
+  ####################################################################
+  def run(self):
+    for count in range(100):
+      if self.cancellation.wait(0.05):
+        return
+      yield count
+
+#############################################################################
+class Words(ShellCommand):
+  _available = True
+
+  ####################################################################
+  @classmethod
+  def parserParents(cls):
+    parser = argparse.ArgumentParser(add_help = False)
+    parser.add_argument("words", nargs = "*")
+    parents = super(Words, cls).parserParents()
+    parents.append(parser)
+    return parents
+
+  ####################################################################
+  def run(self):
+    return " ".join(self.args.words)
+
+#############################################################################
+#############################################################################
+class OwnOptionsCommand(command.Command):
+  @classmethod
+  def parserName(cls):
+    return "own"
+
+#############################################################################
+class OwnTimeout(OwnOptionsCommand):
+  _available = True
+  _name = "wait"
+
+  ####################################################################
+  @classmethod
+  def parserParents(cls):
+    parser = argparse.ArgumentParser(add_help = False)
+    parser.add_argument("--timeout", dest = "waitTimeout", type = int)
+    parents = super(OwnTimeout, cls).parserParents()
+    parents.append(parser)
+    return parents
+
+  ####################################################################
+  def run(self):
+    return self.args.waitTimeout
+
+#############################################################################
+#############################################################################
+class LoopCommand(command.InteractiveCommand):
+  pass
+
+#############################################################################
+class InteractiveEcho(LoopCommand):
+  _available = True
+  _name = "echo"
+
+  ####################################################################
+  def run(self, arg = None):
+    print("echo")
+
+#############################################################################
+class InteractiveSleep(LoopCommand):
+  _available = True
+  _name = "sleep"
+
+  ####################################################################
+  async def run(self, arg = None):
+    await asyncio.sleep(0)
+    print("sleep")
+
+#############################################################################
+class InteractiveFail(LoopCommand):
+  _available = True
+  _name = "fail"
+
+  ####################################################################
+  def run(self, arg = None):
+    raise RuntimeError("failed")
+
+#############################################################################
+class InteractiveCount(LoopCommand):
+  _available = True
+  _name = "count"
+
+  ####################################################################
+  def run(self, arg = None):
+    return iter(range(10))
+
+#############################################################################
+class InteractiveTotal(LoopCommand):
+  _available = True
+  _name = "total"
+
+  ####################################################################
+  def run(self, arg = None):
+    print("total {0}".format(sum(self.input)))
+
+#############################################################################
+class InteractiveWords(LoopCommand):
+  _available = True
+  _name = "words"
+
+  ####################################################################
+  @classmethod
+  def parserParents(cls):
+    parser = argparse.ArgumentParser(add_help = False)
+    parser.add_argument("words", nargs = "*")
+    parents = super(InteractiveWords, cls).parserParents()
+    parents.append(parser)
+    return parents
+
+  ####################################################################
+  def run(self, arg = None):
+    print(" ".join(self.args.words))
+
+#############################################################################
+class InteractiveWarn(LoopCommand):
+  _available = True
+  _name = "warn"
+
+  ####################################################################
+  def run(self, arg = None):
+    print("warning", file = sys.stderr)
+
+#############################################################################
+class InteractiveSpin(LoopCommand):
+  _available = True
+  _name = "spin"
+
+  ####################################################################
+  def run(self, arg = None):
+    print("spinning")
+    self.cancellation.wait(10)
+    self.cancellation.check()
+    return "spun"
+
+#############################################################################
+#############################################################################
+class CompletionCommand(command.InteractiveCommand):
+  pass
+
+#############################################################################
+class CompletionReport(CompletionCommand):
+  _available = True
+  _name = "report"
+
+  ####################################################################
+  @classmethod
+  def parserParents(cls):
+    parser = argparse.ArgumentParser(add_help = False)
+    parser.add_argument("--format")
+    parser.add_argument("--full", action = "store_true")
+    parents = super(CompletionReport, cls).parserParents()
+    parents.append(parser)
+    return parents
+
+#############################################################################
+class CompletionRepeat(CompletionCommand):
+  _available = True
+  _name = "repeat"
+
+#############################################################################
+class CompletionLoop(command.InteractiveLoop):
+  ####################################################################
+  @classmethod
+  def _commandRootClass(cls):
+    return CompletionCommand
+
+#############################################################################
+#############################################################################
+class ShadowCommand(command.InteractiveCommand):
+  pass
+
+#############################################################################
+class ShadowProfile(ShadowCommand):
+  _available = True
+  _name = "profile"
+
+  ####################################################################
+  def run(self, arg = None):
+    print("shadowed")
+
+#############################################################################
+class ShadowLoop(command.InteractiveLoop):
+  ####################################################################
+  @classmethod
+  def _commandRootClass(cls):
+    return ShadowCommand
+
+#############################################################################
+#############################################################################
+class SyncLoop(command.InteractiveLoop):
+  _pipelines = True
+
+  ####################################################################
+  @classmethod
+  def _commandRootClass(cls):
+    return LoopCommand
+
+#############################################################################
+class AsyncLoop(command.AsyncInteractiveLoop):
+  _pipelines = True
+
+  ####################################################################
+  @classmethod
+  def _commandRootClass(cls):
+    return LoopCommand
+
+#############################################################################
+class PlainLoop(SyncLoop):
+  _pipelines = False
+
+#############################################################################
+class BriefStopPipeline(command.CommandPipeline):
+  ####################################################################
+  def _stopTimeout(self):
+    return 0.2
+
+#############################################################################
+#############################################################################
+class Test_CommandBase(unittest.TestCase):
+
+  ####################################################################
+  # Returns the output of the interface executing the line.
+  def runLine(self, loop, line):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+      loop._interfaceClass(loop, "> ").onecmd(line)
+    return output.getvalue()
+
+  ####################################################################
+  # Returns the stdout from running the callable with the specified stdin.
+  def runWithInput(self, function, text = ""):
+    stdin = sys.stdin
+    sys.stdin = io.StringIO(text)
+    try:
+      output = io.StringIO()
+      with contextlib.redirect_stdout(output):
+        function()
+    finally:
+      sys.stdin = stdin
+    return output.getvalue()
+
+  ####################################################################
+  # Returns the stdout from running the CommandShell with the arguments.
+  def runShell(self, factoryClass, *args, **kwargs):
+    argv = sys.argv
+    sys.argv = ["test"] + list(args)
+    try:
+      output = io.StringIO()
+      with contextlib.redirect_stdout(output):
+        result = command.CommandShell(factoryClass, **kwargs).run()
+    finally:
+      sys.argv = argv
+    return (result, output.getvalue())
+
+#############################################################################
+#############################################################################
+class Test_CommandAsync(Test_CommandBase):
+
+  ####################################################################
+  # The shell drives a coroutine run() to completion.
+  def test_shell(self):
+    self.assertEqual(self.runShell(ShellCommand, "sleep"),
+                     ("sleep", "sleep\n"))
+    self.assertEqual(self.runShell(ShellCommand, "echo"), ("echo", "echo\n"))
+
+  ####################################################################
+  # The shell may be awaited from a running event loop.
+  def test_shellAsync(self):
+    argv = sys.argv
+    sys.argv = ["test", "sleep"]
+    try:
+      with contextlib.redirect_stdout(io.StringIO()):
+        result = asyncio.run(command.CommandShell(ShellCommand).runAsync())
+    finally:
+      sys.argv = argv
+    self.assertEqual(result, "sleep")
+
+  ####################################################################
+  # Items may be made asynchronously.
+  def test_makeItemAsync(self):
+    item = asyncio.run(ShellCommand.makeItemAsync("echo"))
+    self.assertTrue(isinstance(item, Echo))
+
+  ####################################################################
+  # A synchronous loop runs coroutine commands.
+  def test_loop(self):
+    output = self.runWithInput(lambda: SyncLoop(None).run(),
+                               "sleep\necho\nfail\n")
+    self.assertIn("sleep", output)
+    self.assertIn("echo", output)
+    self.assertIn("failed", output)
+
+  ####################################################################
+  # The asynchronous loop runs both kinds of command and honors quit.
+  def test_asyncLoop(self):
+    output = self.runWithInput(lambda: AsyncLoop(None).execute(),
+                               "sleep\necho\nfail\nno-such-command\n")
+    self.assertEqual([x for x in output.split() if x in ("sleep", "echo")],
+                     ["sleep", "echo"])
+    self.assertIn("failed", output)
+
+    with self.assertRaises(StopIteration):
+      self.runWithInput(lambda: AsyncLoop(None).execute(),
+                        "quit\necho\n")
+
+#############################################################################
+#############################################################################
+class Test_CommandBatch(Test_CommandBase):
+  lines = ["echo", "", "# comment", "sleep", "fail", "no-such-command",
+           "echo"] * 3
+
+  ####################################################################
+  # Returns the results of running the batch.
+  def runBatch(self, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+      with contextlib.redirect_stderr(io.StringIO()):
+        shell = command.CommandShell(ShellCommand)
+        return list(shell.iterateBatch(self.lines, **kwargs))
+
+  ####################################################################
+  # Checks the results are those expected, optionally in order.
+  def checkResults(self, results, ordered = True):
+    expected = [(1, "echo", 0), (4, "sleep", 0), (5, None, 1), (6, None, 2),
+                (7, "echo", 0)]
+    expected = [(lineNumber + (7 * x), result, status)
+                  for x in range(3)
+                    for (lineNumber, result, status) in expected]
+    actual = [(x.lineNumber, x.result, x.status) for x in results]
+    if not ordered:
+      actual.sort()
+    self.assertEqual(actual, expected)
+
+  ####################################################################
+  # Lines are executed inline.
+  def test_inline(self):
+    self.checkResults(self.runBatch())
+
+  ####################################################################
+  # Lines are executed on a thread pool.
+  def test_threads(self):
+    self.checkResults(self.runBatch(workers = 4))
+    self.checkResults(self.runBatch(workers = 4, ordered = False),
+                      ordered = False)
+
+  ####################################################################
+  # Lines are executed on a process pool.
+  def test_processes(self):
+    self.checkResults(self.runBatch(workers = 2, processes = True))
+
+  ####################################################################
+  # The aggregate status is the greatest of the line statuses.
+  def test_status(self):
+    shell = command.CommandShell(ShellCommand)
+    with contextlib.redirect_stdout(io.StringIO()):
+      with contextlib.redirect_stderr(io.StringIO()):
+        self.assertEqual(shell.runBatch(["echo", "sleep"]), 0)
+        self.assertEqual(shell.runBatch(["echo", "fail"], workers = 2), 1)
+        self.assertEqual(shell.runBatch(self.lines), 2)
+
+#############################################################################
+#############################################################################
+class Test_CommandJobs(Test_CommandBase):
+
+  ####################################################################
+  # Returns the loop's output for the input; any jobs left running are
+  # killed.
+  def runLoop(self, loop, text):
+    try:
+      return self.runWithInput(lambda: loop.execute(), text)
+    finally:
+      for job in loop.jobs.jobs():
+        job.kill()
+        job.wait()
+
+  ####################################################################
+  # A trailing '&' executes the command in the background; wait displays
+  # its buffered output and status.
+  def test_wait(self):
+    for (loopClass, name) in ((SyncLoop, "echo"), (AsyncLoop, "sleep")):
+      output = self.runLoop(loopClass(None), "{0} &\nwait\n".format(name))
+      self.assertIn("[1] {0}\n".format(name), output)
+      self.assertIn("{0}\n[1] Done     {0}\n".format(name), output)
+      self.assertFalse(type(sys.stdout).__name__ == "_JobOutput")
+
+  ####################################################################
+  # Jobs are listed and killed.
+  def test_kill(self):
+    output = self.runLoop(SyncLoop(None),
+                          "spin &\nspin &\njobs\nkill\nkill %1\nwait\n"
+                          "kill 9\n")
+    self.assertIn("[1] Running  spin\n[2] Running  spin\n", output)
+    self.assertIn("[1] Killed   spin: command cancelled", output)
+    self.assertIn("[2] Killed   spin: command cancelled", output)
+    self.assertEqual(output.count("spinning"), 2)
+    self.assertIn("no such job: 9", output)
+
+  ####################################################################
+  # A job brought to the foreground displays its output and produces its
+  # result or exception.
+  def test_foreground(self):
+    loop = SyncLoop(None)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+      job = loop.startJob("spin")
+      threading.Timer(0.2, job.kill).start()
+      with self.assertRaises(command.CommandCancelledException):
+        loop.foregroundJob()
+      loop.startJob("echo")
+      self.assertIsNone(loop.foregroundJob(1))
+    self.assertEqual(output.getvalue(), "spin\nspinning\necho\necho\n")
+    self.assertEqual(len(loop.jobs), 0)
+
+  ####################################################################
+  # Finished jobs are reported before the next command; quit is unaffected
+  # by running jobs.
+  def test_finished(self):
+    loop = SyncLoop(None)
+    output = self.runLoop(loop, "fail &\n" + "sleep\n" * 20)
+    self.assertIn("[1] Failed   fail: failed", output)
+    self.assertEqual(len(loop.jobs), 0)
+
+    with self.assertRaises(StopIteration):
+      self.runLoop(SyncLoop(None), "spin &\nquit\n")
+
+  ####################################################################
+  # The job commands are described by the interface.
+  def test_help(self):
+    self.assertIn("jobs: lists the background jobs",
+                  self.runLine(SyncLoop(None), "help jobs"))
+    for name in ("fg", "kill", "quit", "wait"):
+      output = self.runLine(SyncLoop(None), "help {0}".format(name))
+      self.assertTrue(output.startswith(name), output)
+
+#############################################################################
+#############################################################################
+class Test_CommandCompletion(Test_CommandBase):
+
+  ####################################################################
+  # Command names, including those of the interface, are completed.
+  def test_names(self):
+    interface = command.InteractiveInterface(CompletionLoop(None), "> ")
+    self.assertEqual(interface.completenames("re"), ["repeat", "report"])
+    self.assertEqual(interface.completenames("rep"), ["repeat", "report"])
+    self.assertEqual(interface.completenames("repo"), ["report"])
+    self.assertEqual(interface.completenames("x"), [])
+    self.assertIn("jobs", interface.completenames(""))
+    self.assertIn("quit", CompletionLoop(None).completion.completeNames("q"))
+
+  ####################################################################
+  # The options of the command being entered, that following the last '|'
+  # of a pipeline, are completed.
+  def test_options(self):
+    completion = CompletionLoop(None).completion
+    self.assertEqual(completion.complete("report --f", "--f", 7),
+                     ["--format", "--full"])
+    self.assertEqual(completion.complete("report --full --h", "--h", 14),
+                     ["--help"])
+    self.assertEqual(completion.complete("report ", "", 7), [])
+    self.assertEqual(completion.complete("repeat | rep", "rep", 9),
+                     ["repeat", "report"])
+    self.assertEqual(completion.complete("repeat | report --fo", "--fo", 16),
+                     ["--format"])
+    self.assertEqual(completion.complete("unknown --f", "--f", 8), [])
+    self.assertEqual(completion.complete("report --f", "f", 9),
+                     ["format", "full"])
+
+  ####################################################################
+  # Commands defined after the completion is built are added to it.
+  def test_update(self):
+    completion = CompletionLoop(None).completion
+    self.assertEqual(completion.completeNames("rer"), [])
+
+    class CompletionRerun(CompletionCommand):
+      _available = True
+      _name = "rerun"
+
+    self.assertEqual(completion.completeNames("re"),
+                     ["repeat", "report", "rerun"])
+    self.assertIn("--help", completion.complete("rerun --", "--", 6))
+
+  ####################################################################
+  # The history file is readable by the user alone, whatever the umask or
+  # the mode of an existing file.
+  def test_historyMode(self):
+    try:
+      import readline
+    except ImportError:
+      self.skipTest("readline unavailable")
+    from mill.command.Interactive import _ReadlineSession
+
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, "history", "loop")
+      session = _ReadlineSession(path, command.InteractiveInterface(
+                                         CompletionLoop(None), "> "))
+      umask = os.umask(0o022)
+      try:
+        session._writeHistory(readline)
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+        os.chmod(path, 0o644)
+        session._writeHistory(readline)
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+      finally:
+        os.umask(umask)
+
+#############################################################################
+#############################################################################
+class Test_CommandLineTimer(Test_CommandBase):
+
+  ####################################################################
+  # Returns the stdout and stderr of running the loop with the input.
+  def runLoop(self, loop, text):
+    errors = io.StringIO()
+    with contextlib.redirect_stderr(errors):
+      output = self.runWithInput(lambda: loop.execute(), text)
+    return (output, errors.getvalue())
+
+  ####################################################################
+  # Phases are timed only within a line, each once and exclusive of those
+  # nested within it.
+  def test_phases(self):
+    timer = command.CommandLineTimer()
+    with command.CommandLineTimer.phase("run"):
+      pass
+    timer.start()
+    with command.CommandLineTimer.phase("run"):
+      with command.CommandLineTimer.phase("parse"):
+        time.sleep(0.01)
+    times = timer.stop()
+    self.assertGreaterEqual(times["run"], 0.01)
+    self.assertEqual(times["parse"], 0.0)
+    self.assertGreaterEqual(times["total"], times["run"] + times["other"])
+    self.assertEqual(timer.lines, 1)
+    self.assertIn("run", timer.formatLine(times))
+
+  ####################################################################
+  # The time builtin reports a line's phases and the summary is reported
+  # at the end of the loop.
+  def test_time(self):
+    for (loopClass, name) in ((SyncLoop, "echo"), (AsyncLoop, "sleep")):
+      loop = loopClass(None)
+      (output, errors) = self.runLoop(loop, "time {0}\n{0}\n".format(name))
+      self.assertEqual(output.count("{0}\n".format(name)), 2)
+      self.assertEqual(errors.count("time: split"), 1)
+      for phase in ("parse", "instantiate", "run", "other", "total"):
+        self.assertIn(" {0} ".format(phase), errors)
+      self.assertIn("lines                   1", errors)
+      self.assertEqual(loop.timer.lines, 1)
+
+    (output, errors) = self.runLoop(SyncLoop(None), "echo\ntime\n")
+    self.assertIn("usage: time COMMAND...", output)
+    self.assertEqual(errors, "")
+
+  ####################################################################
+  # The timing builtin toggles timing of every line.
+  def test_timing(self):
+    loop = SyncLoop(None)
+    (output, errors) = self.runLoop(loop,
+                                    "timing\necho\ncount | total\n"
+                                    "timing off\necho\n")
+    self.assertIn("timing on\n", output)
+    self.assertIn("timing off\n", output)
+    self.assertEqual(errors.count("time: split"), 2)
+    self.assertEqual(loop.timer.lines, 2)
+    self.assertFalse(loop.timing)
+
+  ####################################################################
+  # The timing builtins are described by the interface.
+  def test_help(self):
+    self.assertIn("time COMMAND...: executes the command line",
+                  self.runLine(SyncLoop(None), "help time"))
+    self.assertIn("timing [on|off]: toggles",
+                  self.runLine(AsyncLoop(None), "help timing"))
+
+#############################################################################
+#############################################################################
+class Test_CommandTracing(Test_CommandBase):
+
+  ####################################################################
+  def setUp(self):
+    self.exporter = instrument.InMemoryExporter()
+    self.previous = instrument.Tracer.setHook(self.exporter)
+
+  ####################################################################
+  def tearDown(self):
+    instrument.Tracer.setHook(self.previous)
+
+  ####################################################################
+  # The shell's run is the parent of the command's instantiation.
+  def test_shell(self):
+    self.runShell(ShellCommand, "echo")
+    (run,) = self.exporter.spans("command.run")
+    self.assertEqual(run.attributes, {"command.program" : "test",
+                                      "command.name" : "echo"})
+    (makeItem,) = self.exporter.spans("factory.makeItem")
+    self.assertIs(makeItem.parent, run)
+    self.assertEqual(makeItem.attributes["factory.item"], "echo")
+
+  ####################################################################
+  # Lookups of cached results record whether they hit.
+  def test_cache(self):
+    Memo._resultCache().clear()
+    for _ in range(2):
+      self.runShell(ShellCommand, "memo")
+    lookups = self.exporter.spans("command.cache")
+    self.assertEqual([x.attributes["command.cache-hit"] for x in lookups],
+                     [False, True])
+    self.assertEqual([x.parent.name for x in lookups], ["command.run"] * 2)
+
+  ####################################################################
+  # The loop's run is the parent of its commands' instantiation, for both
+  # kinds of loop.
+  def test_loop(self):
+    for loopClass in (SyncLoop, AsyncLoop):
+      self.exporter.clear()
+      self.runWithInput(lambda: loopClass(None).execute(), "echo\n")
+      (run,) = self.exporter.spans("interactive.run")
+      self.assertEqual(run.attributes["interactive.batch"], False)
+      items = [x for x in self.exporter.spans("factory.makeItem")
+                if x.attributes["factory.item"] == "echo"]
+      self.assertEqual([x.traceIdentifier for x in items],
+                       [run.identifier])
+
+#############################################################################
+class Test_CommandLoopBatch(Test_CommandBase):
+
+  ####################################################################
+  # Returns the stdout, stderr and exception, if any, of running the loop
+  # with the arguments.
+  def runLoop(self, loopClass, *args):
+    loop = loopClass(loopClass._argumentParser().parse_args(list(args)))
+    (output, errors, exception) = (io.StringIO(), io.StringIO(), None)
+    with contextlib.redirect_stdout(output):
+      with contextlib.redirect_stderr(errors):
+        try:
+          result = loop.execute()
+          if asyncio.iscoroutine(result):
+            asyncio.run(result)
+        except SystemExit as ex:
+          exception = ex
+    return (output.getvalue(), errors.getvalue(), exception)
+
+  ####################################################################
+  # Lines are executed without prompting, reporting the aggregate status.
+  def test_runBatch(self):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+      with contextlib.redirect_stderr(io.StringIO()):
+        self.assertEqual(SyncLoop(None).runBatch(["echo", "sleep"]), 0)
+        self.assertEqual(SyncLoop(None).runBatch(["echo", "fail"],
+                                                 workers = 2), 1)
+        self.assertEqual(SyncLoop(None).runBatch(["no-such-command"]), 2)
+    self.assertNotIn(">", output.getvalue())
+    self.assertEqual(output.getvalue().split().count("echo"), 2)
+
+  ####################################################################
+  # --batch reads a file, or stdin, and exits with a failure status.
+  def test_batchArgument(self):
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, "lines")
+      with open(path, "w") as f:
+        f.write("echo\n# comment\nsleep\n")
+      for loopClass in (SyncLoop, AsyncLoop):
+        (output, errors, exception) = self.runLoop(loopClass, "--batch", path,
+                                                   "--jobs", "2")
+        self.assertIsNone(exception)
+        self.assertEqual(sorted(output.split()), ["echo", "sleep"])
+
+    stdin = sys.stdin
+    sys.stdin = io.StringIO("echo\nfail\n")
+    try:
+      (output, errors, exception) = self.runLoop(SyncLoop, "--batch")
+    finally:
+      sys.stdin = stdin
+    self.assertEqual(exception.code, 1)
+    self.assertIn("line 2: failed", errors)
+
+  ####################################################################
+  # The interface's commands and pipelines are executed in order; quit
+  # ends the batch.
+  def test_builtins(self):
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, "lines")
+      with open(path, "w") as f:
+        f.write("echo\nhelp echo\ncount | total\nquit\necho\n")
+      for loopClass in (SyncLoop, AsyncLoop):
+        for jobs in ("1", "2"):
+          (output, errors, exception) = self.runLoop(loopClass,
+                                                     "--batch", path,
+                                                     "--jobs", jobs)
+          self.assertIsNone(exception, errors)
+          self.assertIn("usage:", output)
+          self.assertIn("total 45", output)
+          self.assertEqual(output.splitlines().count("echo"), 1)
+
+    # Only the long form of --jobs is accepted; a short option would
+    # conflict with those of subclasses.
+    with contextlib.redirect_stderr(io.StringIO()):
+      with self.assertRaises(SystemExit):
+        SyncLoop._argumentParser().parse_args(["-j", "2"])
+
+#############################################################################
+#############################################################################
+class Test_CommandTimeout(Test_CommandBase):
+
+  ####################################################################
+  # The standard options are opted into; a command may define its own
+  # options of the same names.
+  def test_ownOption(self):
+    (result, output) = self.runShell(OwnOptionsCommand, "wait", "--timeout",
+                                     "3")
+    self.assertEqual(result, 3)
+    self.assertIsNone(OwnTimeout(argparse.Namespace()).timeout)
+
+  ####################################################################
+  # Commands complete normally absent a timeout.
+  def test_noTimeout(self):
+    item = ShellCommand.makeItem("echo", ShellCommand._argumentParser()
+                                                    .parse_args(["echo"]))
+    self.assertEqual(item.timeout, None)
+    with contextlib.redirect_stdout(io.StringIO()):
+      self.assertEqual(item.execute(), "echo")
+
+  ####################################################################
+  # A synchronous run() awaited without a timeout does not block the event
+  # loop.
+  def test_noTimeoutAsync(self):
+    item = ShellCommand.makeItem("slow", ShellCommand._argumentParser()
+                                                    .parse_args(["slow"]))
+
+    async def _cancelled():
+      task = asyncio.ensure_future(item.executeAsync())
+      await asyncio.sleep(0.2)
+      item.cancellation.cancel()
+      return await task
+
+    self.assertLess(asyncio.run(_cancelled()), 99)
+
+  ####################################################################
+  # A timed out command is cancelled and its partial result reported.
+  def test_timeout(self):
+    for name in ("slow", "slow-async"):
+      (result, output) = self.runShell(ShellCommand, name, "--timeout", "0.2")
+      self.assertIn("timed out after 0.2 seconds", output)
+      self.assertTrue(0 < result < 99, "partial result: {0}".format(result))
+
+  ####################################################################
+  # Timeouts are enforced within a running event loop.
+  def test_timeoutAsync(self):
+    parser = ShellCommand._argumentParser()
+    for name in ("slow", "slow-async"):
+      item = ShellCommand.makeItem(name,
+                                   parser.parse_args([name,
+                                                      "--timeout", "0.2"]))
+      with self.assertRaises(command.CommandTimeoutException) as context:
+        asyncio.run(item.executeAsync())
+      self.assertTrue(item.cancellation.cancelled)
+      self.assertTrue(0 < context.exception.partialResult < 99)
+
+  ####################################################################
+  # A timed out run() which ignores cancellation holds up neither the
+  # timeout nor the shutdown of the event loop.
+  def test_timeoutHung(self):
+    parser = ShellCommand._argumentParser()
+    for name in ("hung", "hung-async"):
+      item = ShellCommand.makeItem(name,
+                                   parser.parse_args([name,
+                                                      "--timeout", "0.2"]))
+      start = time.monotonic()
+      with self.assertRaises(command.CommandTimeoutException):
+        asyncio.run(item.executeAsync())
+      self.assertLess(time.monotonic() - start, 2, name)
+
+  ####################################################################
+  # A batch line which times out does not hold up the others.
+  def test_batch(self):
+    with contextlib.redirect_stdout(io.StringIO()):
+      shell = command.CommandShell(ShellCommand)
+      results = list(shell.iterateBatch(["slow --timeout 0.2", "echo"],
+                                        workers = 2))
+    self.assertEqual(results[0].status, 1)
+    self.assertTrue(isinstance(results[0].exception,
+                               command.CommandTimeoutException))
+    self.assertTrue(0 < results[0].result < 99)
+    self.assertEqual((results[1].result, results[1].status), ("echo", 0))
+
+  ####################################################################
+  # The cancellation token.
+  def test_cancellation(self):
+    cancellation = command.CommandCancellation()
+    self.assertFalse(cancellation.cancelled)
+    cancellation.check()
+    self.assertFalse(cancellation.wait(0))
+    cancellation.cancel()
+    self.assertTrue(cancellation.wait(0))
+    with self.assertRaises(command.CommandCancelledException):
+      cancellation.check()
+
+#############################################################################
+#############################################################################
+class Test_CommandPipeline(Test_CommandBase):
+
+  ####################################################################
+  # Returns a pipeline of the named commands.
+  def makePipeline(self, *names, **kwargs):
+    return command.CommandPipeline([ShellCommand.makeItem(x, None)
+                                      for x in names],
+                                   **kwargs)
+
+  ####################################################################
+  # Records stream through the pipeline to the last command.
+  def test_pipeline(self):
+    self.assertEqual(self.makePipeline("count", "double", "total").run(),
+                     sum(range(1000)) * 2)
+    self.assertEqual(self.makePipeline("count", "double").run(),
+                     [x * 2 for x in range(1000)])
+    with contextlib.redirect_stdout(io.StringIO()):
+      self.assertEqual(self.makePipeline("echo", "first").run(), ["echo"])
+
+  ####################################################################
+  # Producers are bounded by the buffer and stopped by the consumer.
+  def test_backpressure(self):
+    pipeline = self.makePipeline("count", "first", bufferSize = 4)
+    self.assertEqual(pipeline.run(), [0, 1, 2])
+    self.assertLess(pipeline.commands[0].partialResult, 3 + 4 + 1)
+
+  ####################################################################
+  # A producer's exception is raised from the pipeline.
+  def test_exception(self):
+    with contextlib.redirect_stdout(io.StringIO()):
+      with self.assertRaises(RuntimeError):
+        self.makePipeline("fail", "total").run()
+      with self.assertRaises(RuntimeError):
+        self.makePipeline("fail", "echo").run()
+
+  ####################################################################
+  # The shell and loops accept pipe syntax.
+  def test_syntax(self):
+    self.assertEqual(self.runShell(ShellCommand,
+                                   "count", "|", "double", "|", "first",
+                                   pipelines = True),
+                     ([0, 2, 4], ""))
+    for loop in (SyncLoop, AsyncLoop):
+      output = self.runWithInput(lambda: loop(None).execute(),
+                                 "count | total\ncount |\n")
+      self.assertIn("total 45", output)
+      self.assertIn("empty command in pipeline", output)
+
+  ####################################################################
+  # A loop's command lines specify pipelines only if enabled.
+  def test_loopOptIn(self):
+    output = self.runWithInput(lambda: PlainLoop(None).execute(),
+                               "words a|b\nwords a | b\n")
+    self.assertIn("a|b\n", output)
+    self.assertIn("a | b\n", output)
+
+  ####################################################################
+  # A producer which neither produces nor checks its cancellation delays
+  # the pipeline by no more than its stop timeout.
+  def test_stopTimeout(self):
+    pipeline = BriefStopPipeline([ShellCommand.makeItem(x, None)
+                                    for x in ("hung", "echo")])
+    start = time.monotonic()
+    with self.assertLogs("mill.command.CommandPipeline", "WARNING"):
+      with contextlib.redirect_stdout(io.StringIO()):
+        self.assertEqual(pipeline.run(), "echo")
+    self.assertLess(time.monotonic() - start, 2)
+
+  ####################################################################
+  # The shell's arguments specify a pipeline only if enabled; an escaped
+  # separator is a literal argument.
+  def test_literalSeparator(self):
+    self.assertEqual(self.runShell(ShellCommand, "words", "a", "|", "b"),
+                     ("a | b", ""))
+    self.assertEqual(self.runShell(ShellCommand, "words", "a", "\\|", "b",
+                                   "|", "first", pipelines = True),
+                     (["a | b"], ""))
+
+  ####################################################################
+  # Records are produced within each command's execution and thus its
+  # timeout.
+  def test_timeout(self):
+    with contextlib.redirect_stderr(io.StringIO()) as stderr:
+      (result, output) = self.runShell(ShellCommand, "drip", "--ndjson",
+                                       "--timeout", "0.2")
+    self.assertIn("timed out", stderr.getvalue())
+    self.assertLess(len(output.splitlines()), 10)
+
+    args = ShellCommand._argumentParser().parse_args(["drip",
+                                                      "--timeout", "0.2"])
+    pipeline = command.CommandPipeline([ShellCommand.makeItem("drip", args),
+                                        ShellCommand.makeItem("total", None)])
+    with self.assertRaises(command.CommandTimeoutException):
+      pipeline.run()
+
+  ####################################################################
+  # Command lines are split on unquoted separators.
+  def test_splitCommandLine(self):
+    split = command.CommandPipeline.splitCommandLine
+    self.assertEqual(split("echo"), ["echo"])
+    self.assertEqual(split("a 'x|y' \"|\" | b \\| c"),
+                     ["a 'x|y' \"|\"", "b \\| c"])
+    with self.assertRaises(ValueError):
+      split("a | | b")
+    with self.assertRaises(ValueError):
+      command.CommandPipeline.splitArguments(["a", "|"])
+
+#############################################################################
+#############################################################################
+class Test_CommandRecords(Test_CommandBase):
+
+  ####################################################################
+  # Returns the records of the NDJSON output.
+  def parse(self, output):
+    return [json.loads(x) for x in output.splitlines()]
+
+  ####################################################################
+  # Emitted and result records are written as NDJSON.
+  def test_ndjson(self):
+    (result, output) = self.runShell(ShellCommand, "records", "--ndjson")
+    self.assertEqual(result, None)
+    self.assertEqual(self.parse(output),
+                     [{"emitted" : True}]
+                      + [{"index" : x, "name" : "r\u00e9cord"}
+                          for x in range(3)])
+
+    # Echo also prints "echo" itself.
+    (result, output) = self.runShell(ShellCommand, "echo", "--ndjson")
+    self.assertEqual((result, output), ("echo", 'echo\n"echo"\n'))
+
+  ####################################################################
+  # Without --ndjson emitted records are printed.
+  def test_text(self):
+    (result, output) = self.runShell(ShellCommand, "records")
+    self.assertEqual(output, "{'emitted': True}\n")
+    self.assertEqual(len(list(result)), 3)
+
+  ####################################################################
+  # Exceptions are reported to stderr leaving stdout parseable.
+  def test_exception(self):
+    with contextlib.redirect_stderr(io.StringIO()) as stderr:
+      (result, output) = self.runShell(ShellCommand, "fail", "--ndjson")
+      self.assertEqual(output, "")
+      (result, output) = self.runShell(ShellCommand, "slow", "--ndjson",
+                                       "--timeout", "0.2")
+    self.assertTrue(0 < self.parse(output)[0] < 99)
+    self.assertIn("failed", stderr.getvalue())
+    self.assertIn("timed out", stderr.getvalue())
+
+  ####################################################################
+  # The last command of a pipeline streams its records.
+  def test_pipeline(self):
+    (result, output) = self.runShell(ShellCommand,
+                                     "count", "|", "double", "--ndjson",
+                                     pipelines = True)
+    self.assertEqual(self.parse(output), [x * 2 for x in range(1000)])
+
+  ####################################################################
+  # Records are buffered and non-JSON values converted.
+  def test_writer(self):
+    stream = io.StringIO()
+    writer = command.CommandRecordWriter(stream, bufferSize = 16)
+    writer.write({"set" : {1}})
+    self.assertEqual(stream.getvalue(), "")
+    writer.write({"path" : io})
+    self.assertNotEqual(stream.getvalue(), "")
+    writer.write({"array" : array.array("q", [1, 2])})
+    writer.writeAll(iter([1, 2]))
+    writer.flush()
+    records = self.parse(stream.getvalue())
+    self.assertEqual(records[0], {"set" : [1]})
+    self.assertEqual(records[1], {"path" : str(io)})
+    self.assertEqual(records[2], {"array" : [1, 2]})
+    self.assertEqual(records[3:], [1, 2])
+
+#############################################################################
+#############################################################################
+class CountingCache(command.CommandCache):
+  # Counts the scans of the directory for eviction.
+  evictions = 0
+
+  ####################################################################
+  def _evict(self):
+    self.evictions += 1
+    super(CountingCache, self)._evict()
+
+#############################################################################
+#############################################################################
+class Test_CommandCache(Test_CommandBase):
+
+  ####################################################################
+  # The class's cache, and thus its directory, persists once established.
+  @classmethod
+  def setUpClass(cls):
+    cls.directory = tempfile.TemporaryDirectory()
+    Cached.directory = cls.directory.name
+
+  ####################################################################
+  @classmethod
+  def tearDownClass(cls):
+    cls.directory.cleanup()
+
+  ####################################################################
+  def setUp(self):
+    Cached.executions = 0
+    Cached._resultCache().clear()
+
+  ####################################################################
+  # Returns the result of executing the cached command.
+  def execute(self, *args):
+    return self.runShell(ShellCommand, "cached", *args)[0]
+
+  ####################################################################
+  # Results are cached by arguments and the flags bypass or refresh them.
+  def test_cache(self):
+    self.assertEqual(self.execute(), {"value" : 0, "execution" : 1})
+    self.assertEqual(self.execute("-v"), {"value" : 0, "execution" : 1})
+    self.assertEqual(self.execute("--value", "1"),
+                     {"value" : 1, "execution" : 2})
+    self.assertEqual(self.execute("--refresh-cache"),
+                     {"value" : 0, "execution" : 3})
+    self.assertEqual(self.execute("--no-cache"),
+                     {"value" : 0, "execution" : 4})
+    self.assertEqual(self.execute(), {"value" : 0, "execution" : 3})
+    args = ShellCommand._argumentParser().parse_args(["cached", "--value",
+                                                      "2"])
+    item = ShellCommand.makeItem("cached", args)
+    self.assertEqual(asyncio.run(item.executeAsync())["execution"], 5)
+    self.assertEqual(asyncio.run(item.executeAsync())["execution"], 5)
+
+  ####################################################################
+  # Keys are the same in every process, sets being ordered, and values not
+  # representable are rejected; results of such arguments are not cached.
+  def test_key(self):
+    members = ["member{0}".format(x) for x in range(16)]
+    script = ("from mill import command;"
+              " print(command.CommandCache.key(set({0!r})))".format(members))
+    keys = set()
+    for seed in ("1", "2", "3"):
+      environment = dict(os.environ, PYTHONHASHSEED = seed)
+      keys.add(subprocess.check_output([sys.executable, "-c", script],
+                                       env = environment,
+                                       universal_newlines = True).strip())
+    self.assertEqual(keys, set([command.CommandCache.key(frozenset(members))]))
+    self.assertEqual(command.CommandCache.key({"a" : set([2, 1])}),
+                     command.CommandCache.key({"a" : [1, 2]}))
+    with self.assertRaises(TypeError):
+      command.CommandCache.key(object())
+
+    args = ShellCommand._argumentParser().parse_args(["cached"])
+    args.unrepresentable = object()
+    item = ShellCommand.makeItem("cached", args)
+    with self.assertLogs("mill.command.Command", "WARNING"):
+      self.assertEqual(item.execute()["execution"], 1)
+      self.assertEqual(item.execute()["execution"], 2)
+
+  ####################################################################
+  # Only cacheable commands accept the cache flags.
+  def test_flags(self):
+    with contextlib.redirect_stderr(io.StringIO()):
+      with self.assertRaises(SystemExit):
+        self.runShell(ShellCommand, "echo", "--no-cache")
+
+  ####################################################################
+  # Results persist on disk and expire.
+  def test_disk(self):
+    self.execute()
+    cache = command.CommandCache(self.directory.name)
+    self.assertEqual(len(os.listdir(self.directory.name)), 1)
+    key = os.listdir(self.directory.name)[0].split(".")[0]
+    self.assertEqual(cache.get(key), (True, {"value" : 0, "execution" : 1}))
+
+    command.CommandCache(self.directory.name, ttl = 0).put(key, None)
+    cache = command.CommandCache(self.directory.name)
+    self.assertEqual(cache.get(key), (False, None))
+    self.assertEqual(os.listdir(self.directory.name), [])
+
+  ####################################################################
+  # The least recently written results are evicted beyond the size limit
+  # and the least recently used beyond the entry limit.
+  def test_eviction(self):
+    cache = command.CommandCache(self.directory.name, maximumEntries = 2,
+                                 maximumBytes = 2048)
+    for key in range(4):
+      cache.put(str(key), "x" * 768)
+      time.sleep(0.01)
+    self.assertEqual(sorted(os.listdir(self.directory.name)),
+                     ["2.pickle", "3.pickle"])
+
+    cache = command.CommandCache(maximumEntries = 2)
+    for key in range(3):
+      cache.put(str(key), key)
+    self.assertEqual(cache.get("0"), (False, None))
+    self.assertEqual(cache.get("2"), (True, 2))
+
+    # The directory is scanned upon the first write and then only once the
+    # size limit may have been exceeded.
+    with tempfile.TemporaryDirectory() as directory:
+      cache = CountingCache(directory, maximumBytes = 8192)
+      for key in range(60):
+        cache.put(str(key), "x" * 256)
+      self.assertLess(cache.evictions, 10)
+      self.assertLessEqual(sum([os.path.getsize(os.path.join(directory, x))
+                                  for x in os.listdir(directory)]),
+                           8192)
+
+  ####################################################################
+  # The directory is created private to the user and results are not
+  # loaded from one writable by others.
+  def test_directory(self):
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, "private", "results")
+      command.CommandCache(path).put("key", 1)
+      self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o700)
+      os.chmod(path, 0o755)
+      command.CommandCache(path).put("key", 1)
+      self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o700)
+      self.assertEqual(command.CommandCache(path).get("key"), (True, 1))
+
+      # A removed directory is recreated.
+      cache = command.CommandCache(path)
+      cache.put("key", 1)
+      shutil.rmtree(path)
+      cache.put("key", 2)
+      self.assertEqual(command.CommandCache(path).get("key"), (True, 2))
+
+      os.chmod(path, 0o777)
+      with self.assertLogs("mill.command.CommandCache", "WARNING"):
+        self.assertEqual(command.CommandCache(path).get("key"),
+                         (False, None))
+
+  ####################################################################
+  # The defaults fingerprint is stable absent changes.
+  def test_fingerprint(self):
+    self.assertEqual(Cached.defaultsFingerprint(),
+                     Cached.defaultsFingerprint())
+
+#############################################################################
+#############################################################################
+class Test_CommandProfiler(Test_CommandBase):
+
+  ####################################################################
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+
+  ####################################################################
+  def tearDown(self):
+    self.directory.cleanup()
+
+  ####################################################################
+  # Returns the path of the named file in the temporary directory.
+  def path(self, name):
+    return os.path.join(self.directory.name, name)
+
+  ####################################################################
+  # Checks the profile and allocation report were written.
+  def checkFiles(self, profile, report):
+    stats = pstats.Stats(profile)
+    self.assertTrue(any([name == "run" for (path, line, name) in stats.stats]))
+    with open(report) as f:
+      self.assertIn("peak:", f.read())
+    os.unlink(profile)
+    os.unlink(report)
+
+  ####################################################################
+  # Commands are profiled however they are executed.
+  def test_options(self):
+    for args in (["echo"], ["sleep"], ["echo", "--timeout", "5"],
+                 ["sleep", "--timeout", "5"]):
+      self.runShell(ShellCommand, *(args + ["--profile", self.path("p"),
+                                            "--trace-malloc",
+                                            self.path("m")]))
+      self.checkFiles(self.path("p"), self.path("m"))
+
+    args = ShellCommand._argumentParser().parse_args(["sleep",
+                                                      "--profile",
+                                                      self.path("p"),
+                                                      "--trace-malloc",
+                                                      self.path("m")])
+    asyncio.run(ShellCommand.makeItem("sleep", args).executeAsync())
+    self.checkFiles(self.path("p"), self.path("m"))
+
+  ####################################################################
+  # Loops accept profiling prefixes.
+  def test_prefixes(self):
+    for loop in (SyncLoop, AsyncLoop):
+      for name in ("echo", "sleep"):
+        output = self.runWithInput(
+                  lambda: loop(None).execute(),
+                  "profile {0} {2}\ntracemalloc {1} {2}\nprofile\n".format(
+                    self.path("p"), self.path("m"), name))
+        self.assertIn("usage: profile FILE COMMAND...", output)
+        self.checkFiles(self.path("p"), self.path("m"))
+
+  ####################################################################
+  # A prefixed command line retains its quoting and pipeline.
+  def test_prefixedPipeline(self):
+    for loop in (SyncLoop, AsyncLoop):
+      output = self.runWithInput(
+                lambda: loop(None).execute(),
+                "profile '{0}' count | total\n".format(self.path("p")))
+      self.assertIn("total 45", output)
+      self.assertTrue(os.path.exists(self.path("p")))
+
+  ####################################################################
+  # A loop's command takes precedence over a prefix of the same name.
+  def test_shadowed(self):
+    output = self.runWithInput(lambda: ShadowLoop(None).execute(),
+                               "profile\n")
+    self.assertIn("shadowed", output)
+    self.assertNotIn("usage", output)
+
+  ####################################################################
+  # The profiling builtins are described by the interface unless shadowed
+  # by a loop's command, which is described by its parser.
+  def test_help(self):
+    self.assertIn("profile FILE COMMAND...: executes the command line",
+                  self.runLine(SyncLoop(None), "help profile"))
+    self.assertIn("tracemalloc FILE COMMAND...: executes the command line",
+                  self.runLine(SyncLoop(None), "help tracemalloc"))
+    with self.assertRaises(SystemExit):
+      self.runLine(ShadowLoop(None), "help profile")
+
+  ####################################################################
+  # --phase-times enables the phase timer.
+  def test_phaseTimes(self):
+    self.assertFalse(instrument.PhaseTimer.enabled())
+    try:
+      self.runShell(ShellCommand, "echo", "--phase-times", "json")
+      self.assertTrue(instrument.PhaseTimer.enabled())
+    finally:
+      instrument.PhaseTimer.disable()
+      instrument.PhaseTimer.reset()
+
+#############################################################################
+#############################################################################
+class Test_CommandMetrics(Test_CommandBase):
+
+  ####################################################################
+  def setUp(self):
+    self.wasEnabled = command.CommandMetrics.enabled()
+    command.CommandMetrics.disable()
+    command.CommandMetrics.reset()
+
+  ####################################################################
+  def tearDown(self):
+    command.CommandMetrics.disable()
+    command.CommandMetrics.reset()
+    if self.wasEnabled:
+      command.CommandMetrics.enable()
+
+  ####################################################################
+  # Nothing is recorded when disabled.
+  def test_disabled(self):
+    self.runShell(ShellCommand, "echo")
+    self.assertEqual(command.CommandMetrics.report(), {})
+
+  ####################################################################
+  # Executions are aggregated by command and outcome.
+  def test_enabled(self):
+    command.CommandMetrics.enable()
+    for _ in range(3):
+      self.runShell(ShellCommand, "echo")
+    self.runShell(ShellCommand, "sleep")
+    self.runShell(ShellCommand, "fail")
+    self.runWithInput(lambda: SyncLoop(None).execute(), "echo\n")
+
+    report = command.CommandMetrics.report()
+    self.assertEqual(report["echo"]["outcomes"], {"success" : 4})
+    self.assertEqual(report["echo"]["wall-seconds"]["count"], 4)
+    self.assertEqual(report["echo"]["wall-seconds"]["buckets"][-1], 4)
+    self.assertEqual(report["sleep"]["outcomes"], {"success" : 1})
+    self.assertEqual(report["fail"]["outcomes"], {"error" : 1})
+
+    formatted = command.CommandMetrics._format(report, "json")
+    self.assertEqual(json.loads(formatted)["fail"]["outcomes"],
+                     {"error" : 1})
+    formatted = command.CommandMetrics._format(report, "prometheus")
+    self.assertIn('mill_command_wall_seconds_bucket{command="echo",'
+                  'le="+Inf"} 4', formatted)
+    self.assertIn('mill_command_executions_total{command="fail",'
+                  'outcome="error"} 1', formatted)
+
+  ####################################################################
+  # The CPU time is that of the thread in which run() executes.
+  def test_cpu(self):
+    command.CommandMetrics.enable()
+    self.runShell(ShellCommand, "spin")
+    self.runShell(ShellCommand, "spin", "--timeout", "10")
+    cpu = command.CommandMetrics.report()["spin"]["cpu-seconds"]
+    self.assertEqual(cpu["count"], 2)
+    self.assertGreaterEqual(cpu["sum"], 0.4)
+
+  ####################################################################
+  # The report requested by SIGUSR1 is written without awaiting another
+  # execution; disabling restores the previous handler.
+  @unittest.skipUnless(hasattr(signal, "SIGUSR1"), "requires SIGUSR1")
+  def test_signal(self):
+    previous = signal.getsignal(signal.SIGUSR1)
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, "metrics.prom")
+      command.CommandMetrics.enable("prometheus", path)
+      self.runShell(ShellCommand, "echo")
+      os.kill(os.getpid(), signal.SIGUSR1)
+      deadline = time.monotonic() + 10
+      while (not os.path.exists(path)) and (time.monotonic() < deadline):
+        time.sleep(0.01)
+      with open(path) as f:
+        self.assertIn('outcome="success"} 1', f.read())
+    command.CommandMetrics.disable()
+    self.assertEqual(signal.getsignal(signal.SIGUSR1), previous)
+
+  ####################################################################
+  # Unknown formats are rejected.
+  def test_unknownFormat(self):
+    with self.assertRaises(ValueError):
+      command.CommandMetrics.enable("xml")
+
+#############################################################################
+#############################################################################
+class Test_CommandServer(unittest.TestCase):
+
+  ####################################################################
+  # The server forks, so it serves from a process of its own, a single
+  # thread, shut down by SIGTERM.
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.directory.name, "server.sock")
+    self.process = self.startServer(self.path)
+
+  ####################################################################
+  def tearDown(self):
+    self.process.terminate()
+    self.assertEqual(self.process.wait(30), 0)
+    self.directory.cleanup()
+
+  ####################################################################
+  # Returns the status and output of running the arguments via the server.
+  def runClient(self, *args, path = None):
+    (read, write) = os.pipe()
+    try:
+      status = client.run(self.path if path is None else path, args,
+                          fds = (read, write, write))
+    finally:
+      os.close(write)
+    with os.fdopen(read) as f:
+      return (status, f.read())
+
+  ####################################################################
+  # Returns the process of a server at the path once it is serving.
+  def startServer(self, path, environment = None):
+    script = "\n".join([
+      "import signal, sys",
+      "from mill import command",
+      "from mill.command.test import ShellCommand",
+      "server = command.CommandServer(ShellCommand, sys.argv[1])",
+      "signal.signal(signal.SIGTERM, lambda *args: server.shutdown())",
+      "server.serve()"])
+    topDirectory = os.path.dirname(os.path.dirname(os.path.dirname(
+                                                  os.path.abspath(__file__))))
+    process = subprocess.Popen([sys.executable, "-c", script, path],
+                               cwd = topDirectory, env = environment)
+
+    deadline = time.monotonic() + 30
+    while True:
+      try:
+        self.runClient("echo", path = path)
+        break
+      except (ConnectionRefusedError, FileNotFoundError):
+        self.assertLess(time.monotonic(), deadline)
+        time.sleep(0.05)
+    return process
+
+  ####################################################################
+  # Commands execute with the client's streams and report their status.
+  def test_serve(self):
+    self.assertEqual(self.runClient("echo"), (0, "echo\n"))
+    self.assertEqual(self.runClient("sleep"), (0, "sleep\n"))
+    self.assertEqual(self.runClient("fail"), (0, "failed\n"))
+    self.assertEqual(self.runClient("no-such-command")[0], 2)
+
+  ####################################################################
+  # A client which does not send its request delays no other, and the
+  # socket is accessible only by the user.
+  def test_idleClient(self):
+    self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+    results = []
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as idle:
+      idle.connect(self.path)
+      request = threading.Thread(
+                  target = lambda: results.append(self.runClient("echo")),
+                  daemon = True)
+      request.start()
+      request.join(3)
+    self.assertEqual(results, [(0, "echo\n")])
+
+  ####################################################################
+  # The reports written at exit are written by the children, which exit
+  # without running exit handlers; the metrics reporter does not prevent
+  # serving.
+  def test_reports(self):
+    (status, output) = self.runClient("echo", "--phase-times", "json")
+    self.assertEqual(status, 0)
+    self.assertIn('"elapsed-seconds"', output)
+
+    path = os.path.join(self.directory.name, "metrics.sock")
+    metricsPath = os.path.join(self.directory.name, "metrics.json")
+    process = self.startServer(path,
+                               dict(os.environ,
+                                    PYTHON_MILL_METRICS = "json",
+                                    PYTHON_MILL_METRICS_FILE = metricsPath))
+    try:
+      os.unlink(metricsPath)
+      self.assertEqual(self.runClient("echo", path = path), (0, "echo\n"))
+      with open(metricsPath) as f:
+        self.assertEqual(json.load(f)["echo"]["outcomes"], {"success" : 1})
+    finally:
+      process.terminate()
+      self.assertEqual(process.wait(30), 0)
+
+  ####################################################################
+  # Serving from a process with other threads is refused.
+  def test_threaded(self):
+    event = threading.Event()
+    thread = threading.Thread(target = event.wait)
+    thread.start()
+    try:
+      server = command.CommandServer(ShellCommand,
+                                     os.path.join(self.directory.name,
+                                                  "threaded.sock"))
+      with self.assertRaises(RuntimeError):
+        server.serve()
+    finally:
+      event.set()
+      thread.join()
+
+#############################################################################
+#############################################################################
+class BriefShutdownServer(command.InteractiveServer):
+  ####################################################################
+  def _shutdownTimeout(self):
+    return 0.5
+
+#############################################################################
+#############################################################################
+class Test_InteractiveServer(unittest.TestCase):
+
+  ####################################################################
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.servers = []
+
+  ####################################################################
+  def tearDown(self):
+    for (server, thread) in self.servers:
+      server.shutdown()
+      thread.join()
+    self.directory.cleanup()
+
+  ####################################################################
+  # Returns a server of the loop class which is serving.
+  def startServer(self, loopClass, serverClass = command.InteractiveServer):
+    server = serverClass(
+              loopClass,
+              os.path.join(self.directory.name,
+                           "{0}.sock".format(len(self.servers))))
+    thread = threading.Thread(target = server.serve)
+    thread.start()
+    self.servers.append((server, thread))
+    self.assertTrue(server.waitUntilServing(10))
+    return server
+
+  ####################################################################
+  # Returns the status and output of a session given the input and
+  # arguments.
+  def runSession(self, server, text, *args):
+    (inRead, inWrite) = os.pipe()
+    (outRead, outWrite) = os.pipe()
+    os.write(inWrite, text.encode())
+    os.close(inWrite)
+    try:
+      status = client.run(server.path, args,
+                          fds = (inRead, outWrite, outWrite))
+    finally:
+      os.close(inRead)
+      os.close(outWrite)
+    with os.fdopen(outRead) as f:
+      return (status, f.read())
+
+  ####################################################################
+  # Sessions execute the loop with the client's streams and arguments.
+  def test_session(self):
+    server = self.startServer(SyncLoop)
+    (status, output) = self.runSession(server, "echo\ncount | total\n")
+    self.assertEqual(status, 0)
+    self.assertIn("syncloop > echo\n", output)
+    self.assertIn("total 45\n", output)
+
+    self.assertEqual(self.runSession(server, "quit\n"), (0, "syncloop > "))
+    self.assertEqual(self.runSession(server, "", "--batch")[0], 0)
+    self.assertEqual(self.runSession(server, "", "--no-such-option")[0], 2)
+
+    server = self.startServer(AsyncLoop)
+    (status, output) = self.runSession(server, "sleep\necho\n")
+    self.assertEqual(status, 0)
+    self.assertIn("asyncloop > sleep\nasyncloop > echo\n", output)
+
+  ####################################################################
+  # Sessions execute concurrently, each with its own loop, and the
+  # server's streams are restored once it has shut down.
+  def test_concurrent(self):
+    stdout = sys.stdout
+    server = self.startServer(SyncLoop)
+    (inRead, inWrite) = os.pipe()
+    (outRead, outWrite) = os.pipe()
+    waiting = threading.Thread(target = client.run,
+                               args = (server.path, ()),
+                               kwargs = { "fds" : (inRead, outWrite,
+                                                   outWrite) })
+    waiting.start()
+    try:
+      os.write(inWrite, b"spin &\n")
+      deadline = time.monotonic() + 10
+      while (server.sessions() == 0) and (time.monotonic() < deadline):
+        time.sleep(0.01)
+      self.assertEqual(server.sessions(), 1)
+      (status, output) = self.runSession(server, "jobs\n")
+      self.assertEqual(status, 0)
+      self.assertNotIn("spin", output)
+      self.assertEqual(server.sessions(), 1)
+    finally:
+      os.close(inWrite)
+      waiting.join()
+      os.close(inRead)
+      os.close(outWrite)
+    with os.fdopen(outRead) as f:
+      self.assertIn("[1] spin\n", f.read())
+
+    server.shutdown()
+    self.servers.pop()[1].join()
+    self.assertIs(sys.stdout, stdout)
+
+  ####################################################################
+  # A client which does not send its request delays no other session.
+  def test_idleClient(self):
+    server = self.startServer(SyncLoop)
+    results = []
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as idle:
+      idle.connect(server.path)
+      session = threading.Thread(
+                  target = lambda: results.append(self.runSession(server,
+                                                                  "echo\n")),
+                  daemon = True)
+      session.start()
+      session.join(3)
+    self.assertEqual([status for (status, output) in results], [0])
+
+  ####################################################################
+  # An idle session ends its client and delays shutdown by no more than
+  # the shutdown timeout.
+  def test_idleShutdown(self):
+    server = self.startServer(SyncLoop, BriefShutdownServer)
+    (inRead, inWrite) = os.pipe()
+    (outRead, outWrite) = os.pipe()
+    statuses = []
+    idle = threading.Thread(
+            target = lambda: statuses.append(
+                               client.run(server.path, (),
+                                          fds = (inRead, outWrite,
+                                                 outWrite))))
+    idle.start()
+    try:
+      deadline = time.monotonic() + 10
+      while (server.sessions() == 0) and (time.monotonic() < deadline):
+        time.sleep(0.01)
+      self.assertEqual(server.sessions(), 1)
+      with self.assertLogs("mill.command.InteractiveServer", "WARNING"):
+        server.shutdown()
+        serving = self.servers.pop()[1]
+        serving.join(10)
+      self.assertFalse(serving.is_alive())
+      idle.join(10)
+      self.assertEqual(statuses, [client.STATUS_UNKNOWN])
+    finally:
+      for fd in (inWrite, inRead, outWrite, outRead):
+        os.close(fd)
+
+  ####################################################################
+  # The socket is accessible only by the user.
+  def test_access(self):
+    server = self.startServer(SyncLoop)
+    self.assertEqual(stat.S_IMODE(os.stat(server.path).st_mode), 0o600)
+
+  ####################################################################
+  # Background jobs' streams are those of their session.
+  def test_jobStreams(self):
+    server = self.startServer(SyncLoop)
+    (status, output) = self.runSession(server, "warn &\nwait\n")
+    self.assertEqual(status, 0)
+    self.assertIn("warning\n", output)
+
+#############################################################################
+#############################################################################
+class Test_CommandImport(unittest.TestCase):
+
+  ####################################################################
+  # Returns the heavy modules, of those specified, imported by executing the
+  # statement in a fresh interpreter.
+  def importedModules(self, statement, modules):
+    topDirectory = os.path.dirname(os.path.dirname(os.path.dirname(
+                                                  os.path.abspath(__file__))))
+    script = "\n".join([
+      "import sys",
+      statement,
+      "print(' '.join([x for x in {0!r} if x in sys.modules]))"
+        .format(modules)])
+    output = subprocess.check_output([sys.executable, "-c", script],
+                                     cwd = topDirectory,
+                                     universal_newlines = True)
+    return output.split()
+
+  ####################################################################
+  # Importing the package imports none of its submodules' dependencies.
+  def test_lazyPackage(self):
+    heavy = ["asyncio", "concurrent.futures", "cProfile", "importlib.resources",
+             "inspect", "json", "mill.data", "mill.defaults", "mill.factory",
+             "pickle", "tempfile", "tracemalloc", "yaml"]
+    self.assertEqual(self.importedModules("import mill.command", heavy), [])
+    self.assertEqual(self.importedModules("import mill", heavy), [])
+
+  ####################################################################
+  # Accessing the shell does not import asynchronous execution, profiling
+  # or the defaults.
+  def test_lazyShell(self):
+    heavy = ["asyncio", "cProfile", "inspect", "json", "pickle",
+             "tracemalloc", "yaml"]
+    self.assertEqual(
+      self.importedModules("import mill.command; mill.command.CommandShell",
+                           heavy),
+      [])
+
+  ####################################################################
+  # Attributes are provided upon access.
+  def test_attributes(self):
+    # The class, not the submodule of the same name.
+    self.assertIs(command.Command, sys.modules["mill.command.Command"].Command)
+    self.assertIs(command.CommandShell,
+                  sys.modules["mill.command.CommandShell"].CommandShell)
+    self.assertIn("CommandPipeline", dir(command))
+    with self.assertRaises(AttributeError):
+      command.NoSuchAttribute
+
+  ####################################################################
+  # Importing a submodule first does not shadow its same-named class.
+  def test_submoduleFirst(self):
+    for statement in [
+        "import mill.data.DataFile; from mill.defaults import DefaultsFileInfo",
+        "import mill.data.DataFile; from mill import command; command.Command",
+        "import mill.factory.Factory, mill; mill.factory.Factory.makeItem",
+        "import mill.command.CommandShell; import mill.command;"
+          " mill.command.CommandShell.run"]:
+      self.assertEqual(self.importedModules(statement, []), [], statement)
+
+#############################################################################
+#############################################################################
+if __name__ == "__main__":
+  unittest.main()
@@ -3,9 +3,13 @@
 #
 # Copyright Red Hat
 #
+import array
 import errno
 import logging
-import yaml
+import os
+import sys
+
+from mill import instrument
 
 log = logging.getLogger(__name__)
 
@@ -67,11 +71,192 @@ class DataFileFormatException(DataFileException):
   def __init__(self, msg = "file format invalid", *args, **kwargs):
     super(DataFileFormatException, self).__init__(msg, *args, **kwargs)
 
+######################################################################
+######################################################################
+def _immutable(self, *args, **kwargs):
+  raise TypeError("compact data is immutable")
+
+######################################################################
+######################################################################
+class _FrozenDict(dict):
+  """Immutable dictionary of compact data.  A copy is the dictionary itself;
+  a deep copy is an ordinary, mutable, dictionary of mutable content.
+  """
+  __setitem__ = __delitem__ = __ior__ = _immutable
+  clear = pop = popitem = setdefault = update = _immutable
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __copy__(self):
+    return self
+
+  ####################################################################
+  def __deepcopy__(self, memo):
+    import copy
+    return dict([(key, copy.deepcopy(value, memo))
+                  for (key, value) in self.items()])
+
+  ####################################################################
+  def __reduce__(self):
+    return (_FrozenDict, (dict(self),))
+
+######################################################################
+######################################################################
+class _FrozenList(list):
+  """Immutable list of compact data.  A copy is the list itself; a deep copy
+  is an ordinary, mutable, list of mutable content.
+  """
+  __setitem__ = __delitem__ = __iadd__ = __imul__ = _immutable
+  append = clear = extend = insert = pop = remove = _immutable
+  reverse = sort = _immutable
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __copy__(self):
+    return self
+
+  ####################################################################
+  def __deepcopy__(self, memo):
+    import copy
+    return [copy.deepcopy(value, memo) for value in self]
+
+  ####################################################################
+  def __reduce__(self):
+    return (_FrozenList, (list(self),))
+
+######################################################################
+######################################################################
+class _FrozenArray(array.array):
+  """Immutable array of the numbers of a homogeneous list of compact data.
+  A copy is the array itself; a deep copy is an ordinary list.  It is equal
+  to a list of the same numbers, as is the list it replaces.
+  """
+  __setitem__ = __delitem__ = __iadd__ = __imul__ = _immutable
+  append = byteswap = extend = frombytes = fromfile = fromlist = _immutable
+  fromunicode = insert = pop = remove = reverse = _immutable
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __copy__(self):
+    return self
+
+  ####################################################################
+  def __eq__(self, other):
+    if isinstance(other, list):
+      return self.tolist() == other
+    return super(_FrozenArray, self).__eq__(other)
+
+  ####################################################################
+  def __ne__(self, other):
+    result = self.__eq__(other)
+    return result if result is NotImplemented else (not result)
+
+  ####################################################################
+  def __deepcopy__(self, memo):
+    return self.tolist()
+
+  ####################################################################
+  def __reduce__(self):
+    return (_FrozenArray, (self.typecode, self.tolist()))
+
+######################################################################
+######################################################################
+class _Compactor(object):
+  """Converts loaded data to its compact form.
+
+  Dictionary keys are interned.  Lists of only integers (within 64 bits) or
+  only floats become arrays.  Equal values, whether strings or entire
+  subtrees, are shared; i.e., each is held once.  Dictionaries, lists and
+  arrays are immutable so that sharing them is safe.
+  """
+  # The largest magnitude of an integer held in an array.
+  __integerLimit = 2 ** 63
+
+  ####################################################################
+  # Public methods
+  ####################################################################
+  def compact(self, value):
+    return self.__compact(value)[0]
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self):
+    super(_Compactor, self).__init__()
+    # Maps the structural key of each value compacted to its compact form.
+    self.__shared = {}
+
+  ####################################################################
+  # Private methods
+  ####################################################################
+  def __compact(self, value):
+    # Returns a tuple of the compact form of the value and its structural
+    # key; the key being None if the value cannot be shared.
+    if isinstance(value, dict):
+      items = [(sys.intern(key) if isinstance(key, str) else key,
+                self.__compact(item))
+                for (key, item) in value.items()]
+      value = _FrozenDict([(key, item) for (key, (item, _)) in items])
+      key = None
+      if all([itemKey is not None for (_, (_, itemKey)) in items]):
+        key = ("dict", tuple([(key, itemKey)
+                                for (key, (_, itemKey)) in items]))
+    elif isinstance(value, list):
+      (value, key) = self.__compactList(value)
+    else:
+      try:
+        key = (type(value), value)
+        hash(key)
+      except TypeError:
+        return (value, None)
+    if key is None:
+      return (value, None)
+    return (self.__shared.setdefault(key, value), key)
+
+  ####################################################################
+  def __compactList(self, value):
+    # Returns a tuple of the compact form of the list and its structural
+    # key, or None.
+    if len(value) > 0:
+      if all([type(x) is int for x in value]):
+        if all([-self.__integerLimit <= x < self.__integerLimit
+                for x in value]):
+          value = _FrozenArray("q", value)
+          return (value, ("array", value.typecode, value.tobytes()))
+      elif all([type(x) is float for x in value]):
+        value = _FrozenArray("d", value)
+        return (value, ("array", value.typecode, value.tobytes()))
+
+    items = [self.__compact(x) for x in value]
+    value = _FrozenList([item for (item, _) in items])
+    keys = [key for (_, key) in items]
+    return (value, None if None in keys else ("list", tuple(keys)))
+
 ######################################################################
 ######################################################################
 class DataFile(object):
+  """The content of a data file, a YAML file whose top-level key is that of
+  the class (e.g., 'data').
+
+  If 'compact' is True the content is held compactly; see _Compactor.  Its
+  dictionaries and lists are then immutable; deep copies of them are
+  ordinary, mutable, dictionaries and lists.  Lists of only numbers are
+  array.array sequences, not lists: they are equal to the lists they
+  replace but consumers testing isinstance(value, list), or encoding JSON
+  without a default for arrays, must convert them (e.g., via tolist()).  If
+  'compact' is None it is per the environment variable
+  PYTHON_MILL_DATA_COMPACT.
+  """
   ####################################################################
   # Public methods
+  ####################################################################
+  @property
+  def compact(self):
+    return self.__compact
+
   ####################################################################
   @property
   def path(self):
@@ -105,13 +290,21 @@ class DataFile(object):
   ####################################################################
   # Overridden methods
   ####################################################################
-  def __init__(self, filePath):
+  def __init__(self, filePath, compact = None):
     super(DataFile, self).__init__()
     self.__filePath = filePath
+    self.__compact = self._compactDefault() if compact is None else compact
     self.__data = self._loadData()
 
   ####################################################################
   # Protected methods
+  ####################################################################
+  @classmethod
+  def _compactDefault(cls):
+    """Returns whether data files are compact if not otherwise specified.
+    """
+    return os.getenv("PYTHON_MILL_DATA_COMPACT", "") not in ("", "0")
+
   ####################################################################
   def _content(self, sourceDictionary, path):
     """Returns the specified content from the source dictionary.
@@ -141,10 +334,23 @@ class DataFile(object):
 
   ####################################################################
   def _loadData(self):
+    with instrument.Tracer.span("data.load", {"data.path" : self.path,
+                                              "data.compact" : self.compact}):
+      return self.__loadData()
+
+  ####################################################################
+  # Private methods
+  ####################################################################
+  def __loadData(self):
+    # yaml is imported upon loading the first file; it dominates the cost of
+    # importing the package.
+    import yaml
     data = None
     try:
       with open(self.path) as f:
-        data = yaml.safe_load(f)
+        with instrument.PhaseTimer.phase("data.load"):
+          data = yaml.safe_load(f)
+        instrument.PhaseTimer.count("data.files-parsed")
         if not isinstance(data, dict):
           raise DataFileFormatException()
         try:
@@ -162,8 +368,7 @@ class DataFile(object):
     if data is None:
       data = {}
 
+    if self.compact:
+      with instrument.PhaseTimer.phase("data.compact"):
+        data = _Compactor().compact(data)
     return data
-
-  ####################################################################
-  # Private methods
-  ####################################################################
@@ -3,9 +3,15 @@
 #
 # Copyright Red Hat
 #
-from .DataFile import (DataException,
-                       DataFile,
-                       DataFileContentMissingException,
-                       DataFileDoesNotExistException,
-                       DataFileException,
-                       DataFileFormatException)
+# The package's attributes are provided lazily, importing the submodule
+# defining an attribute upon first access; see mill._lazy.
+from mill import _lazy
+
+(__getattr__, __dir__) = _lazy.lazyAttributes(globals(), {
+  "DataException"                   : ".DataFile",
+  "DataFile"                        : ".DataFile",
+  "DataFileContentMissingException" : ".DataFile",
+  "DataFileDoesNotExistException"   : ".DataFile",
+  "DataFileException"               : ".DataFile",
+  "DataFileFormatException"         : ".DataFile"
+})
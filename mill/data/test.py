@@ -5,6 +5,8 @@
 # Copyright Red Hat
 #
 
+import copy
+import pickle
 import tempfile
 import unittest
 
@@ -13,6 +15,7 @@ from DataFile import (DataException,
                       DataFileContentMissingException,
                       DataFileDoesNotExistException,
                       DataFileFormatException)
+from mill import instrument
 
 #############################################################################
 #############################################################################
@@ -142,6 +145,23 @@ class Test_DataFile(unittest.TestCase):
     with self.assertRaises(DataFileDoesNotExistException):
       DataFile("./non-existent-file.yml")
 
+  ####################################################################
+  # Loading is traced with the file's path, including failures.
+  def test_traced(self):
+    exporter = instrument.InMemoryExporter()
+    previous = instrument.Tracer.setHook(exporter)
+    try:
+      with self.assertRaises(DataFileDoesNotExistException):
+        DataFile("./non-existent-file.yml", compact = True)
+    finally:
+      instrument.Tracer.setHook(previous)
+
+    (span,) = exporter.spans("data.load")
+    self.assertEqual(span.attributes, {"data.path" : "./non-existent-file.yml",
+                                       "data.compact" : True})
+    self.assertTrue(isinstance(span.exception,
+                               DataFileDoesNotExistException))
+
   ####################################################################
   # Test that no path gives high-level content.
   def test_noPath(self):
@@ -206,6 +226,56 @@ class Test_DataFile(unittest.TestCase):
     with self.assertRaises(DataFileFormatException):
       DataFile(file.name)
 
+  ####################################################################
+  # Compact data equals the ordinary data, shares equal values and is
+  # immutable; deep copies are ordinary and mutable.
+  def test_compact(self):
+    file = tempfile.NamedTemporaryFile("w+")
+    file.write("""---
+      data:
+        host1:
+          role: web
+          ports: [22, 80]
+          latency: [0.5, 1.5]
+          tags: [production, 1, true]
+        host2:
+          role: web
+          ports: [22, 80]
+          latency: [0.5, 1.5]
+          tags: [production, 1, true]
+        flags: [true, false]
+      """
+    )
+    file.flush()
+
+    ordinary = DataFile(file.name, compact = False)
+    dataFile = DataFile(file.name, compact = True)
+    self.assertFalse(ordinary.compact)
+    self.assertTrue(dataFile.compact)
+
+    content = dataFile.content()
+    self.assertEqual(content, ordinary.content())
+    self.assertEqual(ordinary.content(), content)
+    self.assertIs(content["host1"], content["host2"])
+    self.assertEqual(dataFile.content(["host1", "ports"]).typecode, "q")
+    self.assertEqual(dataFile.content(["host1", "latency"]).typecode, "d")
+    self.assertEqual(dataFile.content(["flags"]), [True, False])
+    self.assertTrue(isinstance(dataFile.content(["host1"]), dict))
+
+    with self.assertRaises(TypeError):
+      content["host1"]["role"] = "db"
+    with self.assertRaises(TypeError):
+      content["host1"]["tags"].append("new")
+    with self.assertRaises(TypeError):
+      content["host1"]["ports"][0] = 23
+
+    copied = copy.deepcopy(content)
+    copied["host1"]["ports"].append(443)
+    copied["host1"]["tags"].append("new")
+    self.assertEqual(type(copied["host1"]), dict)
+    self.assertEqual(content["host1"]["ports"], [22, 80])
+    self.assertEqual(pickle.loads(pickle.dumps(content)), content)
+
 #############################################################################
 #############################################################################
 if __name__ == "__main__":
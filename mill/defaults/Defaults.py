@@ -4,15 +4,24 @@
 # Copyright Red Hat
 #
 import copy
-import inspect
-import importlib.resources
 import logging
 import os
+import sys
+import threading
 
-from mill import data
+from mill import data, instrument
 
 log = logging.getLogger(__name__)
 
+# Serializes the lazy initialization of class-level defaults state so that
+# it is performed exactly once regardless of the number of threads
+# requesting it concurrently.
+_initializationLock = threading.RLock()
+
+# The Config of each package, by package name, shared by the package's
+# classes.
+_packageConfigs = {}
+
 ######################################################################
 ######################################################################
 class DefaultsException(Exception):
@@ -151,9 +160,20 @@ class DefaultsFileBaseMixin(object):
   ####################################################################
   @classmethod
   def _config(cls):
-    if cls.__config is None:
-      cls.__config = Config(cls)
-    return cls.__config
+    config = cls.__config
+    if config is None:
+      with _initializationLock:
+        config = cls.__config
+        if config is None:
+          # The config is determined solely by the class's package; read it
+          # once per package rather than once per class.
+          package = cls._filePackage()
+          config = _packageConfigs.get(package)
+          if config is None:
+            config = Config(cls)
+            _packageConfigs[package] = config
+          cls.__config = config
+    return config
 
   ####################################################################
   @classmethod
@@ -180,7 +200,7 @@ class DefaultsFileBaseMixin(object):
   ####################################################################
   @classmethod
   def _filePackage(cls):
-    return inspect.getmodule(cls).__package__
+    return sys.modules[cls.__module__].__package__
 
   ####################################################################
   @classmethod
@@ -204,6 +224,7 @@ class DefaultsFileBaseMixin(object):
     # The class seeking to access the defaults could be arbitrarily deep
     # in the class hierarchy.  We work our way up from the package the class
     # is in until we find the defaults or exhaust the hierarchy.
+    import importlib.resources
     while True:
       try:
         # We use importlib.resources.path to get the file path.
@@ -237,6 +258,134 @@ class DefaultsFileInfo(DefaultsFileBaseMixin):
   ####################################################################
   @classmethod
   def defaults(cls, path = None, sourceDictionary = None):
+    """Returns the content of the specified path from the class's defaults,
+    user defaults overriding system defaults.
+
+    The lookup is traced as a 'defaults.lookup' span whose 'defaults.source'
+    attribute is that of the content: 'user', 'system' or 'dictionary'; its
+    'defaults.file' that of the file providing it.
+    """
+    if not instrument.Tracer.enabled():
+      return cls.__lookup(instrument.Tracer.nullSpan(), path,
+                          sourceDictionary)
+    with instrument.Tracer.span("defaults.lookup",
+                                {"defaults.class" : cls.__name__,
+                                 "defaults.path" : (None if path is None
+                                                         else "/".join(path))}
+                                ) as span:
+      return cls.__lookup(span, path, sourceDictionary)
+
+  ####################################################################
+  @classmethod
+  def defaultsFingerprint(cls):
+    """Returns a string which changes if any of the class's defaults files,
+    system or user, is modified, created or removed.
+    """
+    sources = []
+    for defaults in cls._defaults():
+      system = defaults["system"].path
+      # The user defaults, if not extant, are included so that their
+      # creation is detected.
+      user = os.path.join(os.environ.get("HOME", ""),
+                          ".{0}".format(os.path.basename(system)))
+      if defaults["user"] is not None:
+        user = defaults["user"].path
+      for path in (system, user):
+        try:
+          stat = os.stat(path)
+          sources.append("{0}:{1}:{2}".format(path, stat.st_mtime_ns,
+                                              stat.st_size))
+        except OSError:
+          sources.append("{0}:-".format(path))
+    import hashlib
+    return hashlib.sha1("\n".join(sources).encode("utf-8")).hexdigest()
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  @classmethod
+  def __init_subclass__(subclass, **kwargs):
+    super().__init_subclass__(**kwargs)
+    with instrument.PhaseTimer.phase("defaults.init-subclass"):
+      subclass.__initializeDefaults()
+
+  ####################################################################
+  # Protected methods
+  ####################################################################
+  @classmethod
+  def _defaults(cls):
+    return cls.__defaults
+
+  ####################################################################
+  @classmethod
+  def _overridenCopy(cls, base, update):
+    """Returns a deep copy of the base dictionary recursively updated from the
+    update dictionary.  Updates occur only on terminal values; i.e., no
+    wholesale replacement of intermediate dictionaries.  Also, only
+    pre-existing content in the base dictionary is updated; any "new" content
+    in the update dictionary raises an exception.
+    """
+    def _do_override(base, update):
+      for key in update:
+        if key not in base:
+          raise RuntimeError(
+                  "adding content not supported; key: {0}".format(key))
+
+        if ((base[key] is None) and (not isinstance(update[key], dict))):
+          base[key] = update[key]
+          continue
+
+        if not isinstance(base[key], type(update[key])):
+          raise TypeError("content type mismatch; key: {0}".format(key))
+
+        if not isinstance(base[key], dict):
+          base[key] = update[key]
+          continue
+
+        _do_override(base[key], update[key])
+      return base
+
+    # Both are deep copied so that compact (immutable) data is ordinary in
+    # the copy and comparable to ordinary data.
+    return _do_override(copy.deepcopy(base), copy.deepcopy(update))
+
+  ####################################################################
+  # Private methods
+  ####################################################################
+  @classmethod
+  def __initializeDefaults(cls):
+    # Get the unique (by package), in-order classes from the class's MRO.
+    classes = []
+    packages = []
+    for klass in cls.mro():
+      if klass is object:
+        continue
+      package = sys.modules[klass.__module__].__package__
+      if (package not in packages) and issubclass(klass, DefaultsFileInfo):
+        packages.append(package)
+        classes.append(klass)
+
+    # Construct the in-order system and user defaults from each class.
+    cls.__defaults = []
+    for klass in classes:
+      path = klass._filePath()
+      if path is not None:
+        system = Defaults(path)
+        user = None
+        try:
+          user = Defaults(os.path.join(os.environ["HOME"],
+                                       ".{0}".format(klass._fileName())))
+        except DefaultsFileDoesNotExistException:
+          pass
+        except DefaultsException as ex:
+          log.warn("exception instantiating user defaults: {0}".format(ex))
+          log.warn("using global defaults solely")
+
+        cls.__defaults.append({"system": system, "user": user})
+
+  ####################################################################
+  @classmethod
+  def __lookup(cls, span, path, sourceDictionary):
     # We allow that there is no backing defaults in which case the response
     # is None.
     if len(cls._defaults()) == 0:
@@ -246,6 +395,7 @@ class DefaultsFileInfo(DefaultsFileBaseMixin):
     # not a particular defaults.
     # Any extant entry always has a system defaults; simply use the first one.
     if sourceDictionary is not None:
+      span.setAttribute("defaults.source", "dictionary")
       return cls._defaults()[0]["system"].content(path, sourceDictionary)
 
     # Establish a path string which may be needed more than once for logging
@@ -279,6 +429,8 @@ class DefaultsFileInfo(DefaultsFileBaseMixin):
               raise RuntimeError(
                       "exception accessing user matching system defaults")
             userContent = cls._overridenCopy(systemContent, userContent)
+          span.setAttribute("defaults.source", "user")
+          span.setAttribute("defaults.file", defaults["user"].path)
           return userContent
         except  DefaultsFileContentMissingException:
           # No user override.  No need to log anything, but re-raise it to
@@ -293,7 +445,10 @@ class DefaultsFileInfo(DefaultsFileBaseMixin):
         log.debug("querying defaults {0} for path: '{1}'"
                   .format(defaults["system"].path, pathString))
         try:
-          return defaults["system"].content(path)
+          content = defaults["system"].content(path)
+          span.setAttribute("defaults.source", "system")
+          span.setAttribute("defaults.file", defaults["system"].path)
+          return content
         except  DefaultsFileContentMissingException:
           # No value.  Hopefully the next set of defaults will have it.
           pass
@@ -303,79 +458,6 @@ class DefaultsFileInfo(DefaultsFileBaseMixin):
     # We've exhausted all the defaults and didn't find the requested value.
     raise DefaultsFileContentMissingException(pathString)
 
-  ####################################################################
-  # Overridden methods
-  ####################################################################
-  @classmethod
-  def __init_subclass__(subclass, **kwargs):
-    super().__init_subclass__(**kwargs)
-    # Get the unique (by package), in-order classes from the subclass's MRO.
-    classes = []
-    packages = []
-    for klass in subclass.mro():
-      if klass is object:
-        continue
-      package = inspect.getmodule(klass).__package__
-      if (package not in packages) and issubclass(klass, DefaultsFileInfo):
-        packages.append(package)
-        classes.append(klass)
-
-    # Construct the in-order system and user defaults from each class.
-    subclass.__defaults = []
-    for klass in classes:
-      path = klass._filePath()
-      if path is not None:
-        system = Defaults(path)
-        user = None
-        try:
-          user = Defaults(os.path.join(os.environ["HOME"],
-                                       ".{0}".format(klass._fileName())))
-        except DefaultsFileDoesNotExistException:
-          pass
-        except DefaultsException as ex:
-          log.warn("exception instantiating user defaults: {0}".format(ex))
-          log.warn("using global defaults solely")
-
-        subclass.__defaults.append({"system": system, "user": user})
-
-  ####################################################################
-  # Protected methods
-  ####################################################################
-  @classmethod
-  def _defaults(cls):
-    return cls.__defaults
-
-  ####################################################################
-  @classmethod
-  def _overridenCopy(cls, base, update):
-    """Returns a deep copy of the base dictionary recursively updated from the
-    update dictionary.  Updates occur only on terminal values; i.e., no
-    wholesale replacement of intermediate dictionaries.  Also, only
-    pre-existing content in the base dictionary is updated; any "new" content
-    in the update dictionary raises an exception.
-    """
-    def _do_override(base, update):
-      for key in update:
-        if key not in base:
-          raise RuntimeError(
-                  "adding content not supported; key: {0}".format(key))
-
-        if ((base[key] is None) and (not isinstance(update[key], dict))):
-          base[key] = update[key]
-          continue
-
-        if not isinstance(base[key], type(update[key])):
-          raise TypeError("content type mismatch; key: {0}".format(key))
-
-        if not isinstance(base[key], dict):
-          base[key] = update[key]
-          continue
-
-        _do_override(base[key], update[key])
-      return base
-
-    return _do_override(copy.deepcopy(base), update)
-
 ######################################################################
 ######################################################################
 class Config(Defaults, DefaultsFileBaseMixin):
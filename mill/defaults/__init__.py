@@ -3,10 +3,16 @@
 #
 # Copyright Red Hat
 #
-from .Defaults import (Defaults,
-                      DefaultsException,
-                      DefaultsFileContentMissingException,
-                      DefaultsFileDoesNotExistException,
-                      DefaultsFileException,
-                      DefaultsFileFormatException,
-                      DefaultsFileInfo)
+# The package's attributes are provided lazily, importing the submodule
+# defining an attribute upon first access; see mill._lazy.
+from mill import _lazy
+
+(__getattr__, __dir__) = _lazy.lazyAttributes(globals(), {
+  "Defaults"                            : ".Defaults",
+  "DefaultsException"                   : ".Defaults",
+  "DefaultsFileContentMissingException" : ".Defaults",
+  "DefaultsFileDoesNotExistException"   : ".Defaults",
+  "DefaultsFileException"               : ".Defaults",
+  "DefaultsFileFormatException"         : ".Defaults",
+  "DefaultsFileInfo"                    : ".Defaults"
+})
@@ -0,0 +1,84 @@
+#! /usr/bin/env python
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+
+import os
+import tempfile
+import unittest
+
+from mill import defaults
+
+#############################################################################
+#############################################################################
+class Test_DefaultsFileInfo(unittest.TestCase):
+
+  ####################################################################
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.environment = dict(os.environ)
+    os.environ["HOME"] = self.directory.name
+
+    self.systemPath = os.path.join(self.directory.name, "system.yml")
+    with open(self.systemPath, "w") as f:
+      f.write("""---
+        defaults:
+          server:
+            name: system
+            ports: [22, 80]
+            options:
+              verbose: false
+              tags: [a, b]
+        """)
+    with open(os.path.join(self.directory.name, ".system.yml"), "w") as f:
+      f.write("""---
+        defaults:
+          server:
+            ports: [8022, 8080]
+            options:
+              tags: [c]
+        """)
+
+  ####################################################################
+  def tearDown(self):
+    os.environ.clear()
+    os.environ.update(self.environment)
+    self.directory.cleanup()
+
+  ####################################################################
+  # Returns a class whose defaults are the test's system and user files.
+  def defaultsClass(self):
+    systemPath = self.systemPath
+
+    class Server(defaults.DefaultsFileInfo):
+      @classmethod
+      def _fileName(cls):
+        return os.path.basename(systemPath)
+
+      @classmethod
+      def _filePath(cls):
+        return systemPath
+
+    return Server
+
+  ####################################################################
+  # User defaults override nested content of the system defaults, whether
+  # or not the data is compact.
+  def test_userOverride(self):
+    expected = { "name" : "system",
+                 "ports" : [8022, 8080],
+                 "options" : { "verbose" : False, "tags" : ["c"] } }
+    for compact in ("0", "1"):
+      os.environ["PYTHON_MILL_DATA_COMPACT"] = compact
+      server = self.defaultsClass()
+      content = server.defaults(["server"])
+      self.assertEqual(content, expected, compact)
+      self.assertEqual(type(content["options"]["tags"]), list)
+      self.assertEqual(server.defaults(["server", "ports"]), [8022, 8080])
+
+#############################################################################
+#############################################################################
+if __name__ == "__main__":
+  unittest.main()
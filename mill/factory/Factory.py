@@ -6,32 +6,75 @@
 import argparse
 import logging
 import os
+import threading
 
-from mill import defaults
+from mill import defaults, instrument
 from .FactoryArgumentParser import (FactoryArgumentParser,
                                     FactoryNullArgumentParser)
-
-# Default logging config.
-logging.basicConfig(level = logging.INFO
-                            if int(os.getenv("PYTHON_FACTORY_DEBUG", "0")) == 0
-                            else logging.DEBUG)
+from .FactoryPool import FactoryPool
 
 log = logging.getLogger(__name__)
 
+# Serializes the lazy initialization of class-level factory state so that
+# it is performed exactly once regardless of the number of threads
+# requesting it concurrently.  Reentrant as the initialization of one
+# factory's state may require that of another.
+_initializationLock = threading.RLock()
+
+# Incremented upon the definition of each factory class.  State derived from
+# the class hierarchy (the mapping and the argument parser) records the
+# generation read before it was derived and is discarded once the hierarchy
+# has changed; a class defined while it was being derived thus invalidates
+# it.  A module global rather than a class attribute as assigning
+# an attribute of a class invalidates the type caches of all its subclasses;
+# i.e., of every factory class.
+_generation = 0
+
+# Whether the default logging configuration has been established; see
+# Factory._configureLogging().
+_loggingConfigured = False
+
 ########################################################################
 class _AttributeMixin(object):
   @classmethod
   def __init_subclass__(subclass, **kwargs):
+    global _generation
     super().__init_subclass__(**kwargs)
-    subclass.__mapping = None
+    subclass.__mapping = (None, None)
+    subclass.__argumentParser = (None, None)
+    subclass.__pool = None
+    with _initializationLock:
+      _generation += 1
+
+  @classmethod
+  def _getArgumentParser(cls):
+    (generation, parser) = cls.__argumentParser
+    return parser if generation == _generation else None
+
+  @classmethod
+  def _getGeneration(cls):
+    return _generation
 
   @classmethod
   def _getMapping(cls):
-    return cls.__mapping
+    (generation, mapping) = cls.__mapping
+    return mapping if generation == _generation else None
+
+  @classmethod
+  def _getPool(cls):
+    return cls.__pool
+
+  @classmethod
+  def _setArgumentParser(cls, parser, generation):
+    cls.__argumentParser = (generation, parser)
 
   @classmethod
-  def _setMapping(cls, mapping):
-    cls.__mapping = mapping
+  def _setMapping(cls, mapping, generation):
+    cls.__mapping = (generation, mapping)
+
+  @classmethod
+  def _setPool(cls, pool):
+    cls.__pool = pool
 
 ########################################################################
 ########################################################################
@@ -59,7 +102,8 @@ class Factory(_AttributeMixin, defaults.DefaultsFileInfo):
   #
   # Each potential name will be stripped of leading and trailing whitespace.
   # If a potential name contains embedded whitespace it will be skipped.
-  # Duplicate names will be removed.
+  # Duplicate names will be removed.  The first remaining name is the item's
+  # primary name, the others being aliases.
   #
   # If no potential name passes the above checks the default will be used.
   #
@@ -68,6 +112,12 @@ class Factory(_AttributeMixin, defaults.DefaultsFileInfo):
   # choice value.
   _name = None
 
+  # If _poolable is overridden as True instances of the class are pooled by
+  # the factory.  Instances released back to the factory via releaseItem()
+  # are reset (see _poolReset()) and handed out again by makeItem() when
+  # requested with equal arguments rather than instantiating a new item.
+  _poolable = False
+
   ####################################################################
   # Public factory-behavior methods
   ####################################################################
@@ -98,33 +148,92 @@ class Factory(_AttributeMixin, defaults.DefaultsFileInfo):
     A value of None indicates that the subclass's default mapping is to be
     used.
     """
-    haveChoices = len(cls.choices()) > 0
-    if itemName is None:
-      parser = cls._argumentParser()
-      if args is None:
-        args = parser.parse_args()
-      if haveChoices:
-        itemName = vars(args)[parser.parserDestination()]
-      else:
-        itemName = cls._rootClass().name()
+    if not instrument.Tracer.enabled():
+      return cls.__makeItem(instrument.Tracer.nullSpan(), itemName, args,
+                            option)
+    with instrument.Tracer.span("factory.makeItem",
+                                {"factory.class" : cls.className()}) as span:
+      return cls.__makeItem(span, itemName, args, option)
 
-    # Set debug level logging, if specified.
-    if (args is not None) and args.factoryDebug:
-      logging.basicConfig(level = logging.DEBUG, force = True)
+  ####################################################################
+  @classmethod
+  async def makeItemAsync(cls, itemName = None, args = None, option = None):
+    """Awaitable form of makeItem().
 
-    log.debug("instantiating item '{0}'{1}"
-                .format(itemName,
-                        "" if option is None
-                           else " with mapping option '{0}'".format(option)))
-    itemClass = (cls._item(itemName, option) if haveChoices
-                                             else cls._rootClass())
-    return itemClass(args)
+    Once the item is obtained its _initializeAsync() coroutine is awaited,
+    permitting items to perform I/O-bound initialization without blocking
+    the event loop.
+    """
+    item = cls.makeItem(itemName, args, option)
+    await item._initializeAsync()
+    return item
+
+  ####################################################################
+  @classmethod
+  def makeItems(cls, specifications, workers = None, processes = False):
+    """Instantiates multiple items concurrently.
+
+    'specifications' is a sequence of (itemName, args, option) tuples each
+    having the meaning of the same-named makeItem() arguments; trailing
+    elements may be omitted.
+
+    The items are instantiated on a pool of 'workers' threads or, if
+    'processes' is True, processes (in which case the items and their
+    arguments must be picklable).  A value of None for 'workers' uses the
+    concurrent.futures default.
+
+    Returns a list, in the order of the specifications, of (item, exception)
+    tuples.  For each either the item is None and exception is that raised
+    instantiating the item, or the exception is None.
+    """
+    specifications = [tuple(spec) + ((None,) * (3 - len(spec)))
+                        for spec in specifications]
+
+    # Establish the shared factory state before fanning out so that the
+    # workers do not each perform the discovery.
+    options = []
+    for (itemName, args, option) in specifications:
+      if option not in options:
+        options.append(option)
+    for option in options:
+      cls._mapping(option)
+    cls._itemPool()
+
+    import concurrent.futures
+    executorClass = (concurrent.futures.ProcessPoolExecutor if processes
+                      else concurrent.futures.ThreadPoolExecutor)
+    with executorClass(max_workers = workers) as executor:
+      futures = [executor.submit(_makeItem, cls, *spec)
+                  for spec in specifications]
+
+      results = []
+      for future in futures:
+        try:
+          results.append((future.result(), None))
+        except Exception as ex:
+          log.debug("exception instantiating item: {0}".format(ex))
+          results.append((None, ex))
+    return results
 
   ####################################################################
   @classmethod
   def parserName(cls):
     return None
 
+  ####################################################################
+  @classmethod
+  def releaseItem(cls, item):
+    """Returns an item obtained from makeItem() to the factory for reuse.
+    Returns True if the item was retained for reuse.
+
+    Releasing an item that is not poolable is a no-op.  The released item
+    must not be used by the caller after release.
+    """
+    pool = cls._getPool()
+    if (pool is None) or (not item.poolable()):
+      return False
+    return pool.release(item)
+
   ####################################################################
   # Public instance-behavior methods
   ####################################################################
@@ -132,6 +241,11 @@ class Factory(_AttributeMixin, defaults.DefaultsFileInfo):
   def available(cls):
     return cls._available
 
+  ####################################################################
+  @classmethod
+  def poolable(cls):
+    return cls._poolable
+
   ####################################################################
   @classmethod
   def className(cls):
@@ -150,7 +264,9 @@ class Factory(_AttributeMixin, defaults.DefaultsFileInfo):
       names = []
     if isinstance(names, str):
       names = [names]
-    names = set([x.strip() for x in names if isinstance(x, str)])
+    # Duplicates are removed preserving the declared order; the first name
+    # is the item's primary name.
+    names = dict.fromkeys([x.strip() for x in names if isinstance(x, str)])
     names = [x for x in names if not any(c.isspace() for c in x)]
     if len(names) == 0:
       names = [cls.className().lower()]
@@ -199,12 +315,20 @@ class Factory(_AttributeMixin, defaults.DefaultsFileInfo):
   ####################################################################
   @classmethod
   def _argumentParser(cls):
-    if len(cls.choices()) > 0:
-      parser = cls._argumentParserClass()(set(cls._items()),
-                                          prog = cls.parserName())
-    else:
-      parser = cls._nullArgumentParserClass()(cls._rootClass(),
-                                              prog = cls.parserName())
+    """Returns the argument parser for the factory's items.  The parser is
+    constructed once and shared, until the class hierarchy changes, by all
+    callers; it must not be modified.
+    """
+    parser = cls._getArgumentParser()
+    if parser is None:
+      with _initializationLock:
+        parser = cls._getArgumentParser()
+        if parser is None:
+          generation = cls._getGeneration()
+          with instrument.PhaseTimer.phase("factory.argument-parser"):
+            parser = cls.__makeArgumentParser()
+          instrument.PhaseTimer.count("factory.parsers-built")
+          cls._setArgumentParser(parser, generation)
     return parser
 
   ####################################################################
@@ -212,11 +336,43 @@ class Factory(_AttributeMixin, defaults.DefaultsFileInfo):
   def _argumentParserClass(cls):
     return FactoryArgumentParser
 
+  ####################################################################
+  @classmethod
+  def _configureLogging(cls):
+    """Establishes the program's default logging configuration, once; debug
+    level if PYTHON_FACTORY_DEBUG is non-zero, otherwise info.  Does nothing
+    if logging has already been configured.
+
+    Performed upon the first use of a factory, or by FactoryShell, rather
+    than upon importing the package, so that programs which configure
+    logging before then retain control of it.
+    """
+    global _loggingConfigured
+    if _loggingConfigured:
+      return
+    _loggingConfigured = True
+    logging.basicConfig(level = logging.INFO
+                                if int(os.getenv("PYTHON_FACTORY_DEBUG",
+                                                 "0")) == 0
+                                else logging.DEBUG)
+
   ####################################################################
   @classmethod
   def _defaultChoice(cls):
     return None
 
+  ####################################################################
+  @classmethod
+  def _itemPool(cls):
+    pool = cls._getPool()
+    if pool is None:
+      with _initializationLock:
+        pool = cls._getPool()
+        if pool is None:
+          pool = FactoryPool(cls._poolMaximum(), cls._poolIdleTimeout())
+          cls._setPool(pool)
+    return pool
+
   ####################################################################
   @classmethod
   def _mapping(cls, option = None):
@@ -226,24 +382,50 @@ class Factory(_AttributeMixin, defaults.DefaultsFileInfo):
     A value of None indicates that the subclass's default mapping is to be
     used.
     """
-    if cls._getMapping() is None:
-      # Available entities are identified by having a True availability.
-      klasses = cls.__getClasses(cls._rootClass())
-
-      mapping = []
-      for klass in klasses:
-        mapping.extend([(name, klass) for name in klass.names()])
-      cls._setMapping(dict(mapping))
-
-      log.debug("discovered instantiable items: {0}"
-                  .format(', '.join(cls._getMapping().keys())))
-    return cls._getMapping()
+    # The mapping is only published once complete so that a reader either
+    # sees None or the complete mapping.
+    mapping = cls._getMapping()
+    if mapping is None:
+      cls._configureLogging()
+      with _initializationLock:
+        mapping = cls._getMapping()
+        if mapping is None:
+          generation = cls._getGeneration()
+          with instrument.Tracer.span("factory.discovery",
+                                      {"factory.class" : cls.className()}
+                                      ) as span:
+            with instrument.PhaseTimer.phase("factory.discovery"):
+              mapping = cls.__discoverMapping()
+            span.setAttribute("factory.items", len(mapping))
+          instrument.PhaseTimer.count("factory.items-discovered",
+                                      len(mapping))
+          cls._setMapping(mapping, generation)
+
+          log.debug("discovered instantiable items: {0}"
+                      .format(', '.join(mapping.keys())))
+    return mapping
 
   ####################################################################
   @classmethod
   def _nullArgumentParserClass(cls):
     return FactoryNullArgumentParser
 
+  ####################################################################
+  @classmethod
+  def _poolIdleTimeout(cls):
+    """Returns the number of seconds a released item may remain idle in
+    the pool before being evicted.  None disables idle eviction.
+    """
+    return 300
+
+  ####################################################################
+  @classmethod
+  def _poolMaximum(cls):
+    """Returns the maximum number of idle items retained per item class
+    and arguments.
+    """
+    return 8
+
   ####################################################################
   @classmethod
   def _rootClass(cls):
@@ -305,14 +487,113 @@ class Factory(_AttributeMixin, defaults.DefaultsFileInfo):
 
   ####################################################################
   # Private factory-behavior methods
+
+  ####################################################################
+  @classmethod
+  def __discoverMapping(cls):
+    # Available entities are identified by having a True availability.  An
+    # item inheriting its names from another supersedes it; otherwise names
+    # must be unique, including among items inheriting them from a common,
+    # unavailable, base.
+    mapping = {}
+    for klass in cls.__getClasses(cls._rootClass()):
+      for name in klass.names():
+        other = mapping.setdefault(name, klass)
+        if issubclass(other, klass):
+          continue
+        if not issubclass(klass, other):
+          raise ValueError("duplicate {0} item name '{1}': {2} and {3}"
+                            .format(cls.className(), name, other.className(),
+                                    klass.className()))
+        mapping[name] = klass
+    return mapping
+
   ####################################################################
   @classmethod
   def __getClasses(cls, klass):
-    klasses = [] if not klass.available() else [klass]
-    for subclass in klass.__subclasses__():
-      klasses.extend(cls.__getClasses(subclass))
+    # Returns the available classes of the hierarchy rooted at klass, in
+    # pre-order.  The walk is iterative, so the depth of the hierarchy is not
+    # limited by the recursion limit, and visits each class once, even if
+    # reachable via multiple bases.
+    klasses = []
+    visited = set()
+    pending = [klass]
+    while len(pending) > 0:
+      klass = pending.pop()
+      if klass in visited:
+        continue
+      visited.add(klass)
+      if klass.available():
+        klasses.append(klass)
+      pending.extend(reversed(klass.__subclasses__()))
     return klasses
 
+  ####################################################################
+  @classmethod
+  def __makeArgumentParser(cls):
+    if len(cls._itemNames()) > 0:
+      return cls._argumentParserClass()(set(cls._items()),
+                                        prog = cls.parserName())
+    return cls._nullArgumentParserClass()(cls._rootClass(),
+                                          prog = cls.parserName())
+
+  ####################################################################
+  @classmethod
+  def __makeItem(cls, span, itemName, args, option):
+    haveChoices = len(cls._itemNames()) > 0
+    if itemName is None:
+      parser = cls._argumentParser()
+      if args is None:
+        args = parser.parse_args()
+      if haveChoices:
+        itemName = vars(args)[parser.parserDestination()]
+      else:
+        itemName = cls._rootClass().name()
+
+    # Set debug level logging, if specified.
+    if (args is not None) and args.factoryDebug:
+      logging.basicConfig(level = logging.DEBUG, force = True)
+
+    log.debug("instantiating item '{0}'{1}"
+                .format(itemName,
+                        "" if option is None
+                           else " with mapping option '{0}'".format(option)))
+    itemClass = (cls._item(itemName, option) if haveChoices
+                                             else cls._rootClass())
+    span.setAttribute("factory.item", itemName)
+
+    pool = cls._itemPool() if itemClass.poolable() else None
+    item = None if pool is None else pool.acquire(itemClass, args)
+    span.setAttribute("factory.pool-hit", item is not None)
+    if item is None:
+      item = itemClass(args)
+      if pool is not None:
+        pool.register(item, itemClass, args)
+    return item
+
+  ####################################################################
+  # Protected instance-behavior methods
+  ####################################################################
+  async def _initializeAsync(self):
+    """Invoked by makeItemAsync() on each item it returns.  Subclasses
+    override this to perform initialization requiring awaiting.
+    """
+    pass
+
+  ####################################################################
+  def _poolReset(self):
+    """Invoked when a poolable item is released back to the factory.
+    Subclasses override this to return the item to the state it had
+    immediately after instantiation.
+    """
+    pass
+
   ####################################################################
   # Private instance-behavior methods
   ####################################################################
+
+########################################################################
+########################################################################
+def _makeItem(factoryClass, itemName, args, option):
+  # Module-level so that it may be used with a process pool.
+  return factoryClass.makeItem(itemName, args, option)
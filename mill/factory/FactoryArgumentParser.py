@@ -34,6 +34,15 @@ class FactoryArgumentParser(argparse.ArgumentParser):
   def parserTitle(cls):
     return "factory item specification"
 
+  ####################################################################
+  def itemParsers(self):
+    """Returns a dictionary mapping each item name to its parser.
+    """
+    for action in self._actions:
+      if isinstance(action, argparse._SubParsersAction):
+        return dict(action.choices)
+    return {}
+
   ####################################################################
   # Overridden methods
   ####################################################################
@@ -58,18 +67,21 @@ class FactoryArgumentParser(argparse.ArgumentParser):
                                 parser_class = argparse.ArgumentParser,
                                 required = True)
 
-    # Add a subparser for each command.
+    # Add a subparser for each command; its additional names are aliases
+    # of the one subparser so that the cost is per item rather than per
+    # name.
     for item in factoryItems:
       parents = item.parserParents()
       epilog = os.linesep.join([parser.epilog for parser in parents
                                               if parser.epilog is not None])
-      for name in item.names():
-        parserAdder.add_parser(name,
-                               formatter_class
-                                = argparse.RawDescriptionHelpFormatter,
-                               parents = parents,
-                               help = item.help(),
-                               epilog = epilog)
+      names = item.names()
+      parserAdder.add_parser(names[0],
+                             aliases = names[1:],
+                             formatter_class
+                              = argparse.RawDescriptionHelpFormatter,
+                             parents = parents,
+                             help = item.help(),
+                             epilog = epilog)
 
   ####################################################################
   # Protected methods
@@ -83,6 +95,15 @@ class FactoryArgumentParser(argparse.ArgumentParser):
 class FactoryNullArgumentParser(argparse.ArgumentParser):
   """Argument parser for factories with no choices.
   """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  def itemParsers(self):
+    """Returns a dictionary mapping each item name to its parser; there
+    being no items the dictionary is empty.
+    """
+    return {}
+
   ####################################################################
   # Overridden methods
   ####################################################################
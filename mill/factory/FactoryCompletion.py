@@ -0,0 +1,173 @@
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+import hashlib
+import json
+import logging
+import os
+import shlex
+import sys
+import tempfile
+
+from . import completion
+
+log = logging.getLogger(__name__)
+
+########################################################################
+class FactoryCompletionIndex(object):
+  """Shell completion index of a factory's item names and their options.
+
+  The index is keyed on a fingerprint of the factory hierarchy: the item
+  names, the classes providing them and the source files defining those
+  classes.  It is only regenerated, which requires constructing the
+  factory's argument parser, when the fingerprint changes.
+
+  The index is answered from by the completion module which imports nothing
+  from mill; see completionScript().
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @classmethod
+  def parserOptions(cls, parser):
+    """Returns the option strings accepted by the argument parser.
+    """
+    return sorted([option for action in parser._actions
+                            for option in action.option_strings])
+
+  ####################################################################
+  def completionScript(self):
+    """Returns a bash script which, when sourced, provides completion for
+    the program from the index.
+    """
+    function = "_mill_complete_{0}".format(
+                  "".join([c if c.isalnum() else "_" for c in self.prog]))
+    command = " ".join([shlex.quote(x) for x in [sys.executable, "-S", "-E",
+                                                 completion.__file__,
+                                                 self.path]])
+    return "\n".join([
+      "{0}() {{".format(function),
+      "  local IFS=$'\\n'",
+      "  COMPREPLY=($({0} \"$COMP_CWORD\" \"${{COMP_WORDS[@]}}\"))"
+        .format(command),
+      "}",
+      "complete -o default -F {0} {1}".format(function, shlex.quote(self.prog)),
+      ""])
+
+  ####################################################################
+  @property
+  def path(self):
+    return self.__path
+
+  ####################################################################
+  @property
+  def prog(self):
+    return self.__prog
+
+  ####################################################################
+  def update(self):
+    """Regenerates the index if it is missing or the factory hierarchy has
+    changed since its generation.  Returns True if the index was written.
+    """
+    (fingerprint, sources) = self._fingerprint()
+
+    index = completion.load(self.path)
+    if (index is not None) and (index.get("fingerprint") == fingerprint):
+      return False
+
+    log.debug("generating completion index {0}".format(self.path))
+    index = self._generate()
+    index["fingerprint"] = fingerprint
+    index["sources"] = sources
+    self._write(index)
+    return True
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, factoryClass, path = None):
+    super(FactoryCompletionIndex, self).__init__()
+    self.__factoryClass = factoryClass
+    self.__prog = factoryClass.parserName()
+    if self.__prog is None:
+      self.__prog = os.path.basename(sys.argv[0])
+    self.__path = path if path is not None else self._defaultPath()
+
+  ####################################################################
+  # Protected methods
+  ####################################################################
+  def _defaultPath(self):
+    directory = os.getenv("XDG_CACHE_HOME",
+                          os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(directory, "python-mill", "completion",
+                        "{0}.json".format(self.prog))
+
+  ####################################################################
+  def _fingerprint(self):
+    """Returns a tuple of the fingerprint of the factory hierarchy and the
+    list of source file descriptors from which it was computed.
+    """
+    items = sorted([(name, "{0}.{1}".format(klass.__module__,
+                                            klass.__qualname__))
+                      for (name, klass)
+                        in self.__factoryClass._mapping().items()])
+
+    classes = set(self.__factoryClass._rootClass().mro())
+    for klass in self.__factoryClass._items():
+      classes.update(klass.mro())
+
+    files = set()
+    for klass in classes:
+      path = getattr(sys.modules.get(klass.__module__), "__file__", None)
+      if path is not None:
+        files.add(os.path.abspath(path))
+
+    sources = []
+    for path in sorted(files):
+      try:
+        stat = os.stat(path)
+      except OSError:
+        continue
+      sources.append([path, stat.st_mtime_ns, stat.st_size])
+
+    digest = hashlib.sha1(json.dumps([self.prog, items, sources])
+                            .encode("utf-8"))
+    return (digest.hexdigest(), sources)
+
+  ####################################################################
+  def _generate(self):
+    parser = self.__factoryClass._argumentParser()
+    itemParsers = parser.itemParsers()
+    items = {}
+    for klass in set(self.__factoryClass._items()):
+      names = klass.names()
+      for name in names:
+        items[name] = {
+          "aliases" : sorted([x for x in names if x != name]),
+          "options" : self.parserOptions(itemParsers[name])
+        }
+
+    return { "prog" : self.prog,
+             "options" : self.parserOptions(parser),
+             "items" : items }
+
+  ####################################################################
+  def _write(self, index):
+    # Write atomically so that concurrent completion never sees a partial
+    # index.
+    directory = os.path.dirname(self.path)
+    os.makedirs(directory, exist_ok = True)
+    (fd, temporary) = tempfile.mkstemp(dir = directory, suffix = ".tmp")
+    try:
+      with os.fdopen(fd, "w") as f:
+        json.dump(index, f)
+      os.replace(temporary, self.path)
+    except Exception:
+      os.unlink(temporary)
+      raise
+
+  ####################################################################
+  # Private methods
+  ####################################################################
@@ -0,0 +1,156 @@
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+import argparse
+import collections
+import logging
+import threading
+import time
+import weakref
+
+log = logging.getLogger(__name__)
+
+########################################################################
+class FactoryPool(object):
+  """Pool of released factory items available for reuse.
+
+  Items are pooled by their class and their arguments; an item is only ever
+  handed back for a request with the same class and equal arguments.  Items
+  whose arguments cannot be reduced to a hashable key are never pooled.
+
+  At most 'maximum' idle items are retained per key.  Idle items which have
+  been in the pool longer than 'idleTimeout' seconds are evicted, those of
+  keys which are no longer requested within a further 'idleTimeout'
+  seconds; a value of None for 'idleTimeout' disables idle eviction.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  def acquire(self, itemClass, args):
+    """Returns a pooled item for the class and arguments or None if there is
+    no such item available.
+    """
+    key = self._key(itemClass, args)
+    if key is None:
+      return None
+
+    with self.__lock:
+      self._evictIdle(key)
+      idle = self.__idle.get(key)
+      if not idle:
+        return None
+      (item, released) = idle.pop()
+      if not idle:
+        del self.__idle[key]
+      self.__outstanding[item] = key
+
+    log.debug("reusing pooled item '{0}'".format(itemClass.name()))
+    return item
+
+  ####################################################################
+  def clear(self):
+    """Discards all idle items.
+    """
+    with self.__lock:
+      self.__idle.clear()
+
+  ####################################################################
+  def idleCount(self, itemClass = None, args = None):
+    """Returns the number of idle items in the pool.  If 'itemClass' is
+    specified the count is restricted to the items of that class and
+    arguments.
+    """
+    with self.__lock:
+      if itemClass is None:
+        return sum([len(x) for x in self.__idle.values()])
+      key = self._key(itemClass, args)
+      return 0 if key is None else len(self.__idle.get(key, []))
+
+  ####################################################################
+  def register(self, item, itemClass, args):
+    """Registers a newly instantiated item as being outstanding from the
+    pool.  Returns True if the item can be returned to the pool on release.
+    """
+    key = self._key(itemClass, args)
+    if key is None:
+      return False
+    with self.__lock:
+      self.__outstanding[item] = key
+    return True
+
+  ####################################################################
+  def release(self, item):
+    """Returns the item to the pool after resetting it.  Returns True if the
+    item was retained by the pool.
+    """
+    with self.__lock:
+      key = self.__outstanding.pop(item, None)
+    if key is None:
+      return False
+
+    item._poolReset()
+
+    with self.__lock:
+      self._evictIdle(key)
+      idle = self.__idle[key]
+      if len(idle) >= self.__maximum:
+        return False
+      idle.append((item, time.monotonic()))
+    return True
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, maximum = 8, idleTimeout = None):
+    super(FactoryPool, self).__init__()
+    self.__maximum = maximum
+    self.__idleTimeout = idleTimeout
+    self.__idle = collections.defaultdict(list)
+    self.__outstanding = weakref.WeakKeyDictionary()
+    self.__lock = threading.Lock()
+    self.__swept = time.monotonic()
+
+  ####################################################################
+  # Protected methods
+  ####################################################################
+  def _evictIdle(self, key):
+    # Must be called with the lock held.  Evicts the expired items of the
+    # key and, at most once per idle timeout, those of every key so that the
+    # items of keys no longer requested are also evicted.
+    if self.__idleTimeout is None:
+      return
+    now = time.monotonic()
+    expired = now - self.__idleTimeout
+    if now - self.__swept >= self.__idleTimeout:
+      self.__swept = now
+      keys = list(self.__idle.keys())
+    else:
+      keys = [key] if key in self.__idle else []
+
+    for key in keys:
+      idle = self.__idle[key]
+      # Items are appended in release order; the oldest are first.
+      count = 0
+      while (count < len(idle)) and (idle[count][1] < expired):
+        count += 1
+      if count == len(idle):
+        del self.__idle[key]
+      elif count > 0:
+        del idle[:count]
+
+  ####################################################################
+  def _key(self, itemClass, args):
+    if args is None:
+      key = (itemClass, None)
+    elif isinstance(args, argparse.Namespace):
+      key = (itemClass, tuple(sorted(vars(args).items())))
+    else:
+      key = (itemClass, args)
+
+    try:
+      hash(key)
+    except TypeError:
+      key = None
+    return key
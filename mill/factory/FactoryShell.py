@@ -3,6 +3,11 @@
 #
 # Copyright Red Hat
 #
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
 ########################################################################
 class FactoryShell(object):
   """Base class for instantiation.
@@ -13,8 +18,19 @@ class FactoryShell(object):
   def printChoices(self):
    print("Choices: {0}".format(", ".join(self.__factoryClass.choices())))
 
+  ####################################################################
+  def printCompletionScript(self):
+    """Prints the bash script providing completion for the factory's
+    program.  The completion index is generated if necessary.
+    """
+    from .FactoryCompletion import FactoryCompletionIndex
+    index = FactoryCompletionIndex(self.__factoryClass)
+    index.update()
+    print(index.completionScript())
+
   ####################################################################
   def run(self):
+    self._updateCompletionIndex()
     return self.__factoryClass.makeItem()
 
   ####################################################################
@@ -23,10 +39,35 @@ class FactoryShell(object):
   def __init__(self, factoryClass):
     super(FactoryShell, self).__init__()
     self.__factoryClass = factoryClass
+    self._configureLogging()
 
   ####################################################################
   # Protected methods
   ####################################################################
+  def _configureLogging(self):
+    """Establishes the program's default logging configuration; see
+    Factory._configureLogging().
+    """
+    self.__factoryClass._configureLogging()
+
+  ####################################################################
+  @property
+  def _factoryClass(self):
+    return self.__factoryClass
+
+  ####################################################################
+  def _updateCompletionIndex(self):
+    # Maintain the shell completion index, if enabled.  Failure to do so
+    # does not affect execution.
+    if int(os.getenv("PYTHON_FACTORY_COMPLETION", "0")) == 0:
+      return
+    # Imported here so that programs not maintaining the index do not pay
+    # for importing it.
+    from .FactoryCompletion import FactoryCompletionIndex
+    try:
+      FactoryCompletionIndex(self.__factoryClass).update()
+    except Exception as ex:
+      log.debug("unable to update completion index: {0}".format(ex))
 
   ####################################################################
   # Private methods
@@ -3,7 +3,15 @@
 #
 # Copyright Red Hat
 #
-from .Factory import Factory
-from .FactoryArgumentParser import (FactoryArgumentParser,
-                                    FactoryNullArgumentParser)
-from .FactoryShell import FactoryShell
+# The package's attributes are provided lazily, importing the submodule
+# defining an attribute upon first access; see mill._lazy.
+from mill import _lazy
+
+(__getattr__, __dir__) = _lazy.lazyAttributes(globals(), {
+  "Factory"                   : ".Factory",
+  "FactoryArgumentParser"     : ".FactoryArgumentParser",
+  "FactoryNullArgumentParser" : ".FactoryArgumentParser",
+  "FactoryCompletionIndex"    : ".FactoryCompletion",
+  "FactoryPool"               : ".FactoryPool",
+  "FactoryShell"              : ".FactoryShell"
+})
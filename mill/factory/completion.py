@@ -0,0 +1,105 @@
+#! /usr/bin/env python
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+"""Answers shell completion requests from a factory completion index.
+
+This module deliberately imports nothing from mill so that it can be
+executed directly, by path, without importing the factory or any of its
+items:
+
+  python3 -S completion.py <index-path> <current-word-index> <word> ...
+
+where the words are those of the command line being completed (the first
+being the program name).  The completions are written to stdout one per
+line.  If the index is missing, stale or of another format nothing is
+written.  When installed the module is also available as the
+mill-completion script taking the same arguments.
+
+See FactoryCompletionIndex for the generation of the index and the shell
+script which invokes this module.
+"""
+import json
+import os
+import sys
+
+#############################################################################
+def complete(index, words, current):
+  """Returns the sorted completions of words[current] from the index.
+  """
+  words = list(words)
+  if current >= len(words):
+    words.extend([""] * (current - len(words) + 1))
+  prefix = words[current]
+
+  # The item, if any, is the first preceding word which names one.
+  item = None
+  for word in words[1:current]:
+    if word in index["items"]:
+      item = index["items"][word]
+      break
+
+  if prefix.startswith("-"):
+    candidates = index["options"] if item is None else item["options"]
+  elif item is None:
+    candidates = index["items"].keys()
+  else:
+    candidates = []
+
+  return sorted(set([x for x in candidates if x.startswith(prefix)]))
+
+#############################################################################
+def isCurrent(index):
+  """Returns True if none of the source files from which the index was
+  generated have changed since.  An index without its sources, as from a
+  truncated or older format index, is stale.
+  """
+  try:
+    for (path, mtime, size) in index["sources"]:
+      try:
+        stat = os.stat(path)
+      except OSError:
+        return False
+      if (stat.st_mtime_ns != mtime) or (stat.st_size != size):
+        return False
+  except (KeyError, TypeError, ValueError):
+    return False
+  return True
+
+#############################################################################
+def load(path):
+  """Returns the index at the path or None if there is no usable index.
+  """
+  try:
+    with open(path) as f:
+      index = json.load(f)
+  except (OSError, ValueError):
+    return None
+  if not (isinstance(index, dict)
+          and all([key in index for key in ("items", "options")])):
+    return None
+  return index if isCurrent(index) else None
+
+#############################################################################
+def main(argv = None):
+  if argv is None:
+    argv = sys.argv[1:]
+  if len(argv) < 3:
+    return 2
+  index = load(argv[0])
+  if index is not None:
+    try:
+      completions = complete(index, argv[2:], int(argv[1]))
+    except (KeyError, TypeError, AttributeError):
+      # Malformed item entries; answer nothing until the index is rebuilt.
+      completions = []
+    for completion in completions:
+      print(completion)
+  return 0
+
+#############################################################################
+#############################################################################
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,459 @@
+#! /usr/bin/env python
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from mill import factory, instrument
+
+#############################################################################
+#############################################################################
+class PoolFactory(factory.Factory):
+  instantiations = 0
+
+  ####################################################################
+  def __init__(self, args):
+    super(PoolFactory, self).__init__(args)
+    PoolFactory.instantiations += 1
+    self.state = "fresh"
+
+  ####################################################################
+  def _poolReset(self):
+    self.state = "fresh"
+
+#############################################################################
+class PooledItem(PoolFactory):
+  _available = True
+  _poolable = True
+
+#############################################################################
+class UnpooledItem(PoolFactory):
+  _available = True
+
+#############################################################################
+#############################################################################
+class Test_FactoryPool(unittest.TestCase):
+
+  ####################################################################
+  def setUp(self):
+    PoolFactory._itemPool().clear()
+    PoolFactory.instantiations = 0
+
+  ####################################################################
+  # Released items are reset and reused for equal arguments.
+  def test_reuse(self):
+    args = argparse.Namespace(factoryDebug = False, value = 1)
+    item = PoolFactory.makeItem("pooleditem", args)
+    item.state = "used"
+    self.assertTrue(PoolFactory.releaseItem(item))
+
+    reused = PoolFactory.makeItem("pooleditem",
+                                  argparse.Namespace(factoryDebug = False,
+                                                     value = 1))
+    self.assertIs(reused, item)
+    self.assertEqual(reused.state, "fresh")
+    self.assertEqual(PoolFactory.instantiations, 1)
+
+  ####################################################################
+  # Items are not reused for differing arguments.
+  def test_differentArgs(self):
+    item = PoolFactory.makeItem("pooleditem",
+                                argparse.Namespace(factoryDebug = False,
+                                                   value = 1))
+    PoolFactory.releaseItem(item)
+    other = PoolFactory.makeItem("pooleditem",
+                                 argparse.Namespace(factoryDebug = False,
+                                                    value = 2))
+    self.assertIsNot(other, item)
+    self.assertEqual(PoolFactory.instantiations, 2)
+
+  ####################################################################
+  # Unhashable arguments are never pooled.
+  def test_unhashableArgs(self):
+    args = argparse.Namespace(factoryDebug = False, value = [1])
+    item = PoolFactory.makeItem("pooleditem", args)
+    self.assertFalse(PoolFactory.releaseItem(item))
+    self.assertIsNot(PoolFactory.makeItem("pooleditem", args), item)
+
+  ####################################################################
+  # Items which are not poolable are not retained.
+  def test_notPoolable(self):
+    item = PoolFactory.makeItem("unpooleditem")
+    self.assertFalse(PoolFactory.releaseItem(item))
+    self.assertIsNot(PoolFactory.makeItem("unpooleditem"), item)
+
+  ####################################################################
+  # The pool retains no more than its maximum.
+  def test_maximum(self):
+    pool = factory.FactoryPool(maximum = 2)
+    items = [PooledItem(None) for _ in range(3)]
+    for item in items:
+      pool.register(item, PooledItem, None)
+    self.assertEqual([pool.release(x) for x in items], [True, True, False])
+    self.assertEqual(pool.idleCount(PooledItem), 2)
+
+  ####################################################################
+  # Idle items are evicted.
+  def test_idleEviction(self):
+    pool = factory.FactoryPool(idleTimeout = 0.01)
+    item = PooledItem(None)
+    pool.register(item, PooledItem, None)
+    pool.release(item)
+    time.sleep(0.05)
+    self.assertIsNone(pool.acquire(PooledItem, None))
+
+  ####################################################################
+  # Idle items of keys no longer requested are evicted by requests for
+  # others.
+  def test_idleSweep(self):
+    pool = factory.FactoryPool(idleTimeout = 0.05)
+    for args in ("first", "second"):
+      item = PooledItem(None)
+      pool.register(item, PooledItem, args)
+      pool.release(item)
+    self.assertEqual(pool.idleCount(), 2)
+    time.sleep(0.1)
+    self.assertIsNone(pool.acquire(PooledItem, "third"))
+    self.assertEqual(pool.idleCount(), 0)
+    self.assertEqual(pool.idleCount(), 0)
+
+  ####################################################################
+  # Instantiations are traced, including whether the pool provided the item.
+  def test_traced(self):
+    exporter = instrument.InMemoryExporter()
+    previous = instrument.Tracer.setHook(exporter)
+    try:
+      args = argparse.Namespace(factoryDebug = False, value = 1)
+      PoolFactory.releaseItem(PoolFactory.makeItem("pooleditem", args))
+      PoolFactory.makeItem("pooleditem", args)
+      PoolFactory.defaults(["pool", "size"])
+    finally:
+      instrument.Tracer.setHook(previous)
+
+    spans = exporter.spans("factory.makeItem")
+    self.assertEqual([x.attributes for x in spans],
+                     [{"factory.class" : "PoolFactory",
+                       "factory.item" : "pooleditem",
+                       "factory.pool-hit" : hit} for hit in (False, True)])
+    (lookup,) = exporter.spans("defaults.lookup")
+    self.assertEqual(lookup.attributes["defaults.path"], "pool/size")
+
+#############################################################################
+#############################################################################
+class Test_FactoryMakeItems(unittest.TestCase):
+
+  ####################################################################
+  # Results are in specification order with exceptions collected.
+  def test_orderAndExceptions(self):
+    specifications = [("pooleditem",), ("non-existent-item", None),
+                      ("unpooleditem", None, None)] * 4
+    results = PoolFactory.makeItems(specifications, workers = 4)
+    self.assertEqual(len(results), len(specifications))
+    for (spec, (item, ex)) in zip(specifications, results):
+      if spec[0] == "non-existent-item":
+        self.assertIsNone(item)
+        self.assertTrue(isinstance(ex, ValueError))
+      else:
+        self.assertIsNone(ex)
+        self.assertIn(spec[0], item.names())
+
+  ####################################################################
+  # Items can be instantiated in worker processes.
+  def test_processes(self):
+    results = PoolFactory.makeItems([("pooleditem",), ("unpooleditem",)],
+                                    workers = 2, processes = True)
+    self.assertTrue(isinstance(results[0][0], PooledItem))
+    self.assertTrue(isinstance(results[1][0], UnpooledItem))
+
+#############################################################################
+#############################################################################
+class Test_FactoryInitialization(unittest.TestCase):
+
+  ####################################################################
+  # Stress first use from many threads at once; the discovery of the items
+  # must be performed exactly once and all threads must see all items.
+  def test_singleFlightMapping(self):
+    threadCount = 32
+    itemCount = 16
+    for _ in range(10):
+      walks = []
+
+      class Root(factory.Factory):
+        @classmethod
+        def available(cls):
+          walks.append(cls)
+          # Yield to widen any window for concurrent discovery.
+          time.sleep(0)
+          return cls._available
+
+      items = [type("Item{0}".format(index), (Root,), {"_available" : True})
+                for index in range(itemCount)]
+
+      barrier = threading.Barrier(threadCount)
+      choices = []
+      def worker():
+        barrier.wait()
+        choices.append(len(Root.choices()))
+        Root.makeItem("item0")
+
+      threads = [threading.Thread(target = worker)
+                  for _ in range(threadCount)]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+
+      self.assertEqual(len(walks), len(items) + 1)
+      self.assertEqual(choices, [len(items)] * threadCount)
+
+  ####################################################################
+  # The argument parser is constructed once and reused until an item is
+  # added to the hierarchy.
+  def test_argumentParserCached(self):
+    class Root(factory.Factory):
+      pass
+
+    class First(Root):
+      _available = True
+
+    parser = Root._argumentParser()
+    self.assertIs(Root._argumentParser(), parser)
+    self.assertEqual(Root.choices(), ["first"])
+
+    class Second(Root):
+      _available = True
+
+    self.assertIsNot(Root._argumentParser(), parser)
+    self.assertEqual(Root.choices(), ["first", "second"])
+    args = Root._argumentParser().parse_args(["second"])
+    self.assertTrue(isinstance(Root.makeItem(args = args), Second))
+
+  ####################################################################
+  # An item defined while the items are being discovered invalidates the
+  # discovered mapping.
+  def test_definedDuringDiscovery(self):
+    class Root(factory.Factory):
+      pass
+
+    class First(Root):
+      _available = True
+
+      @classmethod
+      def available(cls):
+        if not hasattr(Root, "late"):
+          Root.late = type("Late", (Root,), {"_available" : True})
+        return cls._available
+
+    Root.choices()
+    self.assertEqual(sorted(Root.choices()), ["first", "late"])
+
+  ####################################################################
+  # The default logging configuration, honoring PYTHON_FACTORY_DEBUG, is
+  # established upon first use of a factory without a FactoryShell.
+  def test_logging(self):
+    script = ("import logging; from mill.factory import test\n"
+              "level = logging.getLogger().level\n"
+              "test.PoolFactory.choices()\n"
+              "print(level, logging.getLogger().level)\n")
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+                                              os.path.abspath(__file__))))
+    for (debug, expected) in (("0", "30 20"), ("1", "30 10")):
+      environment = dict(os.environ, PYTHON_FACTORY_DEBUG = debug,
+                         PYTHONPATH = root)
+      output = subprocess.check_output([sys.executable, "-c", script],
+                                       env = environment,
+                                       universal_newlines = True)
+      self.assertEqual(output.split(), expected.split())
+
+#############################################################################
+#############################################################################
+class Test_FactoryScaling(unittest.TestCase):
+
+  ####################################################################
+  # Returns the root of a factory of the number of items, each with an
+  # alias, and the list of the items; __subclasses__() does not keep the
+  # items alive.
+  def makeHierarchy(self, count):
+    class Root(factory.Factory):
+      pass
+    items = [type("Item{0}".format(index), (Root,),
+                  {"_available" : True,
+                   "_name" : ["item{0}".format(index),
+                              "alias{0}".format(index)]})
+              for index in range(count)]
+    return (Root, items)
+
+  ####################################################################
+  # Discovery of a hierarchy deeper than the remaining recursion limit.
+  def test_deep(self):
+    class Root(factory.Factory):
+      pass
+    klass = Root
+    for index in range(300):
+      klass = type("Deep{0}".format(index), (klass,), {"_available" : True})
+
+    depth = 0
+    frame = sys._getframe()
+    while frame is not None:
+      (depth, frame) = (depth + 1, frame.f_back)
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(depth + 100)
+    try:
+      self.assertEqual(len(Root.choices()), 300)
+    finally:
+      sys.setrecursionlimit(limit)
+
+  ####################################################################
+  # Names are unique; an item's names share one parser.
+  def test_names(self):
+    (root, items) = self.makeHierarchy(2)
+    parsers = root._argumentParser().itemParsers()
+    self.assertIs(parsers["item0"], parsers["alias0"])
+    self.assertEqual(root._argumentParser().parse_args(["alias1"]).selection,
+                     "alias1")
+    self.assertTrue(isinstance(root.makeItem("alias1"), items[1]))
+
+    class Duplicate(root):
+      _available = True
+      _name = "item0"
+
+    with self.assertRaises(ValueError):
+      root.choices()
+
+  ####################################################################
+  # An item inheriting its names from another supersedes it.
+  def test_inheritedNames(self):
+    class Root(factory.Factory):
+      pass
+
+    class Foo(Root):
+      _available = True
+      _name = "foo"
+
+    class FooSpecialized(Foo):
+      pass
+
+    self.assertEqual(list(Root.choices()), ["foo"])
+    self.assertTrue(isinstance(Root.makeItem("foo"), FooSpecialized))
+
+  ####################################################################
+  # Items inheriting a name from a common, unavailable, base are
+  # duplicates.
+  def test_inheritedDuplicate(self):
+    class Root(factory.Factory):
+      pass
+
+    class Base(Root):
+      _name = "base"
+
+    class First(Base):
+      _available = True
+
+    class Second(Base):
+      _available = True
+
+    with self.assertRaises(ValueError):
+      Root.choices()
+
+  ####################################################################
+  # Names are in their declared order, the first being the primary name.
+  def test_nameOrder(self):
+    class Root(factory.Factory):
+      pass
+
+    class Item(Root):
+      _available = True
+      _name = ["zulu", "alpha", "mike", "alpha"]
+
+    self.assertEqual(Item.names(), ["zulu", "alpha", "mike"])
+    self.assertEqual(Item.name(), "zulu")
+    parsers = Root._argumentParser().itemParsers()
+    self.assertTrue(parsers["alpha"].prog.endswith(" zulu"))
+
+#############################################################################
+#############################################################################
+class Test_FactoryCompletion(unittest.TestCase):
+
+  ####################################################################
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.index = factory.FactoryCompletionIndex(
+                  PoolFactory, os.path.join(self.directory.name, "index.json"))
+
+  ####################################################################
+  def tearDown(self):
+    self.directory.cleanup()
+
+  ####################################################################
+  # The index is only regenerated when the hierarchy changes.
+  def test_update(self):
+    self.assertTrue(self.index.update())
+    self.assertFalse(self.index.update())
+
+    # Simulate a change to a source file.
+    with open(self.index.path) as f:
+      content = json.load(f)
+    content["sources"][0][1] += 1
+    with open(self.index.path, "w") as f:
+      json.dump(content, f)
+    self.assertTrue(self.index.update())
+
+  ####################################################################
+  # An index missing any of its keys, as from truncation or an older format,
+  # is stale; it answers nothing and is rebuilt.
+  def test_incomplete(self):
+    self.index.update()
+    with open(self.index.path) as f:
+      content = json.load(f)
+
+    for key in ("sources", "items", "options"):
+      incomplete = dict(content)
+      del incomplete[key]
+      with open(self.index.path, "w") as f:
+        json.dump(incomplete, f)
+      self.assertIsNone(factory.completion.load(self.index.path))
+      self.assertEqual(self.complete(1, ""), [])
+      self.assertTrue(self.index.update())
+
+    with open(self.index.path, "w") as f:
+      json.dump(["not", "an", "index"], f)
+    self.assertIsNone(factory.completion.load(self.index.path))
+    self.assertTrue(self.index.update())
+    self.assertEqual(self.complete(1, "p"), ["pooleditem"])
+
+  ####################################################################
+  # Completions are answered by the completion module without mill.
+  def test_complete(self):
+    self.index.update()
+    complete = self.complete
+
+    self.assertEqual(complete(1, "p"), ["pooleditem"])
+    self.assertEqual(complete(1, ""), ["pooleditem", "unpooleditem"])
+    self.assertEqual(complete(2, "pooleditem", "--d"), ["--debug"])
+    self.assertEqual(complete(1, "--"), ["--help"])
+    self.assertEqual(complete(2, "unpooleditem", ""), [])
+
+  ####################################################################
+  def complete(self, current, *words):
+    output = subprocess.check_output(
+              [sys.executable, "-S", "-E",
+               factory.completion.__file__, self.index.path, str(current),
+               "prog"] + list(words),
+              cwd = self.directory.name, universal_newlines = True)
+    return output.split()
+
+#############################################################################
+#############################################################################
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,198 @@
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+import atexit
+import os
+import sys
+import threading
+import time
+
+######################################################################
+######################################################################
+class _NullPhase(object):
+  """Phase used when timing is disabled; does nothing.
+  """
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __enter__(self):
+    return self
+
+  ####################################################################
+  def __exit__(self, exceptionType, exception, traceback):
+    return False
+
+######################################################################
+######################################################################
+class _Phase(object):
+  """Phase used when timing is enabled; accumulates its elapsed time.
+  """
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, name):
+    super(_Phase, self).__init__()
+    self.__name = name
+    self.__start = None
+
+  ####################################################################
+  def __enter__(self):
+    self.__start = time.perf_counter()
+    return self
+
+  ####################################################################
+  def __exit__(self, exceptionType, exception, traceback):
+    PhaseTimer._record(self.__name, time.perf_counter() - self.__start)
+    return False
+
+######################################################################
+######################################################################
+class PhaseTimer(object):
+  """Process-wide timers for the phases of program startup.
+
+  Timing is enabled by setting the environment variable PYTHON_MILL_PROFILE
+  to either 'table' or 'json', selecting the format of the report written
+  at exit.  The report is written to stderr unless PYTHON_MILL_PROFILE_FILE
+  specifies a file.  It may also be enabled programmatically via enable(),
+  as a command's --phase-times option does; phases preceding enable() are
+  not timed.
+
+  When disabled, phase() returns a shared do-nothing context manager and
+  count() returns immediately.
+  """
+  __enabled = False
+  __format = None
+  __path = None
+  __started = None
+  __phases = {}
+  __counts = {}
+  __lock = threading.Lock()
+  __nullPhase = _NullPhase()
+  __registered = False
+
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @classmethod
+  def count(cls, name, increment = 1):
+    """Increments the named counter.
+    """
+    if not cls.__enabled:
+      return
+    with cls.__lock:
+      cls.__counts[name] = cls.__counts.get(name, 0) + increment
+
+  ####################################################################
+  @classmethod
+  def disable(cls):
+    cls.__enabled = False
+
+  ####################################################################
+  @classmethod
+  def enable(cls, format = "table", path = None):
+    """Enables timing with the report written at exit in the specified
+    format ('table' or 'json') to the specified path (None being stderr).
+    """
+    if format not in ("json", "table"):
+      raise ValueError("unknown profile format: {0}".format(format))
+    with cls.__lock:
+      cls.__format = format
+      cls.__path = path
+      if cls.__started is None:
+        cls.__started = time.perf_counter()
+      if not cls.__registered:
+        atexit.register(cls._writeReport)
+        cls.__registered = True
+      cls.__enabled = True
+
+  ####################################################################
+  @classmethod
+  def enabled(cls):
+    return cls.__enabled
+
+  ####################################################################
+  @classmethod
+  def phase(cls, name):
+    """Returns a context manager timing the named phase.
+    """
+    if not cls.__enabled:
+      return cls.__nullPhase
+    return _Phase(name)
+
+  ####################################################################
+  @classmethod
+  def report(cls):
+    """Returns a dictionary of the timed phases and the counters.
+    """
+    with cls.__lock:
+      return {
+        "elapsed-seconds" : (0.0 if cls.__started is None
+                                 else time.perf_counter() - cls.__started),
+        "phases" : dict([(name, { "calls" : calls, "seconds" : seconds })
+                          for (name, (calls, seconds))
+                            in cls.__phases.items()]),
+        "counts" : dict(cls.__counts)
+      }
+
+  ####################################################################
+  @classmethod
+  def reset(cls):
+    with cls.__lock:
+      cls.__phases.clear()
+      cls.__counts.clear()
+      cls.__started = None if not cls.__enabled else time.perf_counter()
+
+  ####################################################################
+  # Protected methods
+  ####################################################################
+  @classmethod
+  def _format(cls, report, format):
+    if format == "json":
+      import json
+      return json.dumps(report, indent = 2, sort_keys = True)
+
+    lines = ["{0:<40} {1:>8} {2:>12}".format("phase", "calls", "seconds")]
+    for name in sorted(report["phases"]):
+      phase = report["phases"][name]
+      lines.append("{0:<40} {1:>8} {2:>12.6f}".format(name,
+                                                      phase["calls"],
+                                                      phase["seconds"]))
+    lines.append("")
+    lines.append("{0:<40} {1:>8}".format("count", "value"))
+    for name in sorted(report["counts"]):
+      lines.append("{0:<40} {1:>8}".format(name, report["counts"][name]))
+    lines.append("")
+    lines.append("{0:<40} {1:>21.6f}".format("elapsed seconds",
+                                             report["elapsed-seconds"]))
+    return os.linesep.join(lines)
+
+  ####################################################################
+  @classmethod
+  def _record(cls, name, seconds):
+    with cls.__lock:
+      (calls, total) = cls.__phases.get(name, (0, 0.0))
+      cls.__phases[name] = (calls + 1, total + seconds)
+
+  ####################################################################
+  @classmethod
+  def _writeReport(cls):
+    if not cls.__enabled:
+      return
+    text = cls._format(cls.report(), cls.__format)
+    if cls.__path is None:
+      print(text, file = sys.stderr)
+    else:
+      with open(cls.__path, "w") as f:
+        print(text, file = f)
+
+######################################################################
+######################################################################
+# Enable from the environment at the earliest opportunity, that being the
+# import of this module, so that the import of the remainder of the package
+# is also timed.
+if os.getenv("PYTHON_MILL_PROFILE", "") not in ("", "0"):
+  PhaseTimer.enable("json" if os.getenv("PYTHON_MILL_PROFILE") == "json"
+                           else "table",
+                    os.getenv("PYTHON_MILL_PROFILE_FILE"))
@@ -0,0 +1,263 @@
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+import contextvars
+import itertools
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# The span of the current context (thread or asyncio task); None if none.
+_currentSpan = contextvars.ContextVar("traceSpan", default = None)
+
+# Source of span identifiers, unique within the process.
+_identifiers = itertools.count(1)
+
+######################################################################
+######################################################################
+class _NullSpan(object):
+  """Span used when no hook is set; does nothing.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  def setAttribute(self, name, value):
+    pass
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __enter__(self):
+    return self
+
+  ####################################################################
+  def __exit__(self, exceptionType, exception, traceback):
+    return False
+
+######################################################################
+######################################################################
+class Span(object):
+  """A traced operation: its name, its attributes (a dictionary of names
+  to values), the span within which it began ('parent'; None for the root
+  of a trace), its start as a wall-clock time in nanoseconds, its duration
+  in seconds and the exception, if any, which ended it.
+
+  The duration is None until the span ends.  Attributes may be set until
+  then.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @property
+  def attributes(self):
+    return self.__attributes
+
+  ####################################################################
+  @property
+  def duration(self):
+    return self.__duration
+
+  ####################################################################
+  @property
+  def exception(self):
+    return self.__exception
+
+  ####################################################################
+  @property
+  def identifier(self):
+    return self.__identifier
+
+  ####################################################################
+  @property
+  def name(self):
+    return self.__name
+
+  ####################################################################
+  @property
+  def parent(self):
+    return self.__parent
+
+  ####################################################################
+  @property
+  def startTime(self):
+    return self.__startTime
+
+  ####################################################################
+  @property
+  def traceIdentifier(self):
+    """The identifier of the root span of the trace.
+    """
+    return self.__traceIdentifier
+
+  ####################################################################
+  def setAttribute(self, name, value):
+    self.__attributes[name] = value
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self, hook, name, attributes = None):
+    super(Span, self).__init__()
+    self.__hook = hook
+    self.__name = name
+    self.__attributes = {} if attributes is None else dict(attributes)
+    self.__identifier = next(_identifiers)
+    self.__parent = None
+    self.__traceIdentifier = self.__identifier
+    self.__startTime = None
+    self.__duration = None
+    self.__exception = None
+    self.__start = None
+    self.__token = None
+
+  ####################################################################
+  def __enter__(self):
+    self.__parent = _currentSpan.get()
+    if self.__parent is not None:
+      self.__traceIdentifier = self.__parent.traceIdentifier
+    self.__token = _currentSpan.set(self)
+    self.__startTime = time.time_ns()
+    self.__start = time.perf_counter()
+    Tracer._notify(self.__hook.spanStarted, self)
+    return self
+
+  ####################################################################
+  def __exit__(self, exceptionType, exception, traceback):
+    self.__duration = time.perf_counter() - self.__start
+    self.__exception = exception
+    _currentSpan.reset(self.__token)
+    self.__token = None
+    Tracer._notify(self.__hook.spanEnded, self)
+    return False
+
+  ####################################################################
+  def __repr__(self):
+    return "{0}({1}, {2})".format(type(self).__name__, self.name,
+                                  self.attributes)
+
+######################################################################
+######################################################################
+class TracerHook(object):
+  """Interface of the recipients of spans, e.g., an adapter to a
+  distributed tracing system; the methods are invoked in the context of the
+  span, upon its start and end.  Exceptions they raise are logged and
+  otherwise ignored.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  def spanEnded(self, span):
+    pass
+
+  ####################################################################
+  def spanStarted(self, span):
+    pass
+
+######################################################################
+######################################################################
+class InMemoryExporter(TracerHook):
+  """Hook retaining the spans which have ended, in order of their ending;
+  intended for tests.
+  """
+  ####################################################################
+  # Public methods
+  ####################################################################
+  def clear(self):
+    with self.__lock:
+      self.__spans = []
+
+  ####################################################################
+  def spans(self, name = None):
+    """Returns the list of the ended spans, those of the specified name if
+    not None.
+    """
+    with self.__lock:
+      return [x for x in self.__spans if (name is None) or (x.name == name)]
+
+  ####################################################################
+  def spanEnded(self, span):
+    with self.__lock:
+      self.__spans.append(span)
+
+  ####################################################################
+  # Overridden methods
+  ####################################################################
+  def __init__(self):
+    super(InMemoryExporter, self).__init__()
+    self.__spans = []
+    self.__lock = threading.Lock()
+
+######################################################################
+######################################################################
+class Tracer(object):
+  """Process-wide source of spans, delivered to the hook set via setHook().
+
+  When no hook is set, span() returns a shared do-nothing context manager,
+  nullSpan().  Frequent operations may test enabled() and use nullSpan()
+  directly, avoiding the cost of the span's attributes and context.
+  Spans nest per context (thread or asyncio task): the span within which
+  another begins is its parent.
+  """
+  __hook = None
+  __nullSpan = _NullSpan()
+
+  ####################################################################
+  # Public methods
+  ####################################################################
+  @classmethod
+  def currentSpan(cls):
+    """Returns the span of the current context; None if none.
+    """
+    return _currentSpan.get()
+
+  ####################################################################
+  @classmethod
+  def enabled(cls):
+    return cls.__hook is not None
+
+  ####################################################################
+  @classmethod
+  def hook(cls):
+    return cls.__hook
+
+  ####################################################################
+  @classmethod
+  def nullSpan(cls):
+    """Returns the shared do-nothing span; for frequent operations which
+    bypass span() when tracing is disabled.
+    """
+    return cls.__nullSpan
+
+  ####################################################################
+  @classmethod
+  def setHook(cls, hook):
+    """Sets the hook, None disabling tracing, returning the previous hook.
+    """
+    previous = cls.__hook
+    cls.__hook = hook
+    return previous
+
+  ####################################################################
+  @classmethod
+  def span(cls, name, attributes = None):
+    """Returns a context manager, yielding the span, tracing the named
+    operation with the specified attributes.
+    """
+    hook = cls.__hook
+    if hook is None:
+      return cls.__nullSpan
+    return Span(hook, name, attributes)
+
+  ####################################################################
+  # Protected methods
+  ####################################################################
+  @classmethod
+  def _notify(cls, method, span):
+    try:
+      method(span)
+    except Exception:
+      log.exception("exception in tracer hook for span {0}".format(span.name))
@@ -0,0 +1,7 @@
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+from .PhaseTimer import PhaseTimer
+from .Tracer import InMemoryExporter, Span, Tracer, TracerHook
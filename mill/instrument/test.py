@@ -0,0 +1,145 @@
+#! /usr/bin/env python
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Copyright Red Hat
+#
+
+import json
+import threading
+import unittest
+
+from mill import instrument
+
+#############################################################################
+#############################################################################
+class Test_PhaseTimer(unittest.TestCase):
+
+  ####################################################################
+  def setUp(self):
+    self.wasEnabled = instrument.PhaseTimer.enabled()
+    instrument.PhaseTimer.disable()
+    instrument.PhaseTimer.reset()
+
+  ####################################################################
+  def tearDown(self):
+    instrument.PhaseTimer.reset()
+    if not self.wasEnabled:
+      instrument.PhaseTimer.disable()
+
+  ####################################################################
+  # Nothing is recorded when disabled.
+  def test_disabled(self):
+    with instrument.PhaseTimer.phase("phase"):
+      pass
+    instrument.PhaseTimer.count("count")
+    report = instrument.PhaseTimer.report()
+    self.assertEqual(report["phases"], {})
+    self.assertEqual(report["counts"], {})
+
+  ####################################################################
+  # Phases and counts accumulate when enabled.
+  def test_enabled(self):
+    instrument.PhaseTimer.enable("json")
+    for _ in range(3):
+      with instrument.PhaseTimer.phase("phase"):
+        pass
+    instrument.PhaseTimer.count("count", 2)
+    instrument.PhaseTimer.count("count")
+
+    report = instrument.PhaseTimer.report()
+    self.assertEqual(report["phases"]["phase"]["calls"], 3)
+    self.assertEqual(report["counts"]["count"], 3)
+
+    formatted = instrument.PhaseTimer._format(report, "json")
+    self.assertEqual(json.loads(formatted)["counts"], {"count" : 3})
+    self.assertIn("phase", instrument.PhaseTimer._format(report, "table"))
+
+  ####################################################################
+  # Unknown formats are rejected.
+  def test_unknownFormat(self):
+    with self.assertRaises(ValueError):
+      instrument.PhaseTimer.enable("xml")
+
+#############################################################################
+#############################################################################
+class FailingHook(instrument.TracerHook):
+  ####################################################################
+  def spanStarted(self, span):
+    raise RuntimeError("hook failure")
+
+#############################################################################
+#############################################################################
+class Test_Tracer(unittest.TestCase):
+
+  ####################################################################
+  def setUp(self):
+    self.exporter = instrument.InMemoryExporter()
+    self.previous = instrument.Tracer.setHook(self.exporter)
+
+  ####################################################################
+  def tearDown(self):
+    instrument.Tracer.setHook(self.previous)
+
+  ####################################################################
+  # Without a hook spans are a shared do-nothing.
+  def test_disabled(self):
+    instrument.Tracer.setHook(None)
+    self.assertFalse(instrument.Tracer.enabled())
+    with instrument.Tracer.span("outer", {"a" : 1}) as span:
+      span.setAttribute("b", 2)
+      self.assertIs(instrument.Tracer.span("inner"), span)
+      self.assertIsNone(instrument.Tracer.currentSpan())
+    self.assertEqual(self.exporter.spans(), [])
+
+  ####################################################################
+  # Spans nest, carry their attributes and record the exception ending them.
+  def test_spans(self):
+    with instrument.Tracer.span("outer", {"a" : 1}) as outer:
+      self.assertIs(instrument.Tracer.currentSpan(), outer)
+      with self.assertRaises(ValueError):
+        with instrument.Tracer.span("inner") as inner:
+          inner.setAttribute("b", 2)
+          raise ValueError("inner")
+    self.assertIsNone(instrument.Tracer.currentSpan())
+
+    self.assertEqual(self.exporter.spans(), [inner, outer])
+    self.assertEqual(self.exporter.spans("outer"), [outer])
+    self.assertIsNone(outer.parent)
+    self.assertIs(inner.parent, outer)
+    self.assertEqual(inner.traceIdentifier, outer.identifier)
+    self.assertEqual(outer.attributes, {"a" : 1})
+    self.assertEqual(inner.attributes, {"b" : 2})
+    self.assertTrue(isinstance(inner.exception, ValueError))
+    self.assertIsNone(outer.exception)
+    self.assertGreaterEqual(outer.duration, inner.duration)
+
+    self.exporter.clear()
+    self.assertEqual(self.exporter.spans(), [])
+
+  ####################################################################
+  # Spans of other threads are not parents.
+  def test_threads(self):
+    def traced():
+      with instrument.Tracer.span("thread"):
+        pass
+
+    with instrument.Tracer.span("outer"):
+      thread = threading.Thread(target = traced)
+      thread.start()
+      thread.join()
+    self.assertIsNone(self.exporter.spans("thread")[0].parent)
+
+  ####################################################################
+  # Exceptions raised by the hook do not affect the traced operation.
+  def test_hookException(self):
+    instrument.Tracer.setHook(FailingHook())
+    with self.assertLogs("mill.instrument.Tracer", "ERROR"):
+      with instrument.Tracer.span("span") as span:
+        pass
+    self.assertIsNotNone(span.duration)
+
+#############################################################################
+#############################################################################
+if __name__ == "__main__":
+  unittest.main()
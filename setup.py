@@ -13,7 +13,8 @@ package_name = "utility-mill"
 # Subdirectory containg packages.
 package_subdir = "mill"
 
-subpackages = [{"name": "data", "entry": None},
+subpackages = [{"name": "instrument", "entry": None},
+               {"name": "data", "entry": None},
                {"name": "defaults", "entry": None},
                {"name": "factory", "entry": None},
                {"name": "command", "entry": None}]
@@ -67,6 +68,11 @@ console_scripts = ["{0} = {1}.{2}:{3}".format(versioned(subpackage["entry"]),
                     for subpackage in subpackages
                       if subpackage["entry"] is not None]
 
+# The factory completion module answers completion requests without importing
+# the factory; it is also installed as a script.
+console_scripts.append("{0} = {1}.factory.completion:main".format(
+                        versioned("mill-completion"), package_subdir))
+
 setup = functools.partial(
           setuptools.setup,
           name = python_prefixed(package_name),